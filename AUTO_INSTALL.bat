@@ -39,7 +39,7 @@ echo Starting ngrok (port 800)...
 start "POW ngrok" cmd /k "cd /d %~dp0 && start_ngrok.bat"
 
 echo Starting POW Reminder App (port 800)...
-start "POW App" cmd /k "cd /d %~dp0backend && .venv\Scripts\activate && uvicorn main:app --host 0.0.0.0 --port 800"
+start "POW App" cmd /k "cd /d %~dp0backend && .venv\Scripts\activate && python serve.py --host 0.0.0.0 --port 800"
 
 echo.
 echo Ready. Open http://localhost:800
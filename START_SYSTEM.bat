@@ -21,7 +21,7 @@ timeout /t 10
 echo.
 echo STEP 2: Starting main application...
 echo ----------------------------------------
-start "POW Reminder App" cmd /k "cd backend && .venv\Scripts\activate && uvicorn main:app --host 0.0.0.0 --port 800"
+start "POW Reminder App" cmd /k "cd backend && .venv\Scripts\activate && python serve.py --host 0.0.0.0 --port 800"
 
 echo.
 echo ============================================
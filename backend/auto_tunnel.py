@@ -9,39 +9,44 @@ class TunnelManager:
     def __init__(self):
         self.url = None
         self.process = None
+        self._done = threading.Event()
         
     def start_tunnel(self):
         """Start localhost.run tunnel in background"""
         print("Starting localhost.run tunnel...")
         
         def run_tunnel():
-            self.process = subprocess.Popen(
-                ['ssh', '-o', 'StrictHostKeyChecking=no', '-R', '80:localhost:800', 'nokey@localhost.run'],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True,
-                bufsize=1
-            )
-            
-            for line in self.process.stdout:
-                print(f"[Tunnel] {line.strip()}")
+            try:
+                self.process = subprocess.Popen(
+                    ['ssh', '-o', 'StrictHostKeyChecking=no', '-R', '80:localhost:800', 'nokey@localhost.run'],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    universal_newlines=True,
+                    bufsize=1
+                )
                 
-                # Look for the URL
-                match = re.search(r'https://[a-z0-9-]+\.localhost\.run', line)
-                if match and not self.url:
-                    self.url = match.group(0)
-                    print(f"\n✓ Tunnel established: {self.url}\n")
-                    self.update_env_file()
+                for line in self.process.stdout:
+                    print(f"[Tunnel] {line.strip()}")
+                    
+                    # Look for the URL; localhost.run may hand out a new one when it reconnects
+                    match = re.search(r'https://[a-z0-9-]+\.localhost\.run', line)
+                    if match and match.group(0) != self.url:
+                        self.url = match.group(0)
+                        print(f"\n✓ Tunnel established: {self.url}\n")
+                        self.publish()
+                        self.update_env_file()
+                        self._done.set()
+            finally:
+                # No URL is coming once ssh exits (or never started)
+                self._done.set()
         
         # Start tunnel in background thread
         tunnel_thread = threading.Thread(target=run_tunnel)
         tunnel_thread.daemon = True
         tunnel_thread.start()
         
-        # Wait for URL to be detected
-        timeout = time.time() + 30
-        while not self.url and time.time() < timeout:
-            time.sleep(1)
+        # Wait for URL to be detected, the ssh process to exit, or stop_tunnel()
+        self._done.wait(30)
         
         if not self.url:
             print("ERROR: Could not establish tunnel")
@@ -74,8 +79,17 @@ class TunnelManager:
         
         print(f"✓ Updated BASE_URL to: {self.url}")
     
+    def publish(self):
+        """Point the running app's BASE_URL at the tunnel; calls already placed finish on the old one"""
+        try:
+            from settings import settings
+            settings.override("tunnel", BASE_URL=self.url)
+        except Exception as e:
+            print(f"Could not apply tunnel URL to running settings: {e}")
+    
     def stop_tunnel(self):
         """Stop the tunnel"""
+        self._done.set()
         if self.process:
             self.process.terminate()
             print("Tunnel stopped")
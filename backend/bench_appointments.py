@@ -0,0 +1,134 @@
+"""Appointment list benchmark: memory per appointment and /api/appointments serialization at 10k.
+
+Memory compares Appointment (slots, shared strings interned) with the same
+fields in a per-instance __dict__, as the class used to keep them.
+Serialization times building to_dict() for every appointment (the old
+route's first step) and json.dumps over those dicts, against
+to_json()/appointments_json(), both cold (every appointment just changed)
+and warm (cached encodings). End to end, it times GET /api/appointments
+against a route returning the old List[Dict] through FastAPI's response
+model, with and without gzip.
+
+    python bench_appointments.py [--count 10000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+import tracemalloc
+from typing import Dict, List
+
+os.environ.setdefault("TWILIO_VALIDATE_SIGNATURES", "false")
+
+from fastapi.testclient import TestClient
+
+from models import Appointment, AppointmentStatus, appointment_store, appointments_json
+from utils import fast_json
+
+PROVIDERS = ("Dr. Prisk", "Dr. Alvarez", "Dr. Chen", "PA Morgan")
+TYPES = ("Follow-up", "New Patient", "Post-Op", "Injection")
+
+
+def make_appointments(count: int) -> List[Appointment]:
+    appointments = []
+    for i in range(count):
+        # Fresh string objects per row, as the PDF parser produces them
+        apt = Appointment(
+            patient_name=f"Patient{i} Test", phone=f"(412) 555-{i % 10000:04d}",
+            appointment_time=f"{9 + i % 8}:{(i * 15) % 60:02d} AM", provider="".join(PROVIDERS[i % 4]),
+            appointment_type="".join(TYPES[i % 4]), confirmation_status="".join("Not Confirmed"),
+        )
+        apt.appointment_date = "".join("Monday, August, 11, 2025")
+        appointments.append(apt)
+    return appointments
+
+
+class DictAppointment:
+    """The same fields in a per-instance __dict__, without interning."""
+
+    def __init__(self, apt: Appointment) -> None:
+        for name in Appointment.FIELDS:
+            value = getattr(apt, name)
+            setattr(self, name, "".join(value) if isinstance(value, str) and name != "status" else value)
+
+
+def measure_memory(build, count: int) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return (after - before) / count
+
+
+def best(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def stdlib_path(appointments: List[Appointment]) -> bytes:
+    return json.dumps([apt.to_dict() for apt in appointments], separators=(",", ":"), default=str).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    n = args.count
+
+    appointments = make_appointments(n)
+    slots = measure_memory(lambda: make_appointments(n), n)
+    dicts = measure_memory(lambda: [DictAppointment(apt) for apt in appointments], n)
+    print(f"memory/appointment   __dict__ {dicts:6.0f} B   slots+interned {slots:6.0f} B  ({dicts / slots:.1f}x smaller)")
+
+    assert json.loads(stdlib_path(appointments)) == json.loads(appointments_json(appointments))
+    dicts_only = best(lambda: [apt.to_dict() for apt in appointments], args.repeat)
+    stdlib = best(lambda: stdlib_path(appointments), args.repeat)
+
+    def cold():
+        for apt in appointments:
+            apt.call_attempts = apt.call_attempts  # any assignment retires the cached encoding
+        return appointments_json(appointments)
+
+    cold_time = best(cold, args.repeat)
+    warm = best(lambda: appointments_json(appointments), args.repeat)
+    encoder = "orjson" if fast_json.orjson is not None else "json (orjson not installed)"
+    print(f"serialize {n} ({encoder})")
+    print(f"  to_dict only                            {dicts_only * 1000:8.1f} ms  {n / dicts_only:10.0f} appointments/s")
+    print(f"  to_dict + json.dumps                    {stdlib * 1000:8.1f} ms  {n / stdlib:10.0f} appointments/s")
+    print(f"  to_json, every appointment changed      {cold_time * 1000:8.1f} ms  {n / cold_time:10.0f} appointments/s")
+    print(f"  to_json, cached                         {warm * 1000:8.1f} ms  {n / warm:10.0f} appointments/s")
+
+    import main as app_main
+
+    @app_main.app.get("/bench/legacy-appointments")
+    async def legacy_appointments() -> List[Dict]:
+        return [apt.to_dict() for apt in appointment_store.get_all_appointments()]
+
+    appointment_store.clear_all()
+    for apt in appointments:
+        appointment_store.add_appointment(apt)
+    appointments[0].status = AppointmentStatus.CONFIRMED
+    client = TestClient(app_main.app)
+    print("GET, end to end (median)")
+    for label, path in (("old List[Dict] route", "/bench/legacy-appointments"), ("/api/appointments", "/api/appointments")):
+        for encoding in ("identity", "gzip"):
+            times, size = [], 0
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                response = client.get(path, headers={"Accept-Encoding": encoding})
+                times.append(time.perf_counter() - started)
+                size = int(response.headers.get("content-length") or len(response.content))
+            assert response.status_code == 200 and len(response.json()) == n
+            print(f"  {label:<22} {encoding:<8} {statistics.median(times) * 1000:8.1f} ms  {size / 1024:8.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Logging benchmark: what a log call costs the thread that makes it.
+
+Compares the old setup (logging.basicConfig: the caller formats and writes
+to the console itself) with utils/logging_setup.py (the caller only queues
+the record; a writer thread formats, redacts and writes). The console is a
+stand-in stream whose write takes --write-ms, as a busy terminal (or the
+Windows console) does. Also checks that phone numbers come out tokenized
+and that a per-row burst is cut down to LOG_RATE_LIMIT lines.
+
+    python bench_logging.py [--records 2000] [--write-ms 0.2] [--format text|json]
+"""
+import argparse
+import io
+import logging
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("LOG_RATE_LIMIT", "0")
+
+
+class SlowConsole(io.StringIO):
+    def __init__(self, write_seconds: float) -> None:
+        super().__init__()
+        self.write_seconds = write_seconds
+
+    def write(self, text: str) -> int:
+        time.sleep(self.write_seconds)
+        return super().write(text)
+
+
+def time_calls(logger: logging.Logger, records: int):
+    samples = []
+    for i in range(records):
+        started = time.perf_counter()
+        logger.info(f"Status webhook: CallSid=CA{i:032x}, Status=completed, To=+1412555{i % 10000:04d}")
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99)], sum(samples)
+
+
+def report(label: str, result) -> None:
+    median, p99, total = result
+    print(f"{label:<14} median {median * 1e6:8.1f} us  p99 {p99 * 1e6:8.1f} us  caller total {total * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--write-ms", type=float, default=0.2)
+    parser.add_argument("--format", choices=("text", "json"), default="text")
+    args = parser.parse_args()
+    os.environ["LOG_FORMAT"] = args.format
+
+    root = logging.getLogger()
+    console = SlowConsole(args.write_ms / 1000)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+                        stream=console)
+    report("basicConfig", time_calls(logging.getLogger("bench"), args.records))
+
+    from settings import settings
+    from utils import logging_setup
+
+    console = SlowConsole(args.write_ms / 1000)
+    sys.stderr, real_stderr = console, sys.stderr
+    root.handlers = []
+    try:
+        logging_setup.configure_logging()
+    finally:
+        sys.stderr = real_stderr
+    result = time_calls(logging.getLogger("bench"), args.records)
+    drain_started = time.perf_counter()
+    logging_setup.stop_logging()
+    report("queued", result)
+    print(f"{'':<14} writer thread caught up {(time.perf_counter() - drain_started) * 1000:.0f} ms after the last call")
+
+    lines = console.getvalue().splitlines()
+    assert len(lines) == args.records, f"{len(lines)} of {args.records} records written"
+    assert "+1412555" not in console.getvalue(), "a phone number was written in the clear"
+    print(f"redaction OK: {lines[0][-60:]}")
+
+    # A per-row burst from one call site, as the PDF parser used to log
+    type(settings).LOG_RATE_LIMIT = 50
+    root.handlers = []
+    logging_setup.configure_logging()
+    console = SlowConsole(0)
+    logging_setup._listeners[0].handlers[0].setStream(console)
+    for i in range(1000):
+        logging.getLogger("bench").info(f"Found unconfirmed appointment {i}")
+    logging_setup.stop_logging()
+    print(f"rate limit: 1000 records from one call site -> {len(console.getvalue().splitlines())} written")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Startup benchmark: time from launching the server until /healthz answers.
+
+Each scenario starts uvicorn in a scratch working directory and polls
+/healthz every 10 ms; the time to the first 200 is what a load balancer or
+process manager waits before the worker takes traffic. Scenarios:
+
+    default        nothing listening on ngrok's 4040 API, no tunnel
+    ngrok-stalled  something on 127.0.0.1:4040 accepts connections but never answers
+    auto-tunnel    AUTO_TUNNEL=true with an ssh that never prints a tunnel URL
+
+It also times `import main` on its own and reports whether pdfplumber and
+the Twilio REST client were loaded by it (both are deferred to first use).
+
+    python bench_startup.py [--runs 5] [--scenarios default,ngrok-stalled,auto-tunnel]
+"""
+import argparse
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = ("default", "ngrok-stalled", "auto-tunnel")
+IMPORT_PROBE = (
+    "import sys, time; started = time.perf_counter(); import main; "
+    "print(time.perf_counter() - started, 'pdfplumber' in sys.modules, 'twilio.rest' in sys.modules)"
+)
+
+
+def scratch_dir() -> str:
+    workdir = tempfile.mkdtemp(prefix="pow-startup-")
+    for name in ("static", "templates"):
+        os.symlink(os.path.join(BACKEND, name), os.path.join(workdir, name))
+    # An ssh that connects to nothing: the tunnel never reports a URL
+    os.mkdir(os.path.join(workdir, "bin"))
+    fake_ssh = os.path.join(workdir, "bin", "ssh")
+    with open(fake_ssh, "w") as f:
+        f.write("#!/bin/sh\nexec sleep 60\n")
+    os.chmod(fake_ssh, 0o755)
+    return workdir
+
+
+def server_env(workdir: str, scenario: str) -> dict:
+    env = dict(
+        os.environ,
+        PYTHONPATH=BACKEND,
+        TWILIO_ACCOUNT_SID="AC" + "0" * 32,
+        TWILIO_AUTH_TOKEN="bench-startup-token",
+        TWILIO_FROM_NUMBER="+14125550100",
+        BASE_URL="http://127.0.0.1:8000",
+        AUTO_TUNNEL="true" if scenario == "auto-tunnel" else "false",
+    )
+    env["PATH"] = os.path.join(workdir, "bin") + os.pathsep + env.get("PATH", "")
+    return env
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_healthy(scenario: str, timeout: float) -> float:
+    workdir = scratch_dir()
+    port = free_port()
+    log = open(os.path.join(workdir, "server.log"), "w")
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=workdir, env=server_env(workdir, scenario), stdout=log, stderr=subprocess.STDOUT,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                sys.exit(f"Server exited during startup; see {log.name}")
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=timeout).read()
+                return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        return float("inf")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        log.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def time_import(runs: int):
+    workdir = scratch_dir()
+    try:
+        samples = []
+        for _ in range(runs):
+            out = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=workdir, env=server_env(workdir, "default"),
+                                 capture_output=True, text=True, check=True).stdout.split()
+            samples.append((float(out[-3]), out[-2] == "True", out[-1] == "True"))
+        return samples
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--timeout", type=float, default=60.0, help="give up on a start after this many seconds")
+    args = parser.parse_args()
+
+    imports = time_import(args.runs)
+    seconds = [sample[0] for sample in imports]
+    print(f"import main        median {statistics.median(seconds) * 1000:7.0f} ms  "
+          f"(pdfplumber loaded: {imports[0][1]}, twilio.rest loaded: {imports[0][2]})")
+
+    for scenario in args.scenarios.split(","):
+        stall = None
+        if scenario == "ngrok-stalled":
+            stall = socket.socket()
+            try:
+                stall.bind(("127.0.0.1", 4040))
+            except OSError:
+                print(f"{scenario:<18} skipped: port 4040 is in use")
+                continue
+            stall.listen(16)  # connections queue in the backlog and are never answered
+        try:
+            times = [time_to_healthy(scenario, args.timeout) for _ in range(args.runs)]
+        finally:
+            if stall:
+                stall.close()
+        print(f"{scenario:<18} median {statistics.median(times) * 1000:7.0f} ms  "
+              f"min {min(times) * 1000:6.0f}  max {max(times) * 1000:6.0f}  (to first /healthz 200)")
+
+
+if __name__ == "__main__":
+    main()
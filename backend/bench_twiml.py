@@ -0,0 +1,81 @@
+"""Microbenchmark: IVR TwiML built with VoiceResponse vs precompiled templates.
+
+Checks that every script branch renders byte-for-byte the same both ways,
+then times building per request against template substitution and the
+per-appointment render cache.
+
+    python bench_twiml.py [iterations]
+"""
+import sys
+import timeit
+
+from models import Appointment
+from services.twiml_templates import (
+    TwimlTemplates, build_initial, build_inline, build_voicemail, build_gather_reply
+)
+
+
+def sample_appointments():
+    names = ["Jane Doe", "Ann O'Brien & Sons", "Bob <Bobby> Smith", "Cash $Money", ""]
+    appointments = []
+    for i, name in enumerate(names):
+        apt = Appointment(name or "x", "412555%04d" % i, "9:15 AM", "Dr. Prisk", "Follow-up")
+        apt.patient_name = name
+        apt.appointment_date = "Monday, August, 11, 2025" if i % 2 == 0 else None
+        appointments.append(apt)
+    return appointments
+
+
+def first_name(apt):
+    return apt.patient_name.split()[0] if apt.patient_name else "patient"
+
+
+def check_parity(templates, appointments):
+    for apt in appointments:
+        first, time = first_name(apt), apt.appointment_time
+        upcoming = apt.appointment_date or "your upcoming appointment"
+        pairs = [
+            (build_initial(first, upcoming, time, 1), templates.initial(apt, 1)),
+            (build_initial(first, upcoming, time, 2), templates.initial(apt, 2)),
+            (build_inline(first, apt.appointment_date or "your appointment", time), templates.inline(apt)),
+            (build_voicemail(upcoming, time), templates.voicemail(apt)),
+        ]
+        for built, rendered in pairs:
+            assert built == rendered, f"mismatch for {apt.patient_name!r}:\n{built}\n{rendered}"
+    for digits in (None, "1", "2", "3", "5", "9", "7"):
+        assert build_gather_reply(digits, "+14125550000") == templates.gather_reply(digits, "+14125550000"), digits
+    assert build_initial(None, "", "", 1) == templates.initial(None, 1)
+    assert build_voicemail(None, "") == templates.voicemail(None)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    appointments = sample_appointments()
+    apt = appointments[0]
+    templates = TwimlTemplates()
+
+    check_parity(templates, appointments)
+    print("parity: all branches match")
+
+    def build():
+        build_initial(first_name(apt), apt.appointment_date, apt.appointment_time, 1)
+
+    def render():
+        templates.clear()
+        templates.initial(apt, 1)
+
+    def cached():
+        templates.initial(apt, 1)
+
+    results = {}
+    for label, fn in (("VoiceResponse build", build), ("template render", render), ("cached render", cached)):
+        seconds = min(timeit.repeat(fn, number=iterations, repeat=3))
+        results[label] = seconds / iterations * 1e6
+    baseline = results["VoiceResponse build"]
+    print(f"{iterations} iterations, best of 3")
+    for label, micros in results.items():
+        print(f"  {label:<20} {micros:8.2f} us/call  ({baseline / micros:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
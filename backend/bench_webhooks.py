@@ -0,0 +1,339 @@
+"""Load test for the Twilio webhooks, with latency percentiles and a stored baseline.
+
+Starts the app in a subprocess (a scratch working directory, REST calls to
+Twilio pointed at a dead port) seeded with synthetic appointments that each
+have a call in progress, then drives /twilio/voice, /twilio/gather and
+/twilio/status with Twilio-shaped, signed form payloads at fixed request
+rates. The mix follows a real call: a few progress callbacks and one voice
+fetch per call, a keypress for most, then the final status.
+
+Requests are sent open-loop: each has a scheduled send time, and latency is
+measured from that time, so a server that falls behind shows up as queueing
+delay instead of being hidden by a slower send rate.
+
+    python bench_webhooks.py [--rates 50,100,200] [--duration 10] [--store memory|sqlite]
+    python bench_webhooks.py --save-baseline baseline.json    # record this machine's numbers
+    python bench_webhooks.py --baseline baseline.json         # exit 1 on a regression
+
+A regression is a p95 or p99 more than --tolerance (default 25%) and
+--min-delta-ms above the baseline, a higher error rate, or a throughput that
+falls short of the baseline by more than --tolerance. Baselines only compare
+runs on the same machine with the same options.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+BACKEND = os.path.dirname(os.path.abspath(__file__))
+ACCOUNT_SID = "AC" + "0" * 32
+AUTH_TOKEN = "bench-webhooks-token"
+ENDPOINTS = ("voice", "gather", "status")
+# Per simulated call: (endpoint, weight)
+MIX = (("status", 3.0), ("voice", 1.0), ("gather", 1.3))
+STATUS_EVENTS = (("initiated", 1), ("ringing", 1), ("in-progress", 0.5), ("completed", 0.5))
+DIGITS = (("1", 6), ("2", 1), ("3", 1), ("9", 0.2), ("5", 1), ("7", 0.3))
+ANSWERED_BY = (("human", 7), ("machine_end_beep", 2), ("unknown", 1))
+
+
+def appointment_id(i: int) -> str:
+    return f"bench-{i:06d}"
+
+
+def call_sid(i: int) -> str:
+    return f"CA{i:032d}"
+
+
+def phone(i: int) -> str:
+    return f"+1412{i % 10000000:07d}"
+
+
+# -- server -------------------------------------------------------------------
+
+def serve(port: int, appointments: int) -> None:
+    """Run the app with `appointments` seeded calls in progress (invoked in the subprocess)."""
+    sys.path.insert(0, BACKEND)
+    import uvicorn
+    import main
+    from models import Appointment, AppointmentStatus, appointment_store
+
+    for i in range(appointments):
+        apt = Appointment(f"Patient{i} Bench", phone(i), "9:15 AM", "Dr. Prisk", "Follow-up")
+        apt.id = appointment_id(i)
+        apt.appointment_date = "Monday, August, 11, 2025"
+        apt.status = AppointmentStatus.CALLING
+        apt.caller_id = "+14125550100"
+        appointment_store.add_appointment(apt)
+        appointment_store.map_call_to_appointment(call_sid(i), apt.id)
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def start_server(args, **env_overrides) -> Tuple[subprocess.Popen, str, str]:
+    workdir = tempfile.mkdtemp(prefix="pow-bench-")
+    # The app mounts static/ and templates/ relative to its working directory
+    for name in ("static", "templates"):
+        os.symlink(os.path.join(BACKEND, name), os.path.join(workdir, name))
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(
+        os.environ,
+        TWILIO_ACCOUNT_SID=ACCOUNT_SID,
+        TWILIO_AUTH_TOKEN=AUTH_TOKEN,
+        TWILIO_FROM_NUMBER="+14125550100",
+        TWILIO_API_BASE_URL="http://127.0.0.1:9",  # nothing here ever reaches real Twilio
+        JIVE_MAIN_NUMBER="+14125557692",
+        BASE_URL=base_url,
+        AMD_MODE="detect_message_end",
+        TWILIO_VALIDATE_SIGNATURES="true",  # every request is signed; include the check in the numbers
+        APPOINTMENT_STORE=args.store,
+        **env_overrides,
+    )
+    log = open(os.path.join(workdir, "server.log"), "w")
+    proc = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", str(port), "--appointments", str(args.appointments)],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f"Server exited during startup; see {log.name}")
+        try:
+            urllib.request.urlopen(f"{base_url}/api/webhooks/dedupe", timeout=1).read()
+            return proc, base_url, workdir
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    sys.exit(f"Server did not come up; see {log.name}")
+
+
+# -- payloads -----------------------------------------------------------------
+
+def build_requests(base_url: str, appointments: int, count: int, seed: int) -> List[Tuple[str, str, Dict, Dict]]:
+    """Precomputed (endpoint, url, form, headers), so signing costs nothing during the run."""
+    sys.path.insert(0, BACKEND)
+    os.environ.update(TWILIO_AUTH_TOKEN=AUTH_TOKEN, BASE_URL=base_url)
+    from twilio.request_validator import RequestValidator
+    from services.call_context import CallContext
+
+    validator = RequestValidator(AUTH_TOKEN)
+    rng = random.Random(seed)
+    endpoints, weights = zip(*MIX)
+
+    def pick(options):
+        values, option_weights = zip(*options)
+        return rng.choices(values, option_weights)[0]
+
+    sequence = 0
+    built = []
+    for n in range(count):
+        i = rng.randrange(appointments)
+        endpoint = rng.choices(endpoints, weights)[0]
+        form = {
+            "AccountSid": ACCOUNT_SID, "ApiVersion": "2010-04-01", "CallSid": call_sid(i),
+            "Direction": "outbound-api", "From": "+14125550100", "Caller": "+14125550100",
+            "To": phone(i), "Called": phone(i), "ToCity": "PITTSBURGH", "ToState": "PA", "ToCountry": "US",
+            "ToZip": "15222", "CallStatus": "in-progress",
+        }
+        # Half the calls carry the signed context, as calls placed with a signing key do
+        query = "" if i % 2 else "?" + CallContext([appointment_id(i)], caller_id="+14125550100").query()
+        if endpoint == "status":
+            status = pick(STATUS_EVENTS)
+            sequence += 1
+            form.update(CallStatus=status, SequenceNumber=str(sequence), CallbackSource="call-progress-events",
+                        Timestamp="Mon, 11 Aug 2025 14:00:00 +0000")
+            if status == "completed":
+                form.update(CallDuration=str(rng.randint(5, 60)), AnsweredBy=pick(ANSWERED_BY))
+        elif endpoint == "voice":
+            form["AnsweredBy"] = pick(ANSWERED_BY)
+        else:
+            form.update(Digits=pick(DIGITS), FinishedOnKey="")
+        url = f"{base_url}/twilio/{endpoint}{query}"
+        headers = {"X-Twilio-Signature": validator.compute_signature(url, form)}
+        built.append((endpoint, url, form, headers))
+    return built
+
+
+# -- load ---------------------------------------------------------------------
+
+def run_stage(requests_: List[Tuple[str, str, Dict, Dict]], rate: float, concurrency: int) -> List[Tuple[str, float, bool]]:
+    """Send `requests_` at `rate` per second; returns (endpoint, latency from scheduled time, ok)."""
+    import requests
+
+    results: List[Tuple[str, float, bool]] = []
+    lock = threading.Lock()
+    cursor = iter(range(len(requests_)))
+    start = time.perf_counter() + 0.1
+
+    def worker():
+        session = requests.Session()
+        local = []
+        while True:
+            with lock:
+                n = next(cursor, None)
+            if n is None:
+                break
+            scheduled = start + n / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            endpoint, url, form, headers = requests_[n]
+            try:
+                response = session.post(url, data=form, headers=headers, timeout=30)
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            local.append((endpoint, time.perf_counter() - scheduled, ok))
+        with lock:
+            results.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def summarize(results: List[Tuple[str, float, bool]], elapsed: float) -> Dict[str, Dict]:
+    summary = {}
+    for endpoint in ENDPOINTS + ("all",):
+        rows = [r for r in results if endpoint in ("all", r[0])]
+        if not rows:
+            continue
+        latencies = sorted(r[1] for r in rows)
+        errors = sum(1 for r in rows if not r[2])
+        summary[endpoint] = {
+            "count": len(rows),
+            "error_rate": round(errors / len(rows), 4),
+            "throughput": round(len(rows) / elapsed, 1),
+            "p50_ms": round(statistics.median(latencies) * 1000, 2),
+            "p95_ms": round(_percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2),
+        }
+    return summary
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+# -- baseline -----------------------------------------------------------------
+
+def compare(report: Dict, baseline: Dict, tolerance: float, min_delta_ms: float) -> List[str]:
+    regressions = []
+    previous = {stage["rate"]: stage["endpoints"] for stage in baseline["stages"]}
+    for stage in report["stages"]:
+        before = previous.get(stage["rate"])
+        if before is None:
+            continue
+        for endpoint, now in stage["endpoints"].items():
+            then = before.get(endpoint)
+            if then is None:
+                continue
+            label = f"{endpoint} @ {stage['rate']}/s"
+            for key in ("p95_ms", "p99_ms"):
+                if now[key] > then[key] * (1 + tolerance) and now[key] - then[key] > min_delta_ms:
+                    regressions.append(f"{label}: {key} {then[key]} -> {now[key]}")
+            if now["error_rate"] > then["error_rate"] + 0.001:
+                regressions.append(f"{label}: error rate {then['error_rate']:.2%} -> {now['error_rate']:.2%}")
+            if now["throughput"] < then["throughput"] * (1 - tolerance):
+                regressions.append(f"{label}: throughput {then['throughput']} -> {now['throughput']}/s")
+    return regressions
+
+
+def print_stage(stage: Dict, baseline_stage: Optional[Dict]) -> None:
+    print(f"\n{stage['rate']:g} req/s for {stage['duration']}s:")
+    print(f"  {'endpoint':<8} {'count':>6} {'req/s':>7} {'errors':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+          + ("   p95 vs baseline" if baseline_stage else ""))
+    for endpoint, row in stage["endpoints"].items():
+        line = (f"  {endpoint:<8} {row['count']:>6} {row['throughput']:>7} {row['error_rate']:>7.2%} "
+                f"{row['p50_ms']:>6.1f}ms {row['p95_ms']:>6.1f}ms {row['p99_ms']:>6.1f}ms {row['max_ms']:>6.1f}ms")
+        then = (baseline_stage or {}).get(endpoint)
+        if then:
+            change = (row["p95_ms"] - then["p95_ms"]) / then["p95_ms"] if then["p95_ms"] else 0
+            line += f"   {then['p95_ms']:.1f}ms ({change:+.0%})"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rates", default="50,100,200", help="comma-separated request rates, one stage each")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per stage")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds at the first rate before measuring")
+    parser.add_argument("--concurrency", type=int, default=64, help="client threads (connections)")
+    parser.add_argument("--appointments", type=int, default=2000)
+    parser.add_argument("--store", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", help="compare against this report and exit 1 on a regression")
+    parser.add_argument("--save-baseline", help="write this run's report here")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="ignore latency changes smaller than this")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.appointments)
+        return
+
+    rates = [float(rate) for rate in args.rates.split(",")]
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    proc, base_url, workdir = start_server(args)
+    print(f"App at {base_url} ({args.store} store, {args.appointments} appointments, logs in {workdir})")
+    try:
+        if args.warmup:
+            run_stage(build_requests(base_url, args.appointments, int(rates[0] * args.warmup), args.seed + 999),
+                      rates[0], args.concurrency)
+        stages = []
+        for n, rate in enumerate(rates):
+            batch = build_requests(base_url, args.appointments, int(rate * args.duration), args.seed + n)
+            started = time.perf_counter()
+            results = run_stage(batch, rate, args.concurrency)
+            elapsed = time.perf_counter() - started
+            stage = {"rate": rate, "duration": args.duration, "endpoints": summarize(results, elapsed)}
+            stages.append(stage)
+            previous = {s["rate"]: s["endpoints"] for s in baseline["stages"]} if baseline else {}
+            print_stage(stage, previous.get(rate))
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+    report = {
+        "options": {"store": args.store, "appointments": args.appointments, "concurrency": args.concurrency},
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "stages": stages,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline written to {args.save_baseline}")
+    if baseline:
+        if baseline.get("options") != report["options"]:
+            print(f"\nWARNING: baseline was recorded with different options: {baseline.get('options')}")
+        regressions = compare(report, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  FAIL {regression}")
+            sys.exit(1)
+        print("\nOK: no regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""Call queue scenario checks: dispatch, caller-ID limits and recovery against a stand-in Twilio.
+
+Each scenario runs on a scratch database with a fresh queue and caller-ID
+pool. Calls go through the real TwilioService.make_call and status
+callback; only the REST request that creates a call is replaced, so
+nothing is dialed. Exits non-zero if any scenario fails.
+
+    python check_call_queue.py [--scenario NAME ...]
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+os.environ.update({
+    "TWILIO_ACCOUNT_SID": "AC" + "0" * 32,
+    "TWILIO_AUTH_TOKEN": "check",
+    "TWILIO_FROM_NUMBERS": "+14125550001",
+    "APPOINTMENT_STORE": "memory",
+})
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import logging
+
+logging.disable(logging.WARNING)
+
+import database
+from models import Appointment, AppointmentStatus, appointment_store
+from services.call_queue import CallQueue, call_queue
+from services.job_store import job_store
+from services.number_pool import number_pool
+from services.retry_scheduler import retry_scheduler
+from services.twilio_client import TwilioService
+from services.webhook_journal import webhook_journal
+from settings import settings
+
+_sids = itertools.count(1)
+
+
+def _create_call(self, **params):
+    return SimpleNamespace(sid=f"CA{next(_sids):032d}")
+
+
+TwilioService._create_call = _create_call
+# Twilio's call log: nothing was dialed before a restart, and no call has ended without us hearing of it
+CallQueue._find_dialed_call = staticmethod(lambda client, job, apt: None)
+CallQueue._fetch_call_status = staticmethod(lambda client, call_sid: None)
+
+
+def fresh(numbers=("+14125550001",), max_calls=1, per_number=1, cps=1e9):
+    """Scratch database, empty queue and store, and the given caller-ID pool."""
+    os.chdir(tempfile.mkdtemp(prefix="pow-queue-check-"))
+    database.SyncSessionLocal = None
+    type(settings).is_within_call_window = classmethod(lambda cls: True)
+    type(settings).MAX_CONCURRENT_CALLS = max_calls
+    type(settings).NUMBER_MAX_CONCURRENT_CALLS = per_number
+    type(settings).NUMBER_CALLS_PER_SECOND = cps
+    type(settings).COALESCE_HOUSEHOLD_CALLS = False
+    appointment_store.clear_all()
+    retry_scheduler.__init__()
+    call_queue.__init__()
+    number_pool.__init__(list(numbers))
+
+
+def appointments(count):
+    created = []
+    for i in range(count):
+        apt = Appointment(f"Patient{i} Check", f"+1412555{1000 + i:04d}", "9:15 AM", "Dr. Prisk", "Follow-up")
+        appointment_store.add_appointment(apt)
+        created.append(apt)
+    return created
+
+
+def call_now(apt):
+    """What POST /api/call/{id} does."""
+    sid = TwilioService().make_call(apt)
+    if sid:
+        call_queue.track_call(sid)
+    return sid
+
+
+def finish(call_sid, status="completed"):
+    TwilioService().handle_status_callback(call_sid, status, "human")
+
+
+def sid_of(apt):
+    return appointment_store.get_appointment(apt.id).call_sid
+
+
+def scenario_direct_call_during_batch():
+    """A "Call Now" during a batch on a one-number pool must not leave the batch stuck."""
+    fresh()
+    first, second, other = appointments(3)
+    call_queue.start_batch([first.id, second.id])
+    direct = call_now(other)
+    finish(sid_of(first))
+    if direct:
+        finish(direct)
+    assert sid_of(second), "second batch call was never dialed"
+    finish(sid_of(second))
+    status = call_queue.get_status()
+    assert not status["active"] and status["queued_count"] == 0, status
+
+
+def scenario_direct_call_before_batch():
+    """A batch started while "Call Now" holds the only number dials once that call ends."""
+    fresh()
+    first, second, other = appointments(3)
+    direct = call_now(other)
+    assert direct, "direct call on an idle pool failed"
+    assert call_queue.get_gauges()["in_flight"] == 1, "the /metrics gauge missed a Call Now call"
+    call_queue.start_batch([first.id, second.id])
+    assert not sid_of(first), "batch dialed past a full caller ID"
+    finish(direct)
+    assert sid_of(first), "batch did not start when the number came free"
+    finish(sid_of(first))
+    finish(sid_of(second))
+    assert not call_queue.get_status()["active"]
+
+
+def scenario_placed_call_bookkeeping_fails():
+    """A call Twilio placed is reported placed, and keeps its caller ID, when recording it raises."""
+    fresh()
+    apt, = appointments(1)
+
+    def broken(*args, **kwargs):
+        raise OSError("disk full")
+
+    original = webhook_journal.record_call
+    webhook_journal.record_call = broken
+    try:
+        sid = call_now(apt)
+    finally:
+        webhook_journal.record_call = original
+    assert sid, "a placed call was reported failed"
+    assert number_pool.number_for_call(sid) == "+14125550001", "caller ID was not bound to the live call"
+    assert number_pool.get_metrics()["in_flight"] == 1, "caller ID was released while the call is up"
+    finish(sid)
+    assert number_pool.get_metrics()["in_flight"] == 0, "caller ID stayed held after the call ended"
+
+
+def scenario_sticky_number_full():
+    """A patient's usual caller ID at its concurrency limit is passed over, not over-subscribed."""
+    fresh(numbers=("+14125550001", "+14125550002"))
+    first, second = appointments(2)
+    call_now(first)
+    usual = appointment_store.get_appointment(first.id).caller_id
+    appointment_store.update(second.id, lambda current: {"caller_id": usual})
+    assert call_now(appointment_store.get_appointment(second.id)), "second number was free"
+    assert appointment_store.get_appointment(second.id).caller_id != usual
+    busiest = max(n["in_flight"] for n in number_pool.get_metrics()["numbers"])
+    assert busiest == 1, f"a number has {busiest} calls up with a limit of 1"
+    third, = appointments(1)
+    assert call_now(third) is None, "dialed with every number at its limit"
+
+
+def scenario_pacing_does_not_block():
+    """A number not yet due under CPS pacing is refused at once, and the queue dials it when due."""
+    fresh(max_calls=2, per_number=2, cps=4.0)
+    first, second = appointments(2)
+    started = time.monotonic()
+    call_queue.start_batch([first.id, second.id])
+    assert time.monotonic() - started < 0.1, "start_batch waited out the pacing"
+    assert sid_of(first) and not sid_of(second), "second call should be held back by pacing"
+
+    async def wait_for_second():
+        runner = asyncio.create_task(call_queue.run())
+        try:
+            for _ in range(100):
+                if sid_of(second):
+                    return time.monotonic() - started
+                await asyncio.sleep(0.02)
+        finally:
+            runner.cancel()
+
+    waited = asyncio.run(wait_for_second())
+    assert waited is not None, "paced call was never dialed"
+    assert waited >= 0.2, f"dialed after {waited:.2f}s, inside the 0.25s pacing"
+
+
+def scenario_claim_lease_outlives_restart():
+    """A job claimed just before a crash is skipped by recover() but dialed once its lease expires."""
+    fresh()
+    apt, = appointments(1)
+    job_store.create_campaign("crashed", "Crashed", 1, False)
+    job, = job_store.enqueue("crashed", [apt])
+    job_store.claim(job.id)
+    job_store._set(job.id, lease_owner="worker-that-crashed")
+    call_queue.recover()
+    assert not sid_of(apt), "recover() took a job under someone else's live lease"
+    assert call_queue.sweep_expired_leases() == 0
+    job_store._set(job.id, lease_expires=datetime.utcnow() - timedelta(seconds=1))
+    assert call_queue.sweep_expired_leases() == 1
+    assert sid_of(apt), "job was not dialed after its lease expired"
+    finish(sid_of(apt))
+    assert not call_queue.get_status()["active"], "campaign did not complete"
+
+
+def scenario_status_rechecked_at_claim():
+    """A queued appointment confirmed elsewhere before its turn is skipped, household siblings included."""
+    fresh()
+    type(settings).COALESCE_HOUSEHOLD_CALLS = True
+    first, confirmed, caller, sibling = appointments(4)
+    appointment_store.update(sibling.id, lambda current: {"phone": caller.phone})
+    campaign = call_queue.create_campaign("Recheck", [first.id, confirmed.id, caller.id, sibling.id])
+    for apt in (confirmed, sibling):
+        appointment_store.update(apt.id, lambda current: {"status": AppointmentStatus.CONFIRMED})
+    finish(sid_of(first))
+    assert not sid_of(confirmed), "dialed an appointment confirmed after it was queued"
+    assert sid_of(caller), "the next callable appointment was not dialed"
+    assert not sid_of(sibling), "a confirmed household sibling rode along on the call"
+    finish(sid_of(caller))
+    counts = job_store.counts(campaign["id"])
+    assert counts.get("done") == 4 and not counts.get("failed"), counts
+    assert not call_queue.get_status()["active"], "campaign did not complete"
+
+
+def scenario_foreign_call_left_to_its_worker():
+    """recover() leaves another live worker's call alone and takes it over once that worker stops renewing."""
+    fresh()
+    apt, = appointments(1)
+    job_store.create_campaign("elsewhere", "Elsewhere", 1, False)
+    job, = job_store.enqueue("elsewhere", [apt])
+    job_store.claim(job.id)
+    job_store.mark_dialed(job.id, "CA" + "f" * 32)
+    job_store._set(job.id, lease_owner="worker-still-running")
+    call_queue.recover()
+    assert call_queue.in_flight_count == 0, "recover() adopted a call another worker is running"
+    assert call_queue.sweep_expired_leases() == 0
+    job_store._set(job.id, lease_expires=datetime.utcnow() - timedelta(seconds=1))
+    assert call_queue.sweep_expired_leases() == 1
+    assert call_queue.in_flight_count == 1, "orphaned call was not taken over"
+    finish("CA" + "f" * 32)
+    assert not call_queue.get_status()["active"], "campaign did not complete"
+
+
+def scenario_ended_call_recovered_once():
+    """A call that ended while no worker was up is settled on recovery with one Twilio lookup, off the loop."""
+    fresh()
+    apt, = appointments(1)
+    job_store.create_campaign("ended", "Ended", 1, False)
+    job, = job_store.enqueue("ended", [apt])
+    job_store.claim(job.id)
+    call_sid = "CA" + "e" * 32
+    job_store.mark_dialed(job.id, call_sid)
+    job_store._set(job.id, lease_owner="worker-that-crashed", lease_expires=datetime.utcnow() - timedelta(seconds=1))
+    lookups = []
+
+    def fetch(client, sid):
+        lookups.append(threading.current_thread())
+        return "completed"
+
+    original = CallQueue._fetch_call_status
+    CallQueue._fetch_call_status = staticmethod(fetch)
+    try:
+        status = asyncio.run(call_queue.recover_async())
+    finally:
+        CallQueue._fetch_call_status = original
+    assert len(lookups) == 1, f"{len(lookups)} status lookups for one recovered call"
+    assert lookups[0] is not threading.main_thread(), "Twilio was asked from the event loop"
+    assert not status["active"] and call_queue.in_flight_count == 0, status
+
+
+def scenario_retry_survives_restart():
+    """A pending retry is rebuilt from the job table after a restart and dialed by one worker only."""
+    fresh()
+    apt, = appointments(1)
+    finish(call_now(apt), "no-answer")
+    assert retry_scheduler.get_status()["pending_count"] == 1, "no-answer did not schedule a retry"
+    retry_scheduler.__init__()
+    call_queue.__init__()
+    call_queue.recover()
+    assert retry_scheduler.get_status()["pending_count"] == 1, "retry was lost across the restart"
+    later = time.time() + 86400
+    assert retry_scheduler.pop_due(later) == [apt.id]
+    retry_scheduler.__init__()
+    retry_scheduler.restore()
+    assert retry_scheduler.pop_due(later) == [], "a second worker would dial the same retry"
+
+
+def scenario_retry_held_outside_call_window():
+    """A due retry queued behind the window closing waits for it to reopen; other batches still dial."""
+    fresh(max_calls=2, per_number=2)
+    retried, batched = appointments(2)
+    type(settings).is_within_call_window = classmethod(lambda cls: False)
+    call_queue.add_to_batch([retried.id])
+    call_queue.start_batch([batched.id])
+    assert sid_of(batched), "a manual batch is not bound by the call window"
+    assert not sid_of(retried), "retry dialed outside the call window"
+    lease = settings.CALL_JOB_LEASE_SECONDS
+    type(settings).CALL_JOB_LEASE_SECONDS = 0.05
+    type(settings).is_within_call_window = classmethod(lambda cls: True)
+
+    async def wait_for_retry():
+        runner = asyncio.create_task(call_queue.run())
+        try:
+            for _ in range(50):
+                if sid_of(retried):
+                    return True
+                await asyncio.sleep(0.02)
+        finally:
+            runner.cancel()
+
+    try:
+        assert asyncio.run(wait_for_retry()), "retry was not dialed once the window opened"
+    finally:
+        type(settings).CALL_JOB_LEASE_SECONDS = lease
+
+
+SCENARIOS = {
+    name[len("scenario_"):]: fn for name, fn in sorted(globals().items()) if name.startswith("scenario_")
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", nargs="*", choices=sorted(SCENARIOS), help="default: all")
+    args = parser.parse_args()
+    failed = 0
+    for name in args.scenario or sorted(SCENARIOS):
+        try:
+            SCENARIOS[name]()
+            print(f"ok    {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"FAIL  {name}: {e}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import os
+import threading
 from datetime import datetime
-from sqlalchemy import create_engine, Column, String, DateTime, Integer, Text, Boolean
+from sqlalchemy import create_engine, event, inspect, Column, String, DateTime, Integer, Text, Boolean, Float
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
@@ -10,6 +11,7 @@ logger = logging.getLogger(__name__)
 
 DATABASE_PATH = "pow_reminder.db"
 DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_PATH}"
+SYNC_DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
 
 Base = declarative_base()
 
@@ -57,8 +59,78 @@ class UploadHistory(Base):
     unconfirmed_count = Column(Integer, default=0)
     uploaded_by = Column(String, default="Staff")
 
+class CampaignRecord(Base):
+    """A named batch of calls; its jobs reference it through `call_jobs.batch_id`."""
+    __tablename__ = "call_campaigns"
+    
+    id = Column(String, primary_key=True)
+    name = Column(String, nullable=False)
+    state = Column(String, nullable=False, default="running")
+    weight = Column(Integer, default=1)
+    override_window = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class CallJobRecord(Base):
+    """One queued or in-flight outbound call attempt owned by the call queue."""
+    __tablename__ = "call_jobs"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    batch_id = Column(String, nullable=False, index=True)
+    appointment_id = Column(String, nullable=False)
+    position = Column(Integer, default=0)
+    state = Column(String, nullable=False, default="queued", index=True)
+    override_window = Column(Boolean, default=False)
+    call_sid = Column(String, index=True)
+    lease_owner = Column(String)
+    lease_expires = Column(DateTime)
+    claimed_at = Column(DateTime)
+    not_before = Column(DateTime)  # UTC time a scheduled retry becomes due
+    error = Column(Text)
+    payload = Column(Text)  # JSON snapshot of the appointment, used to rehydrate after a restart
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SharedAppointmentRecord(Base):
+    """Appointment state shared by every worker process when APPOINTMENT_STORE=sqlite."""
+    __tablename__ = "shared_appointments"
+    
+    id = Column(String, primary_key=True)
+    status = Column(String, nullable=False)  # authoritative; the copy inside `data` is ignored
+    version = Column(Integer, nullable=False, default=1)
+    data = Column(Text, nullable=False)  # JSON from Appointment.to_dict()
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class CallMapRecord(Base):
+    """Which appointments a Twilio call covers, so any worker can resolve a CallSid."""
+    __tablename__ = "call_map"
+    
+    call_sid = Column(String, primary_key=True)
+    appointment_ids = Column(Text, nullable=False)  # JSON list; more than one for a household call
+
+class AppointmentChangeRecord(Base):
+    """Append-only change feed that workers poll to hear about each other's writes."""
+    __tablename__ = "appointment_changes"
+    
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    appointment_id = Column(String, nullable=False)  # "*" means the whole schedule was replaced
+    changed_at = Column(DateTime, default=datetime.utcnow)
+
+class CallEventRecord(Base):
+    """One step of a call (status callback, webhook served, keypress); the rows for a CallSid are its timeline."""
+    __tablename__ = "call_events"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    call_sid = Column(String, nullable=False, index=True)
+    at = Column(Float, nullable=False, index=True)  # epoch seconds when this process saw it
+    event = Column(String, nullable=False)
+    value = Column(String)
+
 engine = None
 AsyncSessionLocal = None
+sync_engine = None
+SyncSessionLocal = None
+_sync_setup_lock = threading.Lock()
 
 async def init_database():
     global engine, AsyncSessionLocal
@@ -68,9 +140,50 @@ async def init_database():
     
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
     
     logger.info(f"Database initialized at {DATABASE_PATH}")
 
+def get_sync_session():
+    """Session factory for code paths that run outside the event loop (call queue, Twilio callbacks)."""
+    global sync_engine, SyncSessionLocal
+    
+    if SyncSessionLocal is None:
+        # Webhook threads and the call queue's worker thread can all arrive here first
+        with _sync_setup_lock:
+            if SyncSessionLocal is None:
+                new_engine = create_engine(SYNC_DATABASE_URL, connect_args={"check_same_thread": False, "timeout": 30})
+                event.listen(new_engine, "connect", _sqlite_pragmas)
+                Base.metadata.create_all(new_engine)
+                with new_engine.begin() as conn:
+                    _add_missing_columns(conn)
+                sync_engine = new_engine
+                SyncSessionLocal = sessionmaker(new_engine, expire_on_commit=False)
+    
+    return SyncSessionLocal()
+
+def _add_missing_columns(conn):
+    # create_all never alters an existing table, so add columns introduced since the database was created
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"
+                )
+                logger.info(f"Added column {table.name}.{column.name}")
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets worker processes read while another writes; busy_timeout makes writers queue instead of failing
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=30000")
+    cursor.close()
+
 async def get_session():
     async with AsyncSessionLocal() as session:
         yield session
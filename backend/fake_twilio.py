@@ -0,0 +1,506 @@
+"""Local stand-in for the Twilio REST API, for end-to-end load tests.
+
+Implements the parts of the Calls API the app uses: create, fetch, update
+(hang up) and list. Every created call is then played out on a timer drawn
+from configurable distributions: it rings, ends busy / no-answer / failed or
+is answered (by a human or a machine when AMD was requested), the voice
+webhook is fetched, and a simulated caller presses digits at each <Gather>,
+following <Redirect>s until the script hangs up. Status callbacks are sent
+for the events the call subscribed to, with SequenceNumber, CallDuration and
+AnsweredBy as Twilio sends them.
+
+Webhooks carry an X-Twilio-Signature computed with the auth token the app
+authenticated with, so they pass the same validation real Twilio traffic does.
+Webhook latency (per path), call outcomes and queue throughput are reported
+at GET /stats (POST /stats/reset clears them) and printed on exit.
+
+    python fake_twilio.py [--port 8099] [--time-scale 0.05] [--seed 1]
+
+    # then run the app against it; webhooks go to BASE_URL, which may be local
+    TWILIO_API_BASE_URL=http://127.0.0.1:8099 BASE_URL=http://127.0.0.1:8000 \\
+        TWILIO_ACCOUNT_SID=AC00000000000000000000000000000000 TWILIO_AUTH_TOKEN=load-test \\
+        TWILIO_FROM_NUMBERS=+14125550100,+14125550101 MAX_CONCURRENT_CALLS=50 \\
+        NUMBER_MAX_CONCURRENT_CALLS=25 NUMBER_CALLS_PER_SECOND=100 uvicorn main:app
+
+Distributions are "value:weight,..." and delays "min:max" seconds (uniform),
+both before --time-scale is applied:
+
+    --outcomes     answered:0.75,no-answer:0.15,busy:0.07,failed:0.03
+    --answered-by  human:0.7,machine_end_beep:0.25,unknown:0.05   (only with AMD)
+    --digits       1:0.6,2:0.08,3:0.05,9:0.02,5:0.05,none:0.2      (per <Gather>)
+    --ring 1:8  --think 1:5  --talk 3:20
+"""
+import argparse
+import asyncio
+import base64
+import email.utils
+import json
+import logging
+import random
+import statistics
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+import requests
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from twilio.request_validator import RequestValidator
+
+
+logger = logging.getLogger("fake_twilio")
+
+API_VERSION = "2010-04-01"
+# Voice and gather round trips one call may make before it is cut off (guards against redirect loops)
+MAX_HOPS = 12
+TERMINAL = {"completed", "busy", "no-answer", "failed", "canceled"}
+
+
+class Distribution:
+    """Weighted choice parsed from "value:weight,value:weight"."""
+
+    def __init__(self, spec: str) -> None:
+        pairs = [part.rsplit(":", 1) for part in spec.split(",") if part.strip()]
+        self.values = [value.strip() for value, _ in pairs]
+        self.weights = [float(weight) for _, weight in pairs]
+
+    def sample(self, rng: random.Random) -> str:
+        return rng.choices(self.values, self.weights)[0]
+
+
+class Delay:
+    """Uniform delay parsed from "min:max" seconds."""
+
+    def __init__(self, spec: str) -> None:
+        low, _, high = spec.partition(":")
+        self.low, self.high = float(low), float(high or low)
+
+    def sample(self, rng: random.Random) -> float:
+        return rng.uniform(self.low, self.high)
+
+
+class Scenario:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.rng = random.Random(args.seed)
+        self.time_scale = args.time_scale
+        self.outcomes = Distribution(args.outcomes)
+        self.answered_by = Distribution(args.answered_by)
+        self.digits = Distribution(args.digits)
+        self.ring = Delay(args.ring)
+        self.think = Delay(args.think)
+        self.talk = Delay(args.talk)
+
+    async def wait(self, delay: Delay) -> float:
+        seconds = delay.sample(self.rng)
+        await asyncio.sleep(seconds * self.time_scale)
+        return seconds
+
+
+class FakeCall:
+    def __init__(self, account_sid: str, auth_token: str, form) -> None:
+        self.sid = "CA" + uuid.uuid4().hex
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.to = form.get("To")
+        self.from_ = form.get("From")
+        self.url = form.get("Url")
+        self.method = (form.get("Method") or "POST").upper()
+        self.twiml = form.get("Twiml")
+        self.status_callback = form.get("StatusCallback")
+        self.events = set(form.getlist("StatusCallbackEvent")) or {"completed"}
+        self.amd = bool(form.get("MachineDetection"))
+        self.status = "queued"
+        self.answered_by: Optional[str] = None
+        self.created = datetime.now(timezone.utc)
+        self.start_time: Optional[datetime] = None
+        self.end_time: Optional[datetime] = None
+        self.duration = 0
+        self.sequence = 0
+        self.digits: List[str] = []
+        self.task: Optional[asyncio.Task] = None
+
+    def to_dict(self) -> Dict:
+        def rfc2822(dt):
+            return email.utils.format_datetime(dt) if dt else None
+        return {
+            "sid": self.sid,
+            "account_sid": self.account_sid,
+            "to": self.to,
+            "to_formatted": self.to,
+            "from": self.from_,
+            "from_formatted": self.from_,
+            "status": self.status,
+            "answered_by": self.answered_by,
+            "direction": "outbound-api",
+            "api_version": API_VERSION,
+            "date_created": rfc2822(self.created),
+            "date_updated": rfc2822(self.end_time or self.start_time or self.created),
+            "start_time": rfc2822(self.start_time),
+            "end_time": rfc2822(self.end_time),
+            "duration": str(self.duration) if self.end_time else None,
+            "price": None,
+            "uri": f"/{API_VERSION}/Accounts/{self.account_sid}/Calls/{self.sid}.json",
+        }
+
+
+class Stats:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started = time.monotonic()
+            self.first_call: Optional[float] = None
+            self.last_call: Optional[float] = None
+            self.created = 0
+            self.finished = 0
+            self.active = 0
+            self.peak_active = 0
+            self.outcomes: Counter = Counter()
+            self.digits: Counter = Counter()
+            self.latencies: Dict[str, List[float]] = defaultdict(list)
+            self.webhook_errors: Counter = Counter()
+
+    def call_created(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self.created += 1
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+            self.first_call = self.first_call or now
+            self.last_call = now
+
+    def call_finished(self, outcome: str) -> None:
+        with self._lock:
+            self.finished += 1
+            self.active -= 1
+            self.outcomes[outcome] += 1
+
+    def digit(self, digit: str) -> None:
+        with self._lock:
+            self.digits[digit] += 1
+
+    def webhook(self, path: str, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self.latencies[path].append(seconds)
+            if not ok:
+                self.webhook_errors[path] += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            span = (self.last_call - self.first_call) if self.created > 1 else 0
+            webhooks = {}
+            for path, values in self.latencies.items():
+                ordered = sorted(values)
+                webhooks[path] = {
+                    "count": len(ordered),
+                    "errors": self.webhook_errors[path],
+                    "p50_ms": round(statistics.median(ordered) * 1000, 2),
+                    "p95_ms": round(_percentile(ordered, 0.95) * 1000, 2),
+                    "p99_ms": round(_percentile(ordered, 0.99) * 1000, 2),
+                    "max_ms": round(ordered[-1] * 1000, 2),
+                }
+            return {
+                "uptime_seconds": round(time.monotonic() - self.started, 1),
+                "calls_created": self.created,
+                "calls_finished": self.finished,
+                "calls_active": self.active,
+                "peak_active": self.peak_active,
+                "calls_per_second": round((self.created - 1) / span, 2) if span else None,
+                "outcomes": dict(self.outcomes),
+                "digits": dict(self.digits),
+                "webhooks": webhooks,
+            }
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class FakeTwilio:
+    def __init__(self, scenario: Scenario, webhook_threads: int) -> None:
+        self.scenario = scenario
+        self.calls: Dict[str, FakeCall] = {}
+        self.stats = Stats()
+        self._pool = ThreadPoolExecutor(max_workers=webhook_threads, thread_name_prefix="webhook")
+        self._local = threading.local()
+
+    # -- webhooks ------------------------------------------------------------
+
+    def _post(self, call: FakeCall, url: str, params: Dict[str, str], method: str = "POST") -> Tuple[int, str]:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        # Twilio signs the full URL plus, for POST, the sorted form parameters
+        signed = params if method == "POST" else {}
+        headers = {"X-Twilio-Signature": RequestValidator(call.auth_token).compute_signature(url, signed)}
+        start = time.perf_counter()
+        try:
+            if method == "POST":
+                response = session.post(url, data=params, headers=headers, timeout=15)
+            else:
+                response = session.get(url, params=params, headers=headers, timeout=15)
+            status, body = response.status_code, response.text
+        except requests.RequestException as e:
+            logger.warning(f"Webhook {url} failed: {e}")
+            status, body = 0, ""
+        self.stats.webhook(urlsplit(url).path, time.perf_counter() - start, 200 <= status < 300)
+        return status, body
+
+    async def webhook(self, call: FakeCall, url: str, extra: Optional[Dict[str, str]] = None,
+                      method: str = "POST") -> Tuple[int, str]:
+        params = {
+            "AccountSid": call.account_sid, "CallSid": call.sid, "From": call.from_, "To": call.to,
+            "CallStatus": call.status, "Direction": "outbound-api", "ApiVersion": API_VERSION,
+        }
+        if call.answered_by and call.amd:
+            params["AnsweredBy"] = call.answered_by
+        params.update(extra or {})
+        return await asyncio.get_running_loop().run_in_executor(self._pool, self._post, call, url, params, method)
+
+    async def status_event(self, call: FakeCall, event: str) -> None:
+        if not call.status_callback or event not in call.events:
+            return
+        extra = {
+            "SequenceNumber": str(call.sequence),
+            "CallbackSource": "call-progress-events",
+            "Timestamp": email.utils.format_datetime(datetime.now(timezone.utc)),
+        }
+        call.sequence += 1
+        if event == "completed":
+            extra["CallDuration"] = str(call.duration)
+        await self.webhook(call, call.status_callback, extra)
+
+    # -- call simulation -----------------------------------------------------
+
+    async def play(self, call: FakeCall) -> None:
+        scenario = self.scenario
+        outcome = "failed"
+        try:
+            call.status = "initiated"
+            await self.status_event(call, "initiated")
+            call.status = "ringing"
+            await self.status_event(call, "ringing")
+            await scenario.wait(scenario.ring)
+            outcome = scenario.outcomes.sample(scenario.rng)
+            if outcome == "answered":
+                call.status = "in-progress"
+                call.start_time = datetime.now(timezone.utc)
+                call.answered_by = scenario.answered_by.sample(scenario.rng) if call.amd else None
+                await self.status_event(call, "answered")
+                seconds = await self.converse(call)
+                call.duration = max(1, int(seconds))
+                outcome = "completed"
+            call.status = outcome
+        except asyncio.CancelledError:
+            call.status = outcome = "canceled" if call.start_time is None else "completed"
+        finally:
+            call.end_time = datetime.now(timezone.utc)
+            self.stats.call_finished(outcome if outcome != "completed" else f"completed:{call.answered_by or 'human'}")
+        await self.status_event(call, "completed")
+
+    async def converse(self, call: FakeCall) -> float:
+        """Walk the call's TwiML like Twilio would, answering each <Gather>; returns seconds spent."""
+        scenario = self.scenario
+        machine = (call.answered_by or "human").startswith("machine") or call.answered_by == "fax"
+        elapsed = 0.0
+        if call.twiml:
+            twiml, base = call.twiml, None
+        else:
+            status, twiml = await self.webhook(call, call.url, method=call.method)
+            base = call.url
+            if status != 200:
+                return elapsed
+        for _ in range(MAX_HOPS):
+            next_request = None
+            for verb in _verbs(twiml):
+                if verb.tag == "Gather" and not machine:
+                    digit = scenario.digits.sample(scenario.rng)
+                    elapsed += await scenario.wait(scenario.think)
+                    if digit == "none":
+                        continue  # timed out: Twilio carries on with the verbs after <Gather>
+                    call.digits.append(digit)
+                    self.stats.digit(digit)
+                    action = urljoin(base or "", verb.get("action") or base or "")
+                    next_request = (action, verb.get("method", "POST").upper(), {"Digits": digit})
+                    break
+                if verb.tag == "Redirect" and (verb.text or "").strip():
+                    next_request = (urljoin(base or "", verb.text.strip()), verb.get("method", "POST").upper(), {})
+                    break
+                if verb.tag in ("Hangup", "Reject"):
+                    break
+                if verb.tag == "Dial":
+                    elapsed += await scenario.wait(scenario.talk)  # transferred to the front desk
+                    break
+            if next_request is None or not next_request[0]:
+                break
+            url, method, extra = next_request
+            status, twiml = await self.webhook(call, url, extra, method)
+            base = url
+            if status != 200:
+                break
+        return elapsed + await scenario.wait(scenario.talk)
+
+    def create(self, account_sid: str, auth_token: str, form) -> FakeCall:
+        call = FakeCall(account_sid, auth_token, form)
+        self.calls[call.sid] = call
+        self.stats.call_created()
+        call.task = asyncio.get_running_loop().create_task(self.play(call))
+        return call
+
+
+def _verbs(twiml: str) -> List[ET.Element]:
+    try:
+        root = ET.fromstring(twiml)
+    except ET.ParseError:
+        logger.warning(f"Unparseable TwiML: {twiml[:200]!r}")
+        return []
+    return list(root)
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    for fmt in ("%Y-%m-%dT%H:%M:%SZ", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).replace(tzinfo=timezone.utc)
+        except ValueError:
+            pass
+    return None
+
+
+def _error(status: int, code: int, message: str) -> JSONResponse:
+    return JSONResponse(status_code=status, content={
+        "code": code, "message": message, "more_info": f"https://www.twilio.com/docs/errors/{code}", "status": status
+    })
+
+
+def create_app(fake: FakeTwilio) -> FastAPI:
+    app = FastAPI(title="Fake Twilio")
+    prefix = f"/{API_VERSION}/Accounts/{{account_sid}}"
+
+    def credentials(request: Request, account_sid: str) -> Optional[str]:
+        """The auth token from HTTP basic auth, or None if it does not match the account."""
+        scheme, _, encoded = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "basic":
+            return None
+        try:
+            username, _, password = base64.b64decode(encoded).decode().partition(":")
+        except ValueError:
+            return None
+        return password if username == account_sid and password else None
+
+    @app.post(prefix + "/Calls.json")
+    async def create_call(account_sid: str, request: Request):
+        token = credentials(request, account_sid)
+        if token is None:
+            return _error(401, 20003, "Authenticate")
+        form = await request.form()
+        if not form.get("To"):
+            return _error(400, 21201, "No 'To' number is specified")
+        if not form.get("From"):
+            return _error(400, 21213, "No 'From' number is specified")
+        if not (form.get("Url") or form.get("Twiml")):
+            return _error(400, 21205, "Url or Twiml is required")
+        call = fake.create(account_sid, token, form)
+        return JSONResponse(status_code=201, content=call.to_dict())
+
+    @app.get(prefix + "/Calls.json")
+    async def list_calls(account_sid: str, request: Request):
+        if credentials(request, account_sid) is None:
+            return _error(401, 20003, "Authenticate")
+        query = request.query_params
+        after, before = _parse_time(query.get("StartTime>")), _parse_time(query.get("StartTime<"))
+        calls = [
+            call for call in reversed(list(fake.calls.values()))
+            if call.account_sid == account_sid
+            and query.get("To") in (None, call.to)
+            and query.get("From") in (None, call.from_)
+            and query.get("Status") in (None, call.status)
+            and (after is None or call.created >= after)
+            and (before is None or call.created <= before)
+        ]
+        page_size = int(query.get("PageSize", 50))
+        page = int(query.get("Page", 0))
+        items = calls[page * page_size:(page + 1) * page_size]
+        uri = f"/{API_VERSION}/Accounts/{account_sid}/Calls.json"
+        more = (page + 1) * page_size < len(calls)
+        return JSONResponse(content={
+            "calls": [call.to_dict() for call in items],
+            "page": page,
+            "page_size": page_size,
+            "start": page * page_size,
+            "end": page * page_size + max(len(items) - 1, 0),
+            "uri": f"{uri}?PageSize={page_size}&Page={page}",
+            "first_page_uri": f"{uri}?PageSize={page_size}&Page=0",
+            "previous_page_uri": f"{uri}?PageSize={page_size}&Page={page - 1}" if page else None,
+            "next_page_uri": f"{uri}?PageSize={page_size}&Page={page + 1}" if more else None,
+        })
+
+    @app.get(prefix + "/Calls/{call_sid}.json")
+    async def fetch_call(account_sid: str, call_sid: str, request: Request):
+        if credentials(request, account_sid) is None:
+            return _error(401, 20003, "Authenticate")
+        call = fake.calls.get(call_sid)
+        if call is None or call.account_sid != account_sid:
+            return _error(404, 20404, f"The requested resource {request.url.path} was not found")
+        return JSONResponse(content=call.to_dict())
+
+    @app.post(prefix + "/Calls/{call_sid}.json")
+    async def update_call(account_sid: str, call_sid: str, request: Request):
+        if credentials(request, account_sid) is None:
+            return _error(401, 20003, "Authenticate")
+        call = fake.calls.get(call_sid)
+        if call is None or call.account_sid != account_sid:
+            return _error(404, 20404, f"The requested resource {request.url.path} was not found")
+        form = await request.form()
+        if form.get("Status") in ("completed", "canceled") and call.status not in TERMINAL and call.task:
+            call.task.cancel()
+            await asyncio.gather(call.task, return_exceptions=True)
+        return JSONResponse(content=call.to_dict())
+
+    @app.get("/stats")
+    async def get_stats():
+        return JSONResponse(content=fake.stats.snapshot())
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        fake.stats.reset()
+        return JSONResponse(content=fake.stats.snapshot())
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--time-scale", type=float, default=1.0, help="multiply every simulated delay by this")
+    parser.add_argument("--outcomes", default="answered:0.75,no-answer:0.15,busy:0.07,failed:0.03")
+    parser.add_argument("--answered-by", default="human:0.7,machine_end_beep:0.25,unknown:0.05")
+    parser.add_argument("--digits", default="1:0.6,2:0.08,3:0.05,9:0.02,5:0.05,none:0.2")
+    parser.add_argument("--ring", default="1:8", help="seconds ringing before the outcome")
+    parser.add_argument("--think", default="1:5", help="seconds before answering each <Gather>")
+    parser.add_argument("--talk", default="3:20", help="seconds after the script ends before hanging up")
+    parser.add_argument("--webhook-threads", type=int, default=64, help="webhooks in flight at once")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    fake = FakeTwilio(Scenario(args), args.webhook_threads)
+    try:
+        uvicorn.run(create_app(fake), host=args.host, port=args.port, log_level="warning")
+    finally:
+        print(json.dumps(fake.stats.snapshot(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
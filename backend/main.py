@@ -1,25 +1,36 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+import asyncio
 import logging
 import sys
 sys.path.append('.')
 
-from routes import uploads, calls
+from routes import uploads, calls, admin
 from settings import settings
-from database import init_database
+from database import DATABASE_PATH, init_database
+from services.call_queue import call_queue
+from services.retry_scheduler import retry_scheduler
+from services.number_pool import number_pool
+from services.metrics import metrics
+from services.call_timeline import call_timeline
+from models import appointment_store
+from services.webhook_journal import WebhookCaptureMiddleware, webhook_journal
+from utils.twilio_auth import TwilioSignatureMiddleware
+from utils.request_timing import RequestTimingMiddleware, TimedRoute
+from utils import instance_lock, logging_setup
 import json
 from urllib.request import urlopen
 from urllib.error import URLError
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Handlers only queue records; a writer thread formats, redacts PHI and writes them
+logging_setup.configure_logging()
 
 app = FastAPI(title="POW Reminder MVP", version="1.0.0")
+app.router.route_class = TimedRoute
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,11 +40,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Parses each webhook form once, checks its signature, and hands the form on to the route
+app.add_middleware(TwilioSignatureMiddleware)
+
+if webhook_journal.enabled:
+    app.add_middleware(WebhookCaptureMiddleware, journal=webhook_journal)
+    appointment_store.add_listener(webhook_journal.record_state)
+
+# The appointment list is ~430 bytes of JSON per appointment and gzips more than 10x
+if settings.GZIP_MIN_BYTES:
+    app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MIN_BYTES, compresslevel=5)
+
+# Outermost, so a slow request's log line accounts for everything above the socket
+app.add_middleware(RequestTimingMiddleware)
+
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
 app.include_router(uploads.router)
 app.include_router(calls.router)
+app.include_router(admin.router)
 
 @app.get("/", response_class=HTMLResponse)
 async def dashboard(request: Request):
@@ -54,32 +80,63 @@ async def health_check():
         "status": "healthy",
         "twilio_configured": twilio_configured,
         "call_window_active": call_window_active,
+        "store": appointment_store.get_stats(),
         "settings": {
+            "version": settings.version,
             "timezone": settings.TIMEZONE,
             "call_window": f"{settings.CALL_WINDOW_START} - {settings.CALL_WINDOW_END}"
         }
     }
 
+metrics.gauge("pow_call_queue_depth", "Jobs queued in open campaigns", lambda: call_queue.get_gauges()["queued"])
+metrics.gauge("pow_calls_in_flight", "Calls placed and not yet finished", lambda: call_queue.get_gauges()["in_flight"])
+metrics.gauge("pow_open_campaigns", "Running or paused campaigns", lambda: call_queue.get_gauges()["open_campaigns"])
+metrics.gauge(
+    "pow_caller_id_in_flight", "Calls in flight per caller ID",
+    lambda: {(n["number"],): n["in_flight"] for n in number_pool.get_metrics()["numbers"]}, ("number",)
+)
+metrics.gauge(
+    "pow_store_entries", "Appointment store size, by kind of entry",
+    lambda: {(kind,): value for kind, value in appointment_store.get_stats().items() if kind != "evicted_calls"}, ("kind",)
+)
+metrics.gauge("pow_log_queue_depth", "Log records waiting for the writer thread", logging_setup.queue_depth)
+metrics.gauge("pow_settings_version", "Settings version; goes up on every applied change", lambda: settings.version)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    # Prometheus text format; scrape with any local collector
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.on_event("startup")
 async def startup_event():
     logging.info("POW Reminder MVP starting up...")
     
+    # Campaigns, caller-ID pacing and MAX_CONCURRENT_CALLS live in this process's memory, so a second
+    # server (or uvicorn worker) on the same database would show other batches and dial past every limit
+    if not instance_lock.acquire(f"{DATABASE_PATH}.lock"):
+        raise RuntimeError(
+            f"Another server is already running on {DATABASE_PATH}; the call queue runs in one process only. "
+            "Stop it, or start this one with a single worker (python serve.py)."
+        )
+    
     await init_database()
     
-    # Auto-start tunnel if needed
-    if settings.AUTO_TUNNEL:
-        try:
-            from auto_tunnel import start_tunnel_service
-            logging.info("Starting automatic tunnel service...")
-            if start_tunnel_service():
-                logging.info("Tunnel service started successfully")
-                # Reload settings to get new BASE_URL
-                from importlib import reload
-                reload(settings)
-            else:
-                logging.warning("Could not start tunnel service - webhooks will not work")
-        except Exception as e:
-            logging.warning(f"Tunnel service not available: {e}")
+    # Dials whatever caller-ID pacing held back, as soon as a number is due
+    app.state.queue_task = asyncio.create_task(call_queue.run())
+    
+    # Pick up any batch that was interrupted by a restart; asking Twilio about its calls can take a while
+    app.state.recover_task = asyncio.create_task(recover_call_queue())
+    
+    app.state.retry_task = asyncio.create_task(retry_scheduler.run())
+    # Shared stores poll for other workers' changes; the in-memory store returns at once
+    app.state.store_task = asyncio.create_task(appointment_store.watch())
+    
+    # Call timeline events are buffered in memory and written in batches
+    app.state.timeline_task = asyncio.create_task(call_timeline.run())
+    # .env edits (a new tunnel URL from update_tunnel.py, say) apply without a restart
+    app.state.settings_task = asyncio.create_task(settings.watch())
+    # Finding the public URL can take seconds (30 with AUTO_TUNNEL); serve requests meanwhile
+    app.state.tunnel_task = asyncio.create_task(discover_base_url())
     
     if not settings.validate():
         logging.warning("Twilio configuration incomplete. Please check your .env file")
@@ -88,18 +145,55 @@ async def startup_event():
     logging.info(f"Call window: {settings.CALL_WINDOW_START} - {settings.CALL_WINDOW_END} {settings.TIMEZONE}")
     logging.info(f"Database location: pow_reminder.db")
 
-    # Auto-detect ngrok URL from local API to simplify setup
+async def recover_call_queue():
+    """Background task: resume interrupted campaigns without delaying startup."""
+    try:
+        recovered = await call_queue.recover_async()
+        if recovered["active"]:
+            logging.info(f"Resumed {len(recovered['campaigns'])} call campaigns: {recovered['queued_count']} queued")
+    except Exception as e:
+        logging.error(f"Call queue recovery failed: {e}")
+
+def _ngrok_url():
+    """Public https URL from a local ngrok agent's API, if one is running."""
     try:
         with urlopen('http://127.0.0.1:4040/api/tunnels', timeout=2) as resp:
             data = json.load(resp)
-            public_urls = [t.get('public_url') for t in data.get('tunnels', []) if t.get('public_url', '').startswith('https://')]
-            if public_urls:
-                ngrok_url = public_urls[0]
-                if settings.BASE_URL != ngrok_url:
-                    old = settings.BASE_URL
-                    settings.BASE_URL = ngrok_url
-                    logging.info(f"Detected ngrok URL via 4040 API. BASE_URL updated: {old} -> {settings.BASE_URL}")
     except URLError:
-        pass
+        return None
+    public_urls = [t.get('public_url') for t in data.get('tunnels', []) if t.get('public_url', '').startswith('https://')]
+    return public_urls[0] if public_urls else None
+
+async def discover_base_url():
+    """Background task: point BASE_URL at the tunnel Twilio can reach, without delaying startup."""
+    if settings.AUTO_TUNNEL:
+        try:
+            from auto_tunnel import tunnel_manager
+            logging.info("Starting automatic tunnel service...")
+            # The tunnel pushes its URL (and any later one) into settings itself
+            if await asyncio.to_thread(tunnel_manager.start_tunnel):
+                logging.info("Tunnel service started successfully")
+            else:
+                logging.warning("Could not start tunnel service - webhooks will not work")
+        except Exception as e:
+            logging.warning(f"Tunnel service not available: {e}")
+
+    # Auto-detect ngrok URL from local API to simplify setup
+    try:
+        ngrok_url = await asyncio.to_thread(_ngrok_url)
+        if ngrok_url:
+            settings.override("ngrok 4040 API", BASE_URL=ngrok_url)
     except Exception as e:
-        logging.debug(f"ngrok URL auto-detect skipped: {e}")
\ No newline at end of file
+        logging.debug(f"ngrok URL auto-detect skipped: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for name in ("recover_task", "queue_task", "retry_task", "store_task", "settings_task", "tunnel_task", "timeline_task"):
+        task = getattr(app.state, name, None)
+        if task:
+            task.cancel()
+    call_timeline.flush()
+    if settings.AUTO_TUNNEL:
+        from auto_tunnel import tunnel_manager
+        tunnel_manager.stop_tunnel()
+    webhook_journal.close()
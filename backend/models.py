@@ -1,9 +1,18 @@
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
+from collections import OrderedDict
 from datetime import datetime
 from enum import Enum
 import uuid
 import asyncio
+import logging
+import sys
+import threading
+import time
 from database import db_service, get_session
+from settings import settings
+from utils import fast_json
+
+logger = logging.getLogger(__name__)
 
 class AppointmentStatus(str, Enum):
     NOT_CONFIRMED = "Not Confirmed"
@@ -14,6 +23,32 @@ class AppointmentStatus(str, Enum):
     VOICEMAIL = "Voicemail/No Answer"
     RESCHEDULING = "Rescheduling"
 
+# Keypress outcomes: a patient may change their mind on the same call, but a call
+# result (no answer, voicemail) can never overwrite one
+_ANSWERED = {
+    AppointmentStatus.CONFIRMED, AppointmentStatus.CANCELLED,
+    AppointmentStatus.RESCHEDULING, AppointmentStatus.DO_NOT_CALL,
+}
+
+ALLOWED_TRANSITIONS: Dict[AppointmentStatus, set] = {
+    AppointmentStatus.NOT_CONFIRMED: {AppointmentStatus.CALLING} | _ANSWERED,
+    AppointmentStatus.VOICEMAIL: {AppointmentStatus.CALLING, AppointmentStatus.NOT_CONFIRMED} | _ANSWERED,
+    AppointmentStatus.CALLING: {AppointmentStatus.NOT_CONFIRMED, AppointmentStatus.VOICEMAIL} | _ANSWERED,
+    # Staff may call back after a transfer to reschedule
+    AppointmentStatus.RESCHEDULING: {AppointmentStatus.CALLING, AppointmentStatus.NOT_CONFIRMED} | _ANSWERED,
+    AppointmentStatus.CONFIRMED: set(_ANSWERED),
+    AppointmentStatus.CANCELLED: set(_ANSWERED),
+    AppointmentStatus.DO_NOT_CALL: set(_ANSWERED),
+}
+
+def can_transition(current: AppointmentStatus, new: AppointmentStatus) -> bool:
+    """Whether an appointment may move from `current` to `new`; staying put is always allowed."""
+    current, new = AppointmentStatus(current), AppointmentStatus(new)
+    return current == new or new in ALLOWED_TRANSITIONS[current]
+
+class InvalidTransition(ValueError):
+    pass
+
 class CallStatus(str, Enum):
     QUEUED = "queued"
     INITIATED = "initiated"
@@ -25,7 +60,28 @@ class CallStatus(str, Enum):
     FAILED = "failed"
     CANCELLED = "cancelled"
 
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value else value
+
+def appointments_json(appointments: List["Appointment"]) -> bytes:
+    """A JSON array of appointments from their cached encodings."""
+    return b"[" + b",".join(appointment.to_json() for appointment in appointments) + b"]"
+
 class Appointment:
+    """One row of the schedule and its call state.
+
+    Slots instead of a per-instance __dict__, and the values a day's list
+    shares (provider, type, time, date) interned, keep 10k appointments
+    compact. `to_json()` keeps the encoded form until any attribute is
+    assigned, so listing unchanged appointments is a join of cached bytes.
+    """
+    FIELDS = (
+        "id", "patient_name", "phone", "appointment_time", "appointment_date", "provider", "appointment_type",
+        "status", "original_confirmation", "call_sid", "last_called", "call_attempts", "notes",
+        "last_answered_by", "needs_callback", "caller_id", "version",
+    )
+    __slots__ = FIELDS + ("_stamp", "_json")
+
     def __init__(
         self,
         patient_name: str,
@@ -36,21 +92,30 @@ class Appointment:
         confirmation_status: str = "Not Confirmed",
         appointment_id: Optional[str] = None
     ):
+        object.__setattr__(self, "_stamp", 0)
+        object.__setattr__(self, "_json", None)
         self.id = appointment_id or str(uuid.uuid4())
         self.patient_name = patient_name
         self.phone = self._clean_phone(phone)
-        self.appointment_time = appointment_time
+        self.appointment_time = _intern(appointment_time)
         self.appointment_date: Optional[str] = None  # Will be set by parser
-        self.provider = provider
-        self.appointment_type = appointment_type
+        self.provider = _intern(provider)
+        self.appointment_type = _intern(appointment_type)
         self.status = AppointmentStatus.NOT_CONFIRMED
-        self.original_confirmation = confirmation_status
+        self.original_confirmation = _intern(confirmation_status)
         self.call_sid: Optional[str] = None
         self.last_called: Optional[datetime] = None
         self.call_attempts: int = 0
         self.notes: str = ""
         self.last_answered_by: Optional[str] = None
         self.needs_callback: bool = False
+        self.caller_id: Optional[str] = None  # from-number used so far, reused on retries
+        self.version: int = 0  # bumped by every accepted change; see AppointmentStore.compare_and_swap
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        # Any write, through the store or not, retires the cached JSON
+        object.__setattr__(self, "_stamp", self._stamp + 1)
     
     def _clean_phone(self, phone: str) -> str:
         cleaned = ''.join(filter(str.isdigit, phone))
@@ -74,13 +139,144 @@ class Appointment:
             "call_attempts": self.call_attempts,
             "notes": self.notes,
             "last_answered_by": self.last_answered_by,
-            "needs_callback": self.needs_callback
+            "needs_callback": self.needs_callback,
+            "caller_id": self.caller_id,
+            "version": self.version
         }
 
+    def to_json(self) -> bytes:
+        """to_dict() as compact JSON, encoded again only after a change."""
+        cached = self._json
+        if cached is not None and cached[0] == self._stamp:
+            return cached[1]
+        # A write racing the encode changes the stamp, so a stale encoding is never reused
+        stamp = self._stamp
+        encoded = fast_json.dumps(self.to_dict())
+        object.__setattr__(self, "_json", (stamp, encoded))
+        return encoded
+
+    def copy_from(self, other: "Appointment") -> None:
+        """Take every field from `other`, keeping this object (and references to it) alive."""
+        for name in self.FIELDS:
+            setattr(self, name, getattr(other, name))
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Appointment":
+        appointment = cls(
+            patient_name=data["patient_name"],
+            phone=data["phone"],
+            appointment_time=data["appointment_time"],
+            provider=data["provider"],
+            appointment_type=data["appointment_type"],
+            confirmation_status=data.get("original_confirmation") or "Not Confirmed",
+            appointment_id=data["id"]
+        )
+        appointment.appointment_date = _intern(data.get("appointment_date"))
+        appointment.status = AppointmentStatus(data.get("status") or AppointmentStatus.NOT_CONFIRMED)
+        appointment.call_sid = data.get("call_sid")
+        if data.get("last_called"):
+            appointment.last_called = datetime.fromisoformat(data["last_called"])
+        appointment.call_attempts = data.get("call_attempts") or 0
+        appointment.notes = data.get("notes") or ""
+        appointment.last_answered_by = data.get("last_answered_by")
+        appointment.needs_callback = bool(data.get("needs_callback"))
+        appointment.caller_id = data.get("caller_id")
+        appointment.version = data.get("version") or 0
+        return appointment
+
+def _check_transition(appointment: Appointment, changes: Dict[str, Any]) -> None:
+    if "status" in changes and not can_transition(appointment.status, changes["status"]):
+        raise InvalidTransition(f"{appointment.id}: {appointment.status} -> {changes['status']}")
+
 class AppointmentStore:
+    """In-process appointment store, and the interface every store backend implements.
+
+    Appointments change only through `update()`: read a snapshot, compute the
+    changes, then `compare_and_swap()` them in against the snapshot's version,
+    retrying if another writer got there first. Nobody holds a lock while
+    deciding what to change, status moves are checked against
+    ALLOWED_TRANSITIONS, and a shared backend can apply the same swap as a
+    conditional write.
+    """
     def __init__(self):
         self.appointments: Dict[str, Appointment] = {}
         self.call_to_appointment: Dict[str, str] = {}
+        # Calls that cover several appointments on one shared phone number
+        self.call_to_household: Dict[str, List[str]] = {}
+        self._listeners: List[Callable[[str], None]] = []
+        self._lock = threading.Lock()
+        # Ended calls in the order they ended -> when their mapping may be dropped (monotonic)
+        self._finished_calls: "OrderedDict[str, float]" = OrderedDict()
+        self.evicted_calls = 0
+    
+    def add_listener(self, listener: Callable[[str], None]) -> None:
+        """Register a callback invoked with the appointment ID whenever `touch()` reports a change."""
+        self._listeners.append(listener)
+    
+    def touch(self, appointment_id: str) -> None:
+        for listener in self._listeners:
+            try:
+                listener(appointment_id)
+            except Exception as e:
+                logger.error(f"Appointment change listener failed for {appointment_id}: {e}")
+    
+    def compare_and_swap(self, appointment_id: str, expected_version: int, changes: Dict[str, Any]) -> bool:
+        """Apply `changes` (attribute -> value) only if the appointment is still at `expected_version`.
+        
+        Returns False if it is unknown or has moved on; raises InvalidTransition
+        for a status change the state machine does not allow.
+        """
+        with self._lock:
+            # The only critical section: a version check and a few attribute writes
+            appointment = self.appointments.get(appointment_id)
+            if appointment is None or appointment.version != expected_version:
+                return False
+            _check_transition(appointment, changes)
+            for field, value in changes.items():
+                setattr(appointment, field, value)
+            appointment.version += 1
+        self.touch(appointment_id)
+        return True
+    
+    def update(self, appointment_id: str, mutate: Callable[[Appointment], Optional[Dict[str, Any]]],
+               attempts: int = 10) -> Optional[Dict[str, Any]]:
+        """Optimistically change an appointment.
+        
+        `mutate` gets the current appointment (which it must not modify) and
+        returns the changes to make, or None to leave it alone. It is re-run on
+        a fresh read if another writer wins the race. Returns the changes that
+        were applied, or None if nothing was.
+        """
+        for _ in range(attempts):
+            appointment = self.get_appointment(appointment_id)
+            if appointment is None:
+                return None
+            version = appointment.version
+            changes = mutate(appointment)
+            if not changes:
+                return None
+            if "status" in changes and not can_transition(appointment.status, changes["status"]):
+                logger.info(f"Ignoring {appointment.status} -> {changes['status']} for {appointment_id}")
+                return None
+            if self.compare_and_swap(appointment_id, version, changes):
+                return changes
+        logger.warning(f"Gave up updating {appointment_id} after {attempts} conflicting writes")
+        return None
+    
+    def compare_and_set_status(self, appointment_id: str, expected: Optional[List[AppointmentStatus]],
+                               status: AppointmentStatus) -> bool:
+        """Set the status only if it is currently one of `expected` (None accepts any).
+        Returns False if the appointment is unknown, was already moved on, or may not make that move."""
+        return self.update(
+            appointment_id,
+            lambda apt: {"status": status} if expected is None or apt.status in expected else None
+        ) is not None
+    
+    def sync(self) -> None:
+        """Pick up changes made by other processes; nothing to do in memory."""
+    
+    async def watch(self) -> None:
+        """Background task that keeps this process in step with shared state; not needed in memory."""
     
     def add_appointment(self, appointment: Appointment) -> None:
         self.appointments[appointment.id] = appointment
@@ -94,22 +290,81 @@ class AppointmentStore:
             return self.appointments.get(appointment_id)
         return None
     
+    def get_appointments_by_call_sid(self, call_sid: str) -> List[Appointment]:
+        """Every appointment a call covers: one normally, several for a household call."""
+        appointment_ids = self.call_to_household.get(call_sid)
+        if appointment_ids is None:
+            appointment = self.get_appointment_by_call_sid(call_sid)
+            return [appointment] if appointment else []
+        return [self.appointments[apt_id] for apt_id in appointment_ids if apt_id in self.appointments]
+    
+    def appointment_id_for_call(self, call_sid: str) -> Optional[str]:
+        return self.call_to_appointment.get(call_sid)
+    
     def update_appointment_status(self, appointment_id: str, status: AppointmentStatus) -> bool:
-        if appointment_id in self.appointments:
-            self.appointments[appointment_id].status = status
-            return True
-        return False
+        return self.compare_and_set_status(appointment_id, None, status)
     
     def map_call_to_appointment(self, call_sid: str, appointment_id: str) -> None:
         self.call_to_appointment[call_sid] = appointment_id
-        if appointment_id in self.appointments:
-            self.appointments[appointment_id].call_sid = call_sid
+        self._set_call_sid(appointment_id, call_sid)
+    
+    def map_call_to_household(self, call_sid: str, appointment_ids: List[str]) -> None:
+        self.call_to_household[call_sid] = list(appointment_ids)
+        self.call_to_appointment[call_sid] = appointment_ids[0]
+        for appointment_id in appointment_ids:
+            self._set_call_sid(appointment_id, call_sid)
+    
+    def _set_call_sid(self, appointment_id: str, call_sid: str) -> None:
+        # A versioned write like any other, so a compare-and-swap racing it retries instead of undoing it
+        self.update(appointment_id, lambda apt: {"call_sid": call_sid} if apt.call_sid != call_sid else None)
     
     def get_all_appointments(self) -> List[Appointment]:
         return list(self.appointments.values())
     
+    def finish_call(self, call_sid: str) -> None:
+        """Note that a call has ended. Its mapping is kept CALL_MAPPING_TTL_SECONDS for late or
+        retried callbacks, then dropped, so the maps only hold recent calls."""
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            self._finished_calls.pop(call_sid, None)
+            self._finished_calls[call_sid] = now + settings.CALL_MAPPING_TTL_SECONDS
+            # One TTL for every entry, so the oldest is always first
+            while self._finished_calls:
+                sid, expires = next(iter(self._finished_calls.items()))
+                if expires > now:
+                    break
+                del self._finished_calls[sid]
+                expired.append(sid)
+        if expired:
+            self._forget_calls(expired)
+    
+    def _forget_calls(self, call_sids: List[str]) -> None:
+        for call_sid in call_sids:
+            self.call_to_appointment.pop(call_sid, None)
+            self.call_to_household.pop(call_sid, None)
+        self.evicted_calls += len(call_sids)
+    
+    def get_stats(self) -> Dict:
+        return {
+            "appointments": len(self.appointments),
+            "call_mappings": len(self.call_to_appointment),
+            "household_calls": len(self.call_to_household),
+            "finished_calls_pending_eviction": len(self._finished_calls),
+            "evicted_calls": self.evicted_calls,
+        }
+    
     def clear_all(self) -> None:
         self.appointments.clear()
         self.call_to_appointment.clear()
+        self.call_to_household.clear()
+        self._finished_calls.clear()
+
+def _create_store() -> AppointmentStore:
+    if settings.APPOINTMENT_STORE == "sqlite":
+        # Shared by every worker process on this host
+        from shared_store import SQLiteAppointmentStore  # type: ignore
+        return SQLiteAppointmentStore()
+    return AppointmentStore()
 
-appointment_store = AppointmentStore()
\ No newline at end of file
+appointment_store = _create_store()
\ No newline at end of file
@@ -0,0 +1,260 @@
+"""Replay a captured webhook journal against this build and diff the outcome.
+
+Capture on a live server with WEBHOOK_CAPTURE_PATH=/path/journal.jsonl: each
+worker appends every /twilio/ webhook (PHI tokenized), every call it places
+and every appointment status change. This tool starts the current build (as
+bench_webhooks.py does, on the shared SQLite store), then re-drives the
+journal on the original timeline, scaled by --speed:
+
+    - each captured call is registered in the shared store at its moment, the
+      same way TwilioService.make_call does after dialing;
+    - each webhook is re-sent with its original form, its call context and
+      X-Twilio-Signature re-signed for the replay server.
+
+Afterwards it compares every appointment's final status and call_attempts
+with the last state the journal recorded, and the server-side latency per
+webhook path with what was captured (the replay server journals too, so both
+sides are measured the same way). Exits 1 on a state mismatch or new errors.
+
+    python replay_webhooks.py journal.jsonl [more.jsonl ...] [--speed 10] [--max-idle 5] [--report out.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import bench_webhooks
+
+CONTEXT_FIELDS = ("apt", "attempt", "item", "cid", "sig")
+
+
+def load(paths: List[str]) -> Tuple[List[Dict], List[Dict], Dict[str, Dict]]:
+    """Calls and webhooks in arrival order, and the last recorded state of each appointment."""
+    calls, webhooks, states = [], [], {}
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if event["type"] == "call":
+                    calls.append(event)
+                elif event["type"] == "webhook":
+                    webhooks.append(event)
+                elif event["type"] == "state":
+                    if event["id"] not in states or states[event["id"]]["t"] <= event["t"]:
+                        states[event["id"]] = event
+    calls.sort(key=lambda e: e["t"])
+    webhooks.sort(key=lambda e: e["t"])
+    return calls, webhooks, states
+
+
+def timeline(calls: List[Dict], webhooks: List[Dict], speed: float, max_idle: Optional[float]) -> None:
+    """Give every event an offset `at` (seconds from the start of replay), squeezing idle gaps."""
+    events = sorted(calls + webhooks, key=lambda e: e["t"])
+    at, previous = 0.0, None
+    for event in events:
+        if previous is not None:
+            gap = event["t"] - previous
+            at += min(gap, max_idle) if max_idle is not None else gap
+        event["at"] = at / speed
+        previous = event["t"]
+
+
+def build_request(event: Dict, base_url: str) -> Tuple[str, Dict, Dict]:
+    from twilio.request_validator import RequestValidator
+    from services.call_context import CallContext
+
+    query = event["query"]
+    params = {k: v for k, v in query.items() if k not in CONTEXT_FIELDS}
+    signed = ""
+    if query.get("apt"):
+        context = CallContext(query["apt"].split(","), int(query.get("attempt") or 1),
+                              int(query.get("item") or 0), query.get("cid") or None)
+        signed = context.query()
+    elif "attempt" in query or "item" in query:
+        params.update({k: query[k] for k in ("attempt", "item") if k in query})
+    parts = [part for part in (signed, urlencode(params)) if part]
+    url = f"{base_url}{event['path']}" + (f"?{'&'.join(parts)}" if parts else "")
+    headers = dict(event.get("headers") or {})
+    headers.pop("content-type", None)
+    headers["X-Twilio-Signature"] = RequestValidator(bench_webhooks.AUTH_TOKEN).compute_signature(url, event["form"])
+    return url, event["form"], headers
+
+
+def replay(calls: List[Dict], webhooks: List[Dict], base_url: str, concurrency: int) -> List[Dict]:
+    import requests
+    from models import Appointment, appointment_store
+    from services.twilio_client import twilio_service
+
+    # A webhook may only go once every call placed before it is registered
+    calls_before = []
+    n = 0
+    for event in webhooks:
+        while n < len(calls) and calls[n]["at"] <= event["at"]:
+            n += 1
+        calls_before.append(n)
+    registered = [0]
+    ready = threading.Condition()
+    start = time.perf_counter() + 0.5
+    results: List[Dict] = []
+    lock = threading.Lock()
+    cursor = iter(range(len(webhooks)))
+
+    def sequencer():
+        for event in calls:
+            delay = start + event["at"] - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            appointments = []
+            for data in event["appointments"]:
+                if appointment_store.get_appointment(data["id"]) is None:
+                    appointment_store.add_appointment(Appointment.from_dict(data))
+                appointments.append(appointment_store.get_appointment(data["id"]))
+            twilio_service.register_call(event["call_sid"], appointments, event["from"])
+            with ready:
+                registered[0] += 1
+                ready.notify_all()
+
+    def worker():
+        session = requests.Session()
+        local = []
+        while True:
+            with lock:
+                n = next(cursor, None)
+            if n is None:
+                break
+            event = webhooks[n]
+            url, form, headers = build_request(event, base_url)
+            scheduled = start + event["at"]
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            with ready:
+                ready.wait_for(lambda: registered[0] >= calls_before[n])
+            try:
+                status = session.post(url, data=form, headers=headers, timeout=30).status_code
+            except requests.RequestException:
+                status = 0
+            local.append({"path": event["path"], "status": status, "captured_status": event.get("status"),
+                          "client_ms": (time.perf_counter() - scheduled) * 1000})
+        with lock:
+            results.extend(local)
+
+    threads = [threading.Thread(target=sequencer)] + [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    pick = lambda fraction: ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+    return {"count": len(ordered), "p50_ms": round(statistics.median(ordered), 2),
+            "p95_ms": round(pick(0.95), 2), "p99_ms": round(pick(0.99), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("journals", nargs="+")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay this many times faster than captured")
+    parser.add_argument("--max-idle", type=float, default=None, help="cap quiet gaps at this many captured seconds")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--report", help="write the comparison here as JSON")
+    args = parser.parse_args()
+    report_path = os.path.abspath(args.report) if args.report else None
+
+    calls, webhooks, expected = load(args.journals)
+    if not webhooks:
+        sys.exit("Journal has no webhooks")
+    timeline(calls, webhooks, args.speed, args.max_idle)
+    print(f"{len(webhooks)} webhooks and {len(calls)} calls over {webhooks[-1]['at']:.1f}s of replay")
+
+    server_args = argparse.Namespace(store="sqlite", appointments=0)
+    # Retries would dial from the replay server; the journal already holds the calls that were placed
+    # The replay server journals into its own working directory, to measure latency the way the capture did
+    proc, base_url, workdir = bench_webhooks.start_server(
+        server_args, MAX_CALL_ATTEMPTS="1", WEBHOOK_CAPTURE_PATH="replay.jsonl"
+    )
+    print(f"Replaying against {base_url} (logs in {workdir})")
+
+    # Share the server's store: same working directory, nothing journaled from this side
+    os.chdir(workdir)
+    sys.path.insert(0, bench_webhooks.BACKEND)
+    os.environ.update(APPOINTMENT_STORE="sqlite", TWILIO_AUTH_TOKEN=bench_webhooks.AUTH_TOKEN, BASE_URL=base_url,
+                      WEBHOOK_CAPTURE_PATH="", TWILIO_API_BASE_URL="http://127.0.0.1:9")
+    import logging
+    logging.disable(logging.WARNING)
+    try:
+        started = time.perf_counter()
+        results = replay(calls, webhooks, base_url, args.concurrency)
+        elapsed = time.perf_counter() - started
+        time.sleep(1.0)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+    from models import appointment_store
+    appointment_store.sync()
+    replayable = {apt["id"] for call in calls for apt in call["appointments"]}
+    mismatches = []
+    for apt_id, state in sorted(expected.items()):
+        if apt_id not in replayable:
+            continue
+        apt = appointment_store.get_appointment(apt_id)
+        got = (apt.status.value, apt.call_attempts) if apt else (None, None)
+        if got != (state["status"], state["call_attempts"]):
+            mismatches.append({"id": apt_id, "expected": [state["status"], state["call_attempts"]], "got": list(got)})
+
+    new_errors = [r for r in results if r["status"] >= 400 or r["status"] == 0]
+    new_errors = [r for r in new_errors if (r["captured_status"] or 200) < 400]
+    _, replayed, _ = load(["replay.jsonl"]) if os.path.exists("replay.jsonl") else ([], [], {})
+    captured_ms, replay_ms, client_ms = defaultdict(list), defaultdict(list), defaultdict(list)
+    for event in webhooks:
+        captured_ms[event["path"]].append(event["ms"])
+    for event in replayed:
+        replay_ms[event["path"]].append(event["ms"])
+    for result in results:
+        client_ms[result["path"]].append(result["client_ms"])
+    latency = {
+        path: {"captured": percentiles(captured_ms[path]), "replay": percentiles(replay_ms[path]),
+               "replay_client": percentiles(client_ms[path])}
+        for path in sorted(captured_ms)
+    }
+
+    print(f"\nReplayed in {elapsed:.1f}s ({len(results) / elapsed:.1f} webhooks/s)")
+    print(f"  {'path':<20} {'count':>6} {'captured p50/p95/p99 (ms)':>28} {'replay p50/p95/p99 (ms)':>28}")
+    for path, row in latency.items():
+        def cell(stats):
+            return f"{stats['p50_ms']:.1f} / {stats['p95_ms']:.1f} / {stats['p99_ms']:.1f}" if stats else "-"
+        print(f"  {path:<20} {row['captured'].get('count', 0):>6} {cell(row['captured']):>28} {cell(row['replay']):>28}")
+    checked = len([apt_id for apt_id in expected if apt_id in replayable])
+    print(f"\nAppointment states: {checked - len(mismatches)}/{checked} match the capture"
+          + (f" ({len(expected) - checked} not replayable: called before capture started)"
+             if len(expected) > checked else ""))
+    for mismatch in mismatches[:20]:
+        print(f"  MISMATCH {mismatch['id']}: expected {mismatch['expected']}, got {mismatch['got']}")
+    if new_errors:
+        print(f"  {len(new_errors)} webhooks failed that succeeded when captured")
+
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump({"webhooks": len(results), "elapsed": elapsed, "latency": latency,
+                       "states_checked": checked, "mismatches": mismatches, "new_errors": len(new_errors)}, f, indent=2)
+    if mismatches or new_errors:
+        sys.exit(1)
+    print("OK: replay matches the capture")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import hmac
+import logging
+from typing import Optional, Set
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from fastapi.routing import APIRoute
+
+from services.profiler import (
+    MAX_PROFILE_SECONDS, PARSER_TARGET, ProfilerBusy, collapsed, profiler, pstats_dump, pstats_text,
+)
+from settings import settings
+from utils.request_timing import TimedRoute
+
+logger = logging.getLogger(__name__)
+
+
+def require_admin(authorization: str = Header("")):
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are off; set ADMIN_TOKEN to use them")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), settings.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+
+
+router = APIRouter(prefix="/api/admin", route_class=TimedRoute, dependencies=[Depends(require_admin)])
+
+
+def _route_paths(request: Request) -> Set[str]:
+    return {route.path for route in request.app.routes if isinstance(route, TimedRoute)}
+
+
+def _check_target(request: Request, target: str) -> None:
+    if target != PARSER_TARGET and target not in _route_paths(request):
+        raise HTTPException(status_code=400, detail=f"Unknown target {target!r}: use a route path or {PARSER_TARGET!r}")
+
+
+def _target_codes(request: Request, target: str):
+    if target == PARSER_TARGET:
+        from services.pdf_parser import PracticeFusionParser
+        return {PracticeFusionParser.parse_pdf.__code__}
+    # Every method on the path; the endpoint's frame is on the stack only while it runs
+    return {route.endpoint.__code__ for route in request.app.routes
+            if isinstance(route, APIRoute) and route.path == target}
+
+
+@router.get("/profile")
+async def get_profile_status(request: Request):
+    return JSONResponse(content={
+        **profiler.get_status(),
+        "targets": [PARSER_TARGET] + sorted(_route_paths(request)),
+        "max_seconds": MAX_PROFILE_SECONDS,
+    })
+
+
+@router.post("/profile/sample")
+async def sample_profile(
+    request: Request,
+    seconds: float = Query(10, gt=0, le=MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=1000),
+    target: Optional[str] = Query(None),
+):
+    """Sample stacks for `seconds`; collapsed stacks for flamegraph.pl or speedscope.
+
+    With a target (a route path, or "parser") only stacks inside it count.
+    """
+    if target:
+        _check_target(request, target)
+    logger.info(f"Sampling profile for {seconds}s (target: {target or 'all threads'})")
+    try:
+        counts = await profiler.sample(seconds, interval_ms / 1000, target,
+                                       _target_codes(request, target) if target else None)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(collapsed(counts))
+
+
+@router.post("/profile/cprofile")
+async def cprofile_target(
+    request: Request,
+    target: str = Query(...),
+    seconds: float = Query(30, gt=0, le=MAX_PROFILE_SECONDS),
+    format: str = Query("pstats", pattern="^(pstats|text)$"),
+):
+    """cProfile every request to `target` (a route path, or "parser") for `seconds`.
+
+    Returns a pstats file (`python -m pstats`, snakeviz) or the top functions by cumulative time.
+    """
+    _check_target(request, target)
+    logger.info(f"cProfile on {target} for {seconds}s")
+    try:
+        session = await profiler.cprofile(target, seconds)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    stats = session.stats()
+    if stats is None:
+        raise HTTPException(status_code=404, detail=f"No requests reached {target} in {seconds}s")
+    headers = {"X-Profiled-Requests": str(session.requests)}
+    if format == "text":
+        return PlainTextResponse(pstats_text(stats), headers=headers)
+    headers["Content-Disposition"] = 'attachment; filename="profile.pstats"'
+    return Response(pstats_dump(stats), media_type="application/octet-stream", headers=headers)
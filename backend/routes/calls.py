@@ -1,11 +1,19 @@
-from fastapi import APIRouter, HTTPException, Form, Response, Query
+from fastapi import APIRouter, HTTPException, Form, Request, Response, Query
 from fastapi.responses import JSONResponse
 from twilio.twiml.voice_response import VoiceResponse
 from typing import Optional, List
 from pydantic import BaseModel
+import asyncio
 import logging
 from services.twilio_client import twilio_service
+from services.twiml_templates import twiml_templates
+from services.call_context import CallContext
 from services.call_queue import call_queue
+from services.retry_scheduler import retry_scheduler
+from services.number_pool import number_pool
+from services.webhook_dedupe import status_dedupe
+from services.call_timeline import call_timeline
+from utils.twilio_auth import TwilioRoute
 from models import appointment_store, AppointmentStatus
 from settings import settings
 
@@ -15,15 +23,29 @@ class CallRequest(BaseModel):
 class BatchCallRequest(BaseModel):
     appointment_ids: List[str]
     override_window: bool = False
+    name: Optional[str] = None
+
+class CampaignRequest(BaseModel):
+    name: str
+    appointment_ids: List[str]
+    override_window: bool = False
+    weight: int = 1
+
+class CampaignCallsRequest(BaseModel):
+    appointment_ids: List[str]
+    override_window: bool = False
 
 logger = logging.getLogger(__name__)
-router = APIRouter()
+router = APIRouter(route_class=TwilioRoute)
 
 @router.post("/api/call/{appointment_id}")
 async def initiate_call(appointment_id: str, request: CallRequest = CallRequest()):
     override = request.override_window
     logger.info(f"Call request: appointment_id={appointment_id}, override_window={override}")
     
+    if call_queue.draining:
+        raise HTTPException(status_code=503, detail="Server is shutting down; try again once it is back")
+
     if not settings.validate():
         raise HTTPException(status_code=500, detail="Twilio configuration incomplete. Please check your .env file.")
     
@@ -36,10 +58,18 @@ async def initiate_call(appointment_id: str, request: CallRequest = CallRequest(
     if appointment.status in [AppointmentStatus.CONFIRMED, AppointmentStatus.CANCELLED, AppointmentStatus.DO_NOT_CALL]:
         raise HTTPException(status_code=400, detail=f"Cannot call appointment with status: {appointment.status}")
     
+    # Caller IDs are paced to NUMBER_CALLS_PER_SECOND; wait out the pacing (a second or so) instead of failing
+    wait = number_pool.next_slot_in()
+    if wait is None and number_pool.numbers:
+        raise HTTPException(status_code=503, detail="Every caller ID is on a call; try again when one ends")
+    if wait:
+        await asyncio.sleep(wait)
+
     try:
         call_sid = twilio_service.make_call(appointment, override_window=override)
         
         if call_sid:
+            call_queue.track_call(call_sid)
             message = "Call initiated successfully."
             return JSONResponse(content={
                 "success": True,
@@ -54,33 +84,47 @@ async def initiate_call(appointment_id: str, request: CallRequest = CallRequest(
 
 @router.post("/twilio/voice")
 async def handle_voice(
+    request: Request,
     CallSid: str = Form(None),
     From: str = Form(None),
     To: str = Form(None),
     CallStatus: str = Form(None),
     AnsweredBy: Optional[str] = Form(None),
-    attempt: Optional[str] = Form(None)
+    attempt: Optional[str] = Form(None),
+    attempt_param: Optional[str] = Query(None, alias="attempt"),
+    item: Optional[int] = Query(None)
 ):
     try:
         logger.info(f"Voice webhook: CallSid={CallSid}, Status={CallStatus}, AnsweredBy={AnsweredBy}, Attempt={attempt}")
         
-        # Check if this is a repeat attempt
+        # Check if this is a repeat attempt (our own redirects pass it on the query string)
+        context = CallContext.from_query(request.query_params)
+        if context:
+            attempt, item = str(context.attempt), context.item
+        attempt = attempt or attempt_param
         attempt_num = int(attempt) if attempt else 1
+        call_timeline.record(CallSid, "voice", f"{attempt_num}/{item or 0}")
+        if AnsweredBy:
+            call_timeline.record(CallSid, "answered_by", AnsweredBy)
         
-        # Map the call to appointment immediately when voice webhook is called
-        appointment = appointment_store.get_appointment_by_call_sid(CallSid)
+        # Signed context names the appointments, so this works on any worker
+        household = twilio_service.resolve_appointments(CallSid, context)
+        appointment = household[0] if household else None
         
-        if AnsweredBy in ["machine_end_beep", "machine_end_silence", "machine_end_other", "machine_start", "fax"]:
+        if len(household) > 1:
+            # Shared phone number: one call walks through each appointment's menu
+            if AnsweredBy in ["machine_end_beep", "machine_end_silence", "machine_end_other", "machine_start", "fax"]:
+                twiml = twilio_service.generate_household_voicemail_twiml(household)
+            else:
+                twiml = twilio_service.generate_household_twiml(household, item or 0, attempt_num, context)
+        elif AnsweredBy in ["machine_end_beep", "machine_end_silence", "machine_end_other", "machine_start", "fax"]:
             # Detected voicemail: play a concise one-shot voicemail message and hang up
             twiml = twilio_service.generate_voicemail_twiml(appointment)
         elif attempt_num > 3:
             # After 3 attempts, hang up
-            response = VoiceResponse()
-            response.say("We'll try again later. Goodbye.", voice="alice")
-            response.hangup()
-            twiml = str(response)
+            twiml = twiml_templates.give_up()
         else:
-            twiml = twilio_service.generate_initial_twiml(appointment, attempt_num)
+            twiml = twilio_service.generate_initial_twiml(appointment, attempt_num, context)
         
         return Response(content=twiml, media_type="application/xml")
     except Exception as e:
@@ -93,38 +137,55 @@ async def handle_voice(
 
 @router.post("/twilio/gather")
 async def handle_gather(
+    request: Request,
     Digits: str = Form(None),
     CallSid: str = Form(...),
     From: str = Form(None),
-    To: str = Form(None)
+    To: str = Form(None),
+    item: Optional[int] = Query(None)
 ):
     logger.info(f"Gather webhook called: CallSid={CallSid}, Digits='{Digits}'")
+    call_timeline.record(CallSid, "gather", Digits)
+    context = CallContext.from_query(request.query_params)
     
     # Handle case where no digits were pressed
     if not Digits or Digits == "":
         logger.info("No digits received, redirecting to voice menu")
         # Redirect back to voice menu for another attempt
-        response = VoiceResponse()
-        response.redirect(f"{settings.BASE_URL}/twilio/voice?attempt=2", method="POST")
-        twiml = str(response)
+        twiml = twiml_templates.no_digits(context, item)
     else:
         logger.info(f"Processing digit: {Digits}")
-        twiml = twilio_service.handle_gather(Digits, CallSid)
+        twiml = twilio_service.handle_gather(Digits, CallSid, item, context)
     
     return Response(content=twiml, media_type="application/xml")
 
 @router.post("/twilio/status")
 async def handle_status(
+    request: Request,
     CallSid: str = Form(...),
     CallStatus: str = Form(...),
     AnsweredBy: Optional[str] = Form(None),
     From: str = Form(None),
     To: str = Form(None),
-    CallDuration: Optional[str] = Form(None)
+    CallDuration: Optional[str] = Form(None),
+    SequenceNumber: Optional[str] = Form(None)
 ):
+    # Twilio retries callbacks it thinks failed; only the first copy of each event is processed
+    key = (CallSid, CallStatus, SequenceNumber)
+    if status_dedupe.seen(key):
+        logger.info(f"Duplicate status webhook ignored: CallSid={CallSid}, Status={CallStatus}, Seq={SequenceNumber}")
+        return Response(content="", status_code=200)
+    
     logger.info(f"Status webhook: CallSid={CallSid}, Status={CallStatus}, AnsweredBy={AnsweredBy}")
+    call_timeline.record(CallSid, CallStatus, CallDuration)
+    if AnsweredBy:
+        call_timeline.record(CallSid, "answered_by", AnsweredBy)
     
-    twilio_service.handle_status_callback(CallSid, CallStatus, AnsweredBy)
+    try:
+        twilio_service.handle_status_callback(CallSid, CallStatus, AnsweredBy, CallContext.from_query(request.query_params))
+    except Exception:
+        status_dedupe.forget(key)
+        raise
     # Advancing the queue is handled inside TwilioService after updating statuses
     
     return Response(content="", status_code=200)
@@ -133,7 +194,7 @@ async def handle_status(
 async def start_batch_call(request: BatchCallRequest):
     if not request.appointment_ids:
         raise HTTPException(status_code=400, detail="No appointments provided")
-    status = call_queue.start_batch(request.appointment_ids, request.override_window)
+    status = call_queue.start_batch(request.appointment_ids, request.override_window, request.name)
     return JSONResponse(content=status)
 
 @router.get("/api/calls/batch-status")
@@ -144,6 +205,78 @@ async def get_batch_status():
 async def cancel_batch():
     return JSONResponse(content=call_queue.cancel())
 
+@router.get("/api/campaigns")
+async def list_campaigns():
+    return JSONResponse(content=call_queue.list_campaigns())
+
+@router.post("/api/campaigns")
+async def create_campaign(request: CampaignRequest):
+    if not request.appointment_ids:
+        raise HTTPException(status_code=400, detail="No appointments provided")
+    campaign = call_queue.create_campaign(request.name, request.appointment_ids, request.override_window, request.weight)
+    return JSONResponse(content=campaign)
+
+@router.get("/api/campaigns/{campaign_id}")
+async def get_campaign(campaign_id: str):
+    return JSONResponse(content=_campaign_action(call_queue.get_campaign, campaign_id))
+
+@router.post("/api/campaigns/{campaign_id}/calls")
+async def add_campaign_calls(campaign_id: str, request: CampaignCallsRequest):
+    try:
+        campaign = call_queue.add_calls(campaign_id, request.appointment_ids, request.override_window)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Campaign not found or no longer open")
+    return JSONResponse(content=campaign)
+
+@router.post("/api/campaigns/{campaign_id}/pause")
+async def pause_campaign(campaign_id: str):
+    return JSONResponse(content=_campaign_action(call_queue.pause, campaign_id))
+
+@router.post("/api/campaigns/{campaign_id}/resume")
+async def resume_campaign(campaign_id: str):
+    return JSONResponse(content=_campaign_action(call_queue.resume, campaign_id))
+
+@router.post("/api/campaigns/{campaign_id}/cancel")
+async def cancel_campaign(campaign_id: str):
+    return JSONResponse(content=_campaign_action(call_queue.cancel_campaign, campaign_id))
+
+@router.get("/api/campaigns/{campaign_id}/errors")
+async def get_campaign_errors(campaign_id: str, offset: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
+    return JSONResponse(content=_campaign_action(lambda cid: call_queue.get_errors(cid, offset, limit), campaign_id))
+
+@router.get("/api/calls/errors")
+async def get_call_errors(offset: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
+    return JSONResponse(content=call_queue.get_errors(None, offset, limit))
+
+def _campaign_action(action, campaign_id: str):
+    try:
+        return action(campaign_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+
+@router.get("/api/numbers")
+async def get_number_metrics():
+    return JSONResponse(content=number_pool.get_metrics())
+
+@router.get("/api/calls/retries")
+async def get_retry_status():
+    return JSONResponse(content=retry_scheduler.get_status())
+
+@router.get("/api/calls/timeline-stats")
+async def get_timeline_stats(hours: float = Query(24, gt=0, le=24 * 31)):
+    return JSONResponse(content=call_timeline.get_stats(hours))
+
+@router.get("/api/calls/{call_sid}/timeline")
+async def get_call_timeline(call_sid: str):
+    timeline = call_timeline.get_timeline(call_sid)
+    if timeline is None:
+        raise HTTPException(status_code=404, detail="No timeline for this call")
+    return JSONResponse(content=timeline)
+
+@router.get("/api/webhooks/dedupe")
+async def get_dedupe_stats():
+    return JSONResponse(content=status_dedupe.get_stats())
+
 @router.post("/twilio/dial-status")
 async def handle_dial_status(
     DialCallStatus: str = Form(...),
@@ -151,16 +284,6 @@ async def handle_dial_status(
     DialCallSid: Optional[str] = Form(None)
 ):
     logger.info(f"Dial status: CallSid={CallSid}, DialStatus={DialCallStatus}")
+    call_timeline.record(CallSid, "dial", DialCallStatus)
     
-    response = VoiceResponse()
-    
-    if DialCallStatus != "completed":
-        response.say(
-            "We were unable to connect you at this time. "
-            "Please call our office directly. Goodbye.",
-            voice="alice"
-        )
-    
-    response.hangup()
-    
-    return Response(content=str(response), media_type="application/xml")
\ No newline at end of file
+    return Response(content=twiml_templates.dial_status(DialCallStatus), media_type="application/xml")
\ No newline at end of file
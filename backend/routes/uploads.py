@@ -1,15 +1,18 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi.responses import JSONResponse, Response
 import os
 import shutil
-from typing import List, Dict
 import logging
 from services.pdf_parser import PracticeFusionParser
-from models import appointment_store
+from models import appointment_store, appointments_json
+from utils import fast_json
+from services.retry_scheduler import retry_scheduler
+from services.twiml_templates import twiml_templates
 from settings import settings
+from utils.request_timing import TimedRoute
 
 logger = logging.getLogger(__name__)
-router = APIRouter(prefix="/api", tags=["uploads"])
+router = APIRouter(prefix="/api", tags=["uploads"], route_class=TimedRoute)
 
 os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
 
@@ -38,6 +41,8 @@ async def upload_pdf(file: UploadFile = File(...)):
         appointments = parser.parse_pdf(file_path)
 
         appointment_store.clear_all()
+        retry_scheduler.clear()
+        twiml_templates.clear()
 
         for appointment in appointments:
             appointment_store.add_appointment(appointment)
@@ -62,6 +67,22 @@ async def upload_pdf(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail="Failed to process PDF")
 
 @router.get("/appointments")
-async def get_appointments() -> List[Dict]:
+async def get_appointments():
+    # Pre-encoded: each appointment's JSON is cached until it changes
+    return Response(content=appointments_json(appointment_store.get_all_appointments()), media_type="application/json")
+
+
+@router.get("/appointments/page")
+async def get_appointments_page(offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    """One slice of the list for the dashboard's table, with the list's total length."""
     appointments = appointment_store.get_all_appointments()
-    return [apt.to_dict() for apt in appointments]
\ No newline at end of file
+    page = appointments[offset:offset + limit]
+    body = b'{"total":%d,"offset":%d,"items":%s}' % (len(appointments), offset, appointments_json(page))
+    return Response(content=body, media_type="application/json")
+
+
+@router.get("/appointments/ids")
+async def get_appointment_ids():
+    # For "select all" without fetching every row
+    return Response(content=fast_json.dumps([apt.id for apt in appointment_store.get_all_appointments()]),
+                    media_type="application/json")
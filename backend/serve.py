@@ -0,0 +1,103 @@
+"""Production launcher: uvicorn without the reloader, draining calls before it exits.
+
+The first Ctrl+C (or SIGTERM, or Ctrl+Break on Windows) stops new dials but
+keeps the server answering, so calls already up still get their status
+webhooks. The process exits once those calls have ended or
+DRAIN_TIMEOUT_SECONDS have passed; a second Ctrl+C skips the wait. Queued
+jobs, and any call still up at exit, stay in the job table and are picked
+up by CallQueue.recover() on the next start.
+
+    python serve.py [--host 0.0.0.0] [--port 800] [--no-access-log]
+"""
+import argparse
+import importlib.util
+import logging
+import time
+from typing import Optional
+
+import uvicorn
+
+from settings import settings
+from utils import logging_setup
+
+logger = logging.getLogger("serve")
+
+# Seconds between "still waiting" lines while draining
+DRAIN_LOG_SECONDS = 10
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn's server, with a drain between the first exit signal and shutdown."""
+
+    def __init__(self, config: uvicorn.Config) -> None:
+        super().__init__(config)
+        self.drain_started: Optional[float] = None
+        self._next_report = 0.0
+
+    def handle_exit(self, sig, frame) -> None:
+        # On Windows this runs as a plain signal handler: set flags only, log from on_tick
+        if self.drain_started is None:
+            from services.call_queue import call_queue
+            call_queue.begin_drain()
+            self.drain_started = time.monotonic()
+            return
+        super().handle_exit(sig, frame)
+
+    async def on_tick(self, counter: int) -> bool:
+        if self.drain_started is not None and not self.should_exit:
+            self._check_drain()
+        return await super().on_tick(counter)
+
+    def _check_drain(self) -> None:
+        from services.call_queue import call_queue
+        in_flight = call_queue.in_flight_count
+        waited = time.monotonic() - self.drain_started
+        if not in_flight:
+            logger.info(f"Shutdown: no calls in flight after {waited:.0f}s; stopping")
+            self.should_exit = True
+        elif waited >= settings.DRAIN_TIMEOUT_SECONDS:
+            logger.warning(f"Shutdown: {in_flight} calls still in flight after {waited:.0f}s; "
+                           f"stopping anyway, they are re-attached on the next start")
+            self.should_exit = True
+        elif waited >= self._next_report:
+            self._next_report = waited + DRAIN_LOG_SECONDS
+            logger.info(f"Shutdown: no new calls; waiting up to {settings.DRAIN_TIMEOUT_SECONDS}s for "
+                        f"{in_flight} in flight (Ctrl+C again to stop now)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=800)
+    parser.add_argument("--no-access-log", dest="access_log", action="store_false",
+                        help="skip the per-request log line")
+    args = parser.parse_args()
+
+    # Before uvicorn starts: its loggers then have no handlers of their own and go through the same queue
+    logging_setup.configure_logging()
+    config = uvicorn.Config(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        # uvloop and httptools come with uvicorn[standard]; uvloop does not exist on Windows
+        loop="uvloop" if _installed("uvloop") else "asyncio",
+        http="httptools" if _installed("httptools") else "h11",
+        ws="none",
+        lifespan="on",
+        log_config=None,
+        access_log=args.access_log,
+        backlog=2048,
+        # Longer than the dashboard's 3 s poll, so its connection is reused
+        timeout_keep_alive=15,
+        # After the drain, requests still open get this long before the lifespan shutdown runs
+        timeout_graceful_shutdown=10,
+    )
+    DrainingServer(config).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import base64
+import contextvars
+import hashlib
+import hmac
+import logging
+from typing import List, Mapping, Optional
+from urllib.parse import urlencode
+
+from settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Query parameter names carried on every webhook URL we hand to Twilio
+_FIELDS = ("apt", "attempt", "item", "cid")
+_SIG = "sig"
+
+# BASE_URL the webhook being handled was sent to; its follow-up URLs stay on it when BASE_URL changes mid-call
+request_base_url: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_base_url", default=None)
+
+
+def _key() -> bytes:
+    # Every worker reads the same environment, so any of them can verify what another signed
+    return (settings.CALL_CONTEXT_SECRET or settings.TWILIO_AUTH_TOKEN).encode()
+
+
+def _sign(params: Mapping[str, str]) -> str:
+    message = urlencode(sorted((k, params[k]) for k in _FIELDS if k in params)).encode()
+    digest = hmac.new(_key(), message, hashlib.sha256).digest()[:16]
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def can_sign() -> bool:
+    return bool(settings.CALL_CONTEXT_SECRET or settings.TWILIO_AUTH_TOKEN)
+
+
+class CallContext:
+    """What a webhook needs to know about its call, carried on the URL instead of in process memory.
+
+    `make_call` signs the appointment IDs (several for a household call), the
+    menu attempt and item, and the caller ID into the webhook query string, so
+    whichever worker receives the callback can act on it without having placed
+    the call itself.
+    """
+
+    def __init__(self, appointment_ids: List[str], attempt: int = 1, item: int = 0,
+                 caller_id: Optional[str] = None) -> None:
+        self.appointment_ids = list(appointment_ids)
+        self.attempt = attempt
+        self.item = item
+        self.caller_id = caller_id
+
+    def with_(self, attempt: Optional[int] = None, item: Optional[int] = None) -> "CallContext":
+        return CallContext(
+            self.appointment_ids,
+            self.attempt if attempt is None else attempt,
+            self.item if item is None else item,
+            self.caller_id,
+        )
+
+    def query(self) -> str:
+        params = {"apt": ",".join(self.appointment_ids), "attempt": str(self.attempt), "item": str(self.item)}
+        if self.caller_id:
+            params["cid"] = self.caller_id
+        params[_SIG] = _sign(params)
+        return urlencode(params)
+
+    @classmethod
+    def from_query(cls, query: Mapping[str, str]) -> Optional["CallContext"]:
+        """Verified context from a webhook's query parameters; None if absent or tampered with."""
+        signature = query.get(_SIG)
+        if not signature or not query.get("apt"):
+            return None
+        if not can_sign() or not hmac.compare_digest(signature, _sign(query)):
+            logger.warning("Rejected webhook call context with a bad signature")
+            return None
+        try:
+            return cls(
+                query["apt"].split(","),
+                int(query.get("attempt") or 1),
+                int(query.get("item") or 0),
+                query.get("cid") or None,
+            )
+        except ValueError:
+            return None
+
+
+def current_base_url() -> str:
+    return request_base_url.get() or settings.BASE_URL
+
+
+def webhook_url(path: str, context: Optional[CallContext] = None, base: Optional[str] = None, **changes) -> str:
+    """Absolute webhook URL. With a context, `changes` (attempt/item) go into the signed query;
+    without one they are appended as plain parameters, as before signing existed.
+
+    `base` defaults to the base of the webhook being answered, else BASE_URL."""
+    base = base or current_base_url()
+    if context is not None:
+        return f"{base}{path}?{context.with_(**changes).query()}"
+    if changes:
+        return f"{base}{path}?{urlencode(changes)}"
+    return f"{base}{path}"
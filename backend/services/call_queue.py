@@ -1,116 +1,695 @@
+import asyncio
 import logging
-from typing import List, Optional, Dict
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, List, Optional, Dict, Set, Tuple
 
 from models import appointment_store, Appointment, AppointmentStatus
 from settings import settings
-from twilio.rest import Client
 from services.twilio_client import TwilioService
+from services.job_store import job_store, JobState, CallJobRecord
+from services.priority import IndexedHeap, ScoreFunction, default_priority
+from services.number_pool import number_pool
+from services.retry_scheduler import retry_scheduler
+
+if TYPE_CHECKING:
+    from twilio.rest import Client
 
 
 logger = logging.getLogger(__name__)
 
+TERMINAL_CALL_STATUSES = ["completed", "no-answer", "busy", "failed", "canceled", "cancelled"]
+
+# Standing campaign that automatic retries are added to
+RETRY_CAMPAIGN_NAME = "Retries"
+
+# Appointments in these states are never dialed: checked when queued and again when the job is claimed
+UNCALLABLE_STATUSES = [
+    AppointmentStatus.CONFIRMED,
+    AppointmentStatus.CANCELLED,
+    AppointmentStatus.DO_NOT_CALL,
+    AppointmentStatus.CALLING,
+]
+
+# Most recent errors included in status polls; the rest are paged from the errors endpoints
+ERROR_PREVIEW = 20
+
+
+class CampaignState:
+    RUNNING = "running"
+    PAUSED = "paused"
+    CANCELLED = "cancelled"
+    COMPLETE = "complete"
+
+
+class Campaign:
+    """One named batch: its own priority heap of queued jobs and its in-flight calls."""
+
+    def __init__(self, campaign_id: str, name: str, weight: int = 1, override_window: bool = False,
+                 state: str = CampaignState.RUNNING) -> None:
+        self.id = campaign_id
+        self.name = name
+        self.weight = max(int(weight or 1), 1)
+        self.override_window = override_window
+        self.state = state
+        self.heap: IndexedHeap[int] = IndexedHeap()
+        self.positions: Dict[int, int] = {}
+        self.jobs_by_appointment: Dict[str, int] = {}
+        self.households: Dict[str, Set[str]] = {}  # phone -> queued appointment IDs
+        self.in_flight: Dict[str, str] = {}  # call_sid -> appointment_id
+        # Stride scheduling: the campaign with the lowest pass dials next; each dial adds 1/weight
+        self.pass_value: float = 0.0
+        self.closed_at: Optional[datetime] = None
+
+    @property
+    def has_work(self) -> bool:
+        return len(self.heap) > 0
+
+    @property
+    def is_open(self) -> bool:
+        return self.state in (CampaignState.RUNNING, CampaignState.PAUSED)
+
+    @property
+    def held_by_call_window(self) -> bool:
+        # Automatic retries may wait behind other campaigns, so the call window is checked again at dial time
+        return (self.name == RETRY_CAMPAIGN_NAME and not self.override_window
+                and not settings.is_within_call_window())
+
+    def to_dict(self) -> Dict:
+        counts = job_store.counts(self.id)
+        error_count = counts.get(JobState.FAILED.value, 0)
+        _, errors = job_store.errors([self.id], limit=ERROR_PREVIEW) if error_count else (0, [])
+        return {
+            "id": self.id,
+            "name": self.name,
+            "state": self.state,
+            "weight": self.weight,
+            "queued_count": counts.get(JobState.QUEUED.value, 0) + counts.get(JobState.CLAIMED.value, 0),
+            "in_flight_count": len(self.in_flight),
+            "done_count": counts.get(JobState.DONE.value, 0),
+            "cancelled_count": counts.get(JobState.CANCELLED.value, 0),
+            "error_count": error_count,
+            "errors": {e["appointment_id"]: e["error"] for e in errors},
+            "current_appointment_ids": list(self.in_flight.values()),
+        }
+
 
 class CallQueue:
-    def __init__(self) -> None:
-        self._queue: List[str] = []
-        self._override_window: bool = False
-        self._current_call_sid: Optional[str] = None
-        self._current_appointment_id: Optional[str] = None
-        self._active: bool = False
-        self._cancelled: bool = False
-        self._done: List[str] = []
-        self._errors: Dict[str, str] = {}
-
-    def start_batch(self, appointment_ids: List[str], override_window: bool = False) -> Dict:
-        # Filter out invalid or non-callable appointments
-        valid_ids: List[str] = []
-        for apt_id in appointment_ids:
-            apt = appointment_store.get_appointment(apt_id)
-            if not apt:
-                continue
-            if apt.status in [
-                AppointmentStatus.CONFIRMED,
-                AppointmentStatus.CANCELLED,
-                AppointmentStatus.DO_NOT_CALL,
-                AppointmentStatus.CALLING,
-            ]:
-                continue
-            valid_ids.append(apt_id)
+    """Registry of concurrently running call campaigns sharing one dialer.
+
+    Each campaign's queue lives in the `call_jobs` table and the in-memory state
+    only caches it, so a restarted process can rebuild everything with
+    `recover()`. Within a campaign jobs are dialed lowest score first (upload
+    order breaking ties); across campaigns a stride scheduler hands out slots
+    under `MAX_CONCURRENT_CALLS` (and the caller-ID pool's free capacity) in
+    proportion to each campaign's weight.
+    """
+
+    def __init__(self, scorer: ScoreFunction = default_priority) -> None:
+        self._scorer = scorer
+        self._campaigns: Dict[str, Campaign] = {}
+        self._in_flight: Dict[str, str] = {}  # call_sid -> campaign_id
+        self._direct: Set[str] = set()  # call_sids dialed from "Call Now", outside any campaign
+        self.draining = False
+        self._recovering = False  # nothing dials until every recovered job is back in place
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # -- campaigns ---------------------------------------------------------
+
+    def create_campaign(self, name: str, appointment_ids: List[str], override_window: bool = False,
+                        weight: int = 1) -> Dict:
+        campaign = Campaign(uuid.uuid4().hex, name, weight, override_window)
+        # Join at the current pass so a new campaign shares fairly instead of catching up
+        campaign.pass_value = self._min_pass()
+        job_store.create_campaign(campaign.id, campaign.name, campaign.weight, override_window)
+        self._campaigns[campaign.id] = campaign
+
+        valid = self._callable(appointment_ids)
+        self._push_jobs(campaign, job_store.enqueue(campaign.id, valid, override_window))
+        logger.info(f"CallQueue: campaign '{name}' ({campaign.id}) created with {len(valid)} appointments; override={override_window}")
 
-        self._queue = valid_ids
-        self._override_window = override_window
-        self._done = []
-        self._errors = {}
-        self._cancelled = False
-        self._active = len(self._queue) > 0
-        self._current_call_sid = None
-        self._current_appointment_id = None
+        self._dispatch()
+        self._check_complete(campaign)
+        return campaign.to_dict()
 
-        logger.info(f"CallQueue: starting batch with {len(self._queue)} appointments; override={override_window}")
-        if self._active:
-            self._start_next()
+    def add_calls(self, campaign_id: Optional[str], appointment_ids: List[str], override_window: bool = False) -> Dict:
+        """Append calls to an open campaign. With no ID, uses (or opens) the standing retry campaign."""
+        campaign = self._campaigns.get(campaign_id) if campaign_id else self._retry_campaign()
+        if campaign is None or not campaign.is_open:
+            if campaign_id:
+                raise KeyError(campaign_id)
+            return self.create_campaign(RETRY_CAMPAIGN_NAME, appointment_ids, override_window)
+        valid = [apt for apt in self._callable(appointment_ids) if apt.id not in campaign.jobs_by_appointment]
+        self._push_jobs(campaign, job_store.enqueue(campaign.id, valid, override_window or campaign.override_window))
+        logger.info(f"CallQueue: added {len(valid)} appointments to campaign '{campaign.name}'")
+        self._dispatch()
+        return campaign.to_dict()
 
+    def pause(self, campaign_id: str) -> Dict:
+        campaign = self._get(campaign_id)
+        if campaign.state == CampaignState.RUNNING:
+            self._set_state(campaign, CampaignState.PAUSED)
+        return campaign.to_dict()
+
+    def resume(self, campaign_id: str) -> Dict:
+        campaign = self._get(campaign_id)
+        if campaign.state == CampaignState.PAUSED:
+            campaign.pass_value = max(campaign.pass_value, self._min_pass())
+            self._set_state(campaign, CampaignState.RUNNING)
+            self._dispatch()
+            self._check_complete(campaign)
+        return campaign.to_dict()
+
+    def cancel_campaign(self, campaign_id: str) -> Dict:
+        campaign = self._get(campaign_id)
+        if campaign.is_open:
+            job_store.cancel_queued(campaign.id)
+            campaign.heap.clear()
+            campaign.positions.clear()
+            campaign.jobs_by_appointment.clear()
+            campaign.households.clear()
+            self._set_state(campaign, CampaignState.CANCELLED)
+            logger.info(f"CallQueue: campaign '{campaign.name}' cancelled")
+        return campaign.to_dict()
+
+    def get_campaign(self, campaign_id: str) -> Dict:
+        return self._get(campaign_id).to_dict()
+
+    def list_campaigns(self) -> List[Dict]:
+        self._prune_campaigns()
+        return [campaign.to_dict() for campaign in self._campaigns.values()]
+
+    def get_errors(self, campaign_id: Optional[str] = None, offset: int = 0, limit: int = 50) -> Dict:
+        """A page of failed calls, newest first, for one campaign or all of them."""
+        if campaign_id is not None:
+            self._get(campaign_id)
+        total, errors = job_store.errors(None if campaign_id is None else [campaign_id], offset, limit)
+        return {"total": total, "offset": offset, "limit": limit, "errors": errors}
+
+    # -- single-batch API used by the dashboard ----------------------------
+
+    def start_batch(self, appointment_ids: List[str], override_window: bool = False, name: Optional[str] = None) -> Dict:
+        self.create_campaign(name or f"Batch {datetime.now().strftime('%H:%M:%S')}", appointment_ids, override_window)
+        return self.get_status()
+
+    def add_to_batch(self, appointment_ids: List[str], override_window: bool = False) -> Dict:
+        self.add_calls(None, appointment_ids, override_window)
         return self.get_status()
 
     def get_status(self) -> Dict:
+        """Totals across open campaigns, in the shape the dashboard polls for."""
+        self._prune_campaigns()
+        campaigns = [c.to_dict() for c in self._campaigns.values() if c.is_open]
+        error_count = sum(c["error_count"] for c in campaigns)
+        errors: Dict[str, str] = {}
+        if error_count:
+            _, page = job_store.errors([c["id"] for c in campaigns], limit=ERROR_PREVIEW)
+            errors = {e["appointment_id"]: e["error"] for e in page}
+        current = next(iter(self._in_flight), None)
         return {
-            "active": self._active,
-            "cancelled": self._cancelled,
-            "current_appointment_id": self._current_appointment_id,
-            "queued_count": len(self._queue),
-            "done_count": len(self._done),
-            "error_count": len(self._errors),
-            "errors": self._errors,
+            "active": bool(campaigns),
+            "cancelled": bool(self._campaigns) and all(
+                c.state == CampaignState.CANCELLED for c in self._campaigns.values()
+            ),
+            "current_appointment_id": appointment_store.appointment_id_for_call(current) if current else None,
+            "in_flight_count": len(self._in_flight),
+            "draining": self.draining,
+            "queued_count": sum(c["queued_count"] for c in campaigns),
+            "done_count": sum(c["done_count"] for c in campaigns),
+            "error_count": error_count,
+            "errors": errors,
+            "campaigns": campaigns,
         }
 
+    def get_gauges(self) -> Dict[str, int]:
+        """In-memory counts for /metrics; unlike get_status it reads nothing from the job table."""
+        open_campaigns = [c for c in self._campaigns.values() if c.is_open]
+        return {
+            "queued": sum(len(c.heap) for c in open_campaigns),
+            "in_flight": self.in_flight_count,  # "Call Now" calls too
+            "open_campaigns": len(open_campaigns),
+        }
+
+    @property
+    def in_flight_count(self) -> int:
+        return len(self._in_flight) + len(self._direct)
+
+    def begin_drain(self) -> None:
+        """Dial nothing more in this process; calls already up finish through their webhooks.
+
+        Only sets a flag, so it is safe from a signal handler. Queued jobs stay
+        queued in the job table for the next process to dial.
+        """
+        self.draining = True
+
     def cancel(self) -> Dict:
-        self._cancelled = True
-        self._queue.clear()
-        logger.info("CallQueue: batch cancelled")
+        for campaign_id in list(self._campaigns):
+            self.cancel_campaign(campaign_id)
+        logger.info("CallQueue: all campaigns cancelled")
         return self.get_status()
 
-    def on_call_finished(self, call_sid: str) -> None:
-        if not self._active:
+    # -- ordering ----------------------------------------------------------
+
+    def set_scorer(self, scorer: ScoreFunction) -> None:
+        """Swap the scoring function and re-rank everything still queued."""
+        self._scorer = scorer
+        for campaign in self._campaigns.values():
+            for apt_id in list(campaign.jobs_by_appointment):
+                self._reprioritize_in(campaign, apt_id)
+
+    def reprioritize(self, appointment_id: str) -> None:
+        """Re-score a queued appointment after it changed; O(log n) per campaign holding it."""
+        for campaign in self._campaigns.values():
+            self._reprioritize_in(campaign, appointment_id)
+
+    def _reprioritize_in(self, campaign: Campaign, appointment_id: str) -> None:
+        job_id = campaign.jobs_by_appointment.get(appointment_id)
+        # Most campaigns don't hold the appointment; skip the store read (a SQLite query when shared) for them
+        if job_id is None or job_id not in campaign.heap:
             return
-        if self._current_call_sid != call_sid:
+        apt = appointment_store.get_appointment(appointment_id)
+        if apt is None:
             return
-        # Mark done and advance
-        if self._current_appointment_id:
-            self._done.append(self._current_appointment_id)
-        self._current_call_sid = None
-        self._current_appointment_id = None
-        self._start_next()
-
-    def _start_next(self) -> None:
-        if self._cancelled:
-            self._active = False
+        campaign.heap.update(job_id, (*self._scorer(apt), campaign.positions[job_id]))
+
+    # -- call lifecycle ----------------------------------------------------
+
+    def track_call(self, call_sid: str) -> None:
+        """Count a call dialed outside the queue as in flight until its terminal status webhook."""
+        self._direct.add(call_sid)
+
+    def on_call_finished(self, call_sid: str) -> None:
+        """Terminal status callback for any call, queued or not; its caller ID has just been released."""
+        self._direct.discard(call_sid)
+        job_store.finish(call_sid)
+        campaign_id = self._in_flight.pop(call_sid, None)
+        campaign = self._campaigns.get(campaign_id) if campaign_id else None
+        if campaign:
+            campaign.in_flight.pop(call_sid, None)
+        # Even a "Call Now" outside every campaign frees a number a queued job may be waiting on
+        self._dispatch()
+        if campaign:
+            self._check_complete(campaign)
+
+    def recover(self) -> Dict:
+        """Resume unfinished campaigns left behind by a previous process (see `_resume`).
+
+        Blocks on Twilio for claimed and in-flight jobs; the app runs recover_async() instead.
+        """
+        jobs = self._load_unfinished()
+        return self._finish_recovery(jobs, self._look_up_calls(jobs))
+
+    async def recover_async(self) -> Dict:
+        """recover() with the Twilio lookups on a worker thread; queue state is only touched on the loop."""
+        jobs = self._load_unfinished()
+        calls = await asyncio.to_thread(self._look_up_calls, jobs)
+        return self._finish_recovery(jobs, calls)
+
+    def _load_unfinished(self) -> List[CallJobRecord]:
+        for record in job_store.open_campaigns():
+            if record.id not in self._campaigns:
+                self._campaigns[record.id] = Campaign(
+                    record.id, record.name, record.weight, bool(record.override_window), record.state
+                )
+        retry_scheduler.restore()
+        return job_store.unfinished()
+
+    def _finish_recovery(self, jobs: List[CallJobRecord], calls: Dict[int, Tuple[Optional[str], Optional[str]]]) -> Dict:
+        self._recovering = True
+        try:
+            self._resume(jobs, calls)
+        finally:
+            self._recovering = False
+        self._dispatch()
+        if jobs:
+            logger.info(f"CallQueue: recovered {len(self._campaigns)} campaigns ({len(jobs)} unfinished jobs)")
+        return self.get_status()
+
+    def sweep_expired_leases(self) -> int:
+        """Renew this worker's leases and settle jobs whose lease ran out, as recover() does at startup.
+
+        A worker that dies between claiming a job and recording the dial leaves
+        it CLAIMED, and one that dies mid-call leaves its call IN_FLIGHT. While
+        that lease was still live, recover() left the job to its owner; run()
+        does this every lease period so such jobs are dialed, re-attached or
+        settled after all.
+        """
+        jobs, calls = self._take_expired_leases()
+        return self._resume_expired(jobs, calls)
+
+    def _take_expired_leases(self) -> Tuple[List[CallJobRecord], Dict[int, Tuple[Optional[str], Optional[str]]]]:
+        # Database and Twilio only, so run() can do this on a worker thread
+        job_store.renew_leases()
+        jobs = job_store.take_expired_leases()
+        return jobs, self._look_up_calls(jobs)
+
+    def _resume_expired(self, jobs: List[CallJobRecord], calls: Dict[int, Tuple[Optional[str], Optional[str]]]) -> int:
+        if jobs:
+            logger.warning(f"CallQueue: reconciling {len(jobs)} call jobs whose worker stopped renewing their lease")
+            self._resume(jobs, calls)
+        return len(jobs)
+
+    @classmethod
+    def _look_up_calls(cls, jobs: List[CallJobRecord]) -> Dict[int, Tuple[Optional[str], Optional[str]]]:
+        """Ask Twilio about claimed and in-flight jobs. Blocking, but touches no queue state.
+
+        Maps a job ID to (call SID, call status); a claimed job Twilio has no
+        call for maps to (None, None). Claimed jobs that could not be checked
+        are left out.
+        """
+        calls: Dict[int, Tuple[Optional[str], Optional[str]]] = {}
+        if all(job.state == JobState.QUEUED.value for job in jobs):
+            return calls
+        client = TwilioService().client
+        if client is None:
+            return calls
+        for job in jobs:
+            call_sid = job.call_sid
+            if job.state == JobState.CLAIMED.value:
+                apt = appointment_store.get_appointment(job.appointment_id) or job_store.appointment_from_job(job)
+                if apt is None:
+                    continue
+                try:
+                    call_sid = cls._find_dialed_call(client, job, apt)
+                except Exception as e:
+                    logger.warning(f"CallQueue: could not reconcile job {job.id} with Twilio: {e}")
+                    continue
+                if call_sid is None:
+                    calls[job.id] = (None, None)
+                    continue
+            elif job.state != JobState.IN_FLIGHT.value:
+                continue
+            calls[job.id] = (call_sid, cls._fetch_call_status(client, call_sid))
+        return calls
+
+    def _resume(self, jobs: List[CallJobRecord], calls: Dict[int, Tuple[Optional[str], Optional[str]]]) -> None:
+        """Put unfinished jobs back in their campaigns: queue them, re-attach their calls, or settle them.
+
+        `calls` is what Twilio said about them (see `_look_up_calls`). In-flight
+        calls are re-attached to their appointments and left to finish through
+        their status webhook; calls that already ended meanwhile are settled
+        from Twilio's record. A claimed job is matched against Twilio's call log
+        rather than dialed again.
+        """
+        # Jobs a webhook settled while Twilio was being asked are already done with
+        current = job_store.states([job.id for job in jobs if job.state != JobState.QUEUED.value])
+        finished: List[Tuple[str, str]] = []
+        for job in jobs:
+            if job.state != JobState.QUEUED.value and current.get(job.id) != job.state:
+                continue
+            campaign = self._campaign_for(job)
+
+            apt = appointment_store.get_appointment(job.appointment_id)
+            if apt is None:
+                apt = job_store.appointment_from_job(job)
+                if apt is None:
+                    job_store.mark_failed(job.id, "Appointment not found")
+                    continue
+                appointment_store.add_appointment(apt)
+
+            if job.state == JobState.QUEUED.value:
+                self._push_jobs(campaign, [job])
+                continue
+            call_sid, call_status = calls.get(job.id, (job.call_sid, None))
+            if job.state == JobState.CLAIMED.value:
+                if job.id not in calls:
+                    # Can't tell whether the dial went out; failing is safer than calling twice
+                    job_store.mark_failed(job.id, "Interrupted before the call was confirmed")
+                    continue
+                if call_sid is None:
+                    job_store.requeue(job.id)
+                    self._push_jobs(campaign, [job])
+                    continue
+                job_store.mark_dialed(job.id, call_sid)
+                job.call_sid = call_sid
+                job.state = JobState.IN_FLIGHT.value
+
+            if job.state == JobState.IN_FLIGHT.value:
+                appointment_store.map_call_to_appointment(job.call_sid, apt.id)
+                if apt.caller_id and number_pool.number_for_call(job.call_sid) is None:
+                    # Count the surviving call against its caller ID again, limit or not: it is already up
+                    number_pool.adopt(job.call_sid, apt.caller_id)
+                campaign.in_flight[job.call_sid] = apt.id
+                self._in_flight[job.call_sid] = campaign.id
+                if call_status in TERMINAL_CALL_STATUSES:
+                    finished.append((job.call_sid, call_status))
+
+        for call_sid, call_status in finished:
+            # Settles the appointment and advances the queue exactly as the missed webhook would have
+            TwilioService().handle_status_callback(call_sid, call_status)
+        self._dispatch()
+        for campaign in list(self._campaigns.values()):
+            self._check_complete(campaign)
+
+    def _campaign_for(self, job: CallJobRecord) -> Campaign:
+        campaign = self._campaigns.get(job.batch_id)
+        if campaign is None:
+            record = job_store.get_campaign(job.batch_id)
+            if record is None:
+                # Batch from before campaigns were recorded
+                campaign = Campaign(job.batch_id, "Recovered batch", 1, bool(job.override_window))
+                job_store.create_campaign(campaign.id, campaign.name, 1, bool(job.override_window))
+            else:
+                # Closed and pruned from memory while another worker still held one of its jobs
+                campaign = Campaign(record.id, record.name, record.weight, bool(record.override_window), record.state)
+            self._campaigns[campaign.id] = campaign
+        if campaign.state == CampaignState.COMPLETE:
+            campaign.closed_at = None
+            self._set_state(campaign, CampaignState.RUNNING)
+        return campaign
+
+    def _dispatch(self) -> None:
+        """Fill free call slots, always serving the running campaign with the lowest pass."""
+        if self.draining or self._recovering:
             return
-        if not self._queue:
-            logger.info("CallQueue: batch complete")
-            self._active = False
+        while len(self._in_flight) < max(settings.MAX_CONCURRENT_CALLS, 1):
+            candidates = [
+                c for c in self._campaigns.values()
+                if c.state == CampaignState.RUNNING and c.has_work and not c.held_by_call_window
+            ]
+            if not candidates:
+                return
+            if not self._pool_has_room():
+                # A free number that is only waiting out its CPS pacing: run() dials once it is due.
+                # With every number busy, the next call to end dispatches instead.
+                if number_pool.next_slot_in() is not None:
+                    self._wake()
+                return
+            campaign = min(candidates, key=lambda c: c.pass_value)
+            campaign.pass_value += 1.0 / campaign.weight
+            self._start_next(campaign)
+
+    @staticmethod
+    def _pool_has_room() -> bool:
+        # With no caller IDs configured, let make_call fail the job rather than leave it queued
+        return not number_pool.numbers or number_pool.ready() > 0
+
+    async def run(self) -> None:
+        """Background task: dial again once caller-ID pacing lets the next call start, and
+        settle expired leases every CALL_JOB_LEASE_SECONDS (also when held retries get
+        another look at the call window)."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        # Anything recovered before the loop was running gets its first look here
+        self._wakeup.set()
+        next_sweep = time.monotonic() + settings.CALL_JOB_LEASE_SECONDS
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(next_sweep - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                pass
+            if self._wakeup.is_set():
+                self._wakeup.clear()
+                delay = number_pool.next_slot_in()
+                if delay:
+                    await asyncio.sleep(delay)
+            try:
+                self._dispatch()
+            except Exception as e:
+                logger.error(f"CallQueue: paced dispatch failed: {e}")
+            if time.monotonic() >= next_sweep:
+                next_sweep = time.monotonic() + settings.CALL_JOB_LEASE_SECONDS
+                try:
+                    # Matching a claim against Twilio's call log is a blocking REST request
+                    jobs, calls = await asyncio.to_thread(self._take_expired_leases)
+                    self._resume_expired(jobs, calls)
+                except Exception as e:
+                    logger.error(f"CallQueue: lease sweep failed: {e}")
+
+    def _wake(self) -> None:
+        # Safe from any thread, though _dispatch itself only runs on the event loop
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _start_next(self, campaign: Campaign) -> None:
+        job = self._claim_next(campaign)
+        if job is None:
+            # Every job left was skipped at claim time
+            self._check_complete(campaign)
             return
-        next_id = self._queue.pop(0)
+        next_id = job.appointment_id
         apt: Optional[Appointment] = appointment_store.get_appointment(next_id)
         if not apt:
-            self._errors[next_id] = "Appointment not found"
-            self._start_next()
+            job_store.mark_failed(job.id, "Appointment not found")
             return
-        logger.info(f"CallQueue: calling appointment {next_id} for {apt.patient_name}")
+        household_jobs = self._claim_household(campaign, apt)
+        household = [appointment_store.get_appointment(j.appointment_id) for j in household_jobs]
+        jobs = [job] + household_jobs
+        logger.info(f"CallQueue: [{campaign.name}] calling appointment {next_id}"
+                    + (f" with {len(household)} household appointments" if household else ""))
         try:
             # Create a fresh TwilioService (avoids circular import at module level)
             service = TwilioService()
-            call_sid = service.make_call(apt, override_window=self._override_window)
+            if household:
+                call_sid = service.make_call(apt, override_window=bool(job.override_window), household=household)
+            else:
+                call_sid = service.make_call(apt, override_window=bool(job.override_window))
             if not call_sid:
-                self._errors[next_id] = "Failed to initiate call"
-                self._start_next()
+                for j in jobs:
+                    job_store.mark_failed(j.id, "Failed to initiate call")
                 return
-            self._current_call_sid = call_sid
-            self._current_appointment_id = next_id
+            for j in jobs:
+                job_store.mark_dialed(j.id, call_sid)
+            campaign.in_flight[call_sid] = next_id
+            self._in_flight[call_sid] = campaign.id
         except Exception as e:
-            self._errors[next_id] = str(e)
-            self._start_next()
+            for j in jobs:
+                job_store.mark_failed(j.id, str(e))
+
+    def _claim_household(self, campaign: Campaign, apt: Appointment) -> List[CallJobRecord]:
+        """Claim the other queued jobs in this campaign that ring the same phone."""
+        if not settings.COALESCE_HOUSEHOLD_CALLS or not apt.phone:
+            return []
+        claimed: List[CallJobRecord] = []
+        for sibling_id in sorted(campaign.households.get(apt.phone, ())):
+            if len(claimed) + 1 >= settings.MAX_HOUSEHOLD_APPOINTMENTS:
+                break
+            sibling = appointment_store.get_appointment(sibling_id)
+            job_id = campaign.jobs_by_appointment.get(sibling_id)
+            if sibling is None or job_id is None:
+                continue
+            campaign.heap.remove(job_id)
+            self._forget_job(campaign, job_id, sibling_id, apt.phone)
+            job = job_store.claim(job_id)
+            if job is None:
+                continue
+            if sibling.status in UNCALLABLE_STATUSES:
+                self._skip(campaign, job, sibling)
+                continue
+            claimed.append(job)
+        return claimed
 
+    def _claim_next(self, campaign: Campaign) -> Optional[CallJobRecord]:
+        while campaign.has_work:
+            job_id, _ = campaign.heap.pop()
+            job = job_store.claim(job_id)
+            if job is None:
+                campaign.positions.pop(job_id, None)
+                continue
+            # Re-read at claim time: the patient may have answered another call since the job was queued
+            apt = appointment_store.get_appointment(job.appointment_id)
+            self._forget_job(campaign, job_id, job.appointment_id, apt.phone if apt else None)
+            if apt is not None and apt.status in UNCALLABLE_STATUSES:
+                self._skip(campaign, job, apt)
+                continue
+            return job
+        return None
 
-call_queue = CallQueue()
+    @staticmethod
+    def _skip(campaign: Campaign, job: CallJobRecord, apt: Appointment) -> None:
+        logger.info(f"CallQueue: [{campaign.name}] skipping appointment {apt.id}, now {apt.status}")
+        job_store.mark_skipped(job.id, f"Skipped: appointment is {apt.status}")
+
+    @staticmethod
+    def _forget_job(campaign: Campaign, job_id: int, appointment_id: str, phone: Optional[str]) -> None:
+        campaign.positions.pop(job_id, None)
+        campaign.jobs_by_appointment.pop(appointment_id, None)
+        members = campaign.households.get(phone)
+        if members is not None:
+            members.discard(appointment_id)
+            if not members:
+                del campaign.households[phone]
+
+    def _check_complete(self, campaign: Campaign) -> None:
+        if campaign.state == CampaignState.RUNNING and not campaign.has_work and not campaign.in_flight:
+            self._set_state(campaign, CampaignState.COMPLETE)
+            logger.info(f"CallQueue: campaign '{campaign.name}' complete")
+
+    def _set_state(self, campaign: Campaign, state: str) -> None:
+        campaign.state = state
+        if not campaign.is_open:
+            campaign.closed_at = datetime.utcnow()
+        job_store.set_campaign_state(campaign.id, state)
+
+    def _prune_campaigns(self) -> None:
+        """Forget finished campaigns past CAMPAIGN_RETENTION_SECONDS, keeping at most MAX_CLOSED_CAMPAIGNS.
+
+        Their jobs stay in the database, so their errors are still listed by `get_errors()` across all campaigns.
+        """
+        closed = sorted((c for c in self._campaigns.values() if c.closed_at), key=lambda c: c.closed_at)
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.CAMPAIGN_RETENTION_SECONDS)
+        excess = len(closed) - settings.MAX_CLOSED_CAMPAIGNS
+        for n, campaign in enumerate(closed):
+            if n < excess or campaign.closed_at < cutoff:
+                del self._campaigns[campaign.id]
+
+    def _push_jobs(self, campaign: Campaign, jobs: List[CallJobRecord]) -> None:
+        for job in jobs:
+            apt = appointment_store.get_appointment(job.appointment_id)
+            score = self._scorer(apt) if apt else ()
+            campaign.positions[job.id] = job.position
+            campaign.jobs_by_appointment[job.appointment_id] = job.id
+            if apt and apt.phone:
+                campaign.households.setdefault(apt.phone, set()).add(apt.id)
+            campaign.heap.push(job.id, (*score, job.position))
+
+    def _min_pass(self) -> float:
+        running = [c.pass_value for c in self._campaigns.values() if c.state == CampaignState.RUNNING and c.has_work]
+        return min(running) if running else 0.0
+
+    def _retry_campaign(self) -> Optional[Campaign]:
+        for campaign in self._campaigns.values():
+            if campaign.name == RETRY_CAMPAIGN_NAME and campaign.is_open:
+                return campaign
+        return None
 
+    def _get(self, campaign_id: str) -> Campaign:
+        campaign = self._campaigns.get(campaign_id)
+        if campaign is None:
+            raise KeyError(campaign_id)
+        return campaign
 
+    @staticmethod
+    def _callable(appointment_ids: List[str]) -> List[Appointment]:
+        # Filter out invalid or non-callable appointments
+        valid: List[Appointment] = []
+        for apt_id in appointment_ids:
+            apt = appointment_store.get_appointment(apt_id)
+            if not apt:
+                continue
+            if apt.status in UNCALLABLE_STATUSES:
+                continue
+            valid.append(apt)
+        return valid
+
+    @staticmethod
+    def _find_dialed_call(client: "Client", job: CallJobRecord, apt: Appointment) -> Optional[str]:
+        filters = {"to": apt.phone, "limit": 1}
+        if job.claimed_at:
+            filters["start_time_after"] = job.claimed_at - timedelta(minutes=1)
+        calls = client.calls.list(**filters)
+        return calls[0].sid if calls else None
+
+    @staticmethod
+    def _fetch_call_status(client: "Client", call_sid: str) -> Optional[str]:
+        try:
+            return client.calls(call_sid).fetch().status
+        except Exception as e:
+            logger.debug(f"CallQueue: status lookup for {call_sid} failed: {e}")
+            return None
+
+
+call_queue = CallQueue()
+appointment_store.add_listener(call_queue.reprioritize)
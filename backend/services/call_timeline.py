@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+
+from database import CallEventRecord, get_sync_session
+from settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "no-answer", "busy", "failed", "canceled", "cancelled")
+# Events kept in memory if the database cannot be written; beyond this the oldest are dropped
+MAX_PENDING = 50000
+# Calls examined at most by one stats request
+MAX_STATS_CALLS = 20000
+
+# Span name -> (start event, end events); the first end event seen after the start closes it
+SPANS = {
+    "dial_to_initiated": ("dialed", ("initiated",)),
+    "initiated_to_ringing": ("initiated", ("ringing",)),
+    "ringing_to_answered": ("ringing", ("in-progress",)),
+    # With synchronous AMD, Twilio fetches the voice URL only once detection is done
+    "answered_to_greeting": ("in-progress", ("voice",)),
+    "greeting_to_digit": ("voice", ("digit",)),
+    "greeting_to_gather_timeout": ("voice", ("gather_timeout",)),
+    "transfer": ("transfer", ("dial",) + TERMINAL_STATUSES),
+    "answered_to_end": ("in-progress", TERMINAL_STATUSES),
+}
+
+
+def _percentiles(values: List[float]) -> Dict:
+    ordered = sorted(values)
+    pick = lambda fraction: ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+    return {"count": len(ordered), "p50": round(pick(0.5), 3), "p90": round(pick(0.9), 3),
+            "p99": round(pick(0.99), 3), "max": round(ordered[-1], 3)}
+
+
+def build_timeline(rows: List[Tuple[float, str, Optional[str]]]) -> Dict:
+    """Events as offsets from the first one, plus the spans between them (seconds)."""
+    rows = sorted(rows)
+    if not rows:
+        return {"started_at": None, "events": [], "spans": {}, "answered_by": None, "call_duration": None}
+    start = rows[0][0]
+    events = []
+    answered_by = call_duration = None
+    for at, event, value in rows:
+        # A keypress names its digit; the menu is timed the same way whichever key it was
+        if event == "gather":
+            events.append((at, "digit" if value else "gather_timeout", value))
+            if value == "2":
+                events.append((at, "transfer", None))
+            continue
+        if event == "answered_by":
+            answered_by = answered_by or value
+            continue
+        if event in TERMINAL_STATUSES and value and value.isdigit():
+            call_duration = int(value)
+        events.append((at, event, value))
+
+    spans = {}
+    for name, (start_event, end_events) in SPANS.items():
+        began = next((at for at, event, _ in events if event == start_event), None)
+        if began is None:
+            continue
+        ended = next((at for at, event, _ in events if event in end_events and at >= began), None)
+        if ended is not None:
+            spans[name] = round(ended - began, 3)
+    return {
+        "started_at": start,
+        "events": [{"t": round(at - start, 3), "event": event, **({"value": value} if value else {})}
+                   for at, event, value in events],
+        "spans": spans,
+        "answered_by": answered_by,
+        "call_duration": call_duration,
+    }
+
+
+class CallTimeline:
+    """Per-call event log from the status, voice, gather and dial webhooks.
+
+    `record` only appends to an in-memory buffer, so a webhook pays a list
+    append; `run()` writes the buffer to the `call_events` table every
+    CALL_TIMELINE_FLUSH_SECONDS, where every worker's events for a call meet.
+    A timeline is a handful of small rows per call and is rebuilt on read.
+    Times are when this app saw each webhook: Twilio's own Timestamp field
+    only has whole seconds.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, float, str, Optional[str]]] = []
+        self._last_prune = 0.0
+        self.dropped = 0
+
+    def record(self, call_sid: Optional[str], event: str, value: Optional[str] = None) -> None:
+        if not call_sid:
+            return
+        with self._lock:
+            self._pending.append((call_sid, time.time(), event, value[:32] if value else None))
+            if len(self._pending) > MAX_PENDING:
+                overflow = len(self._pending) - MAX_PENDING
+                del self._pending[:overflow]
+                self.dropped += overflow
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+        try:
+            with get_sync_session() as session:
+                session.bulk_insert_mappings(CallEventRecord, [
+                    {"call_sid": sid, "at": at, "event": event, "value": value} for sid, at, event, value in pending
+                ])
+                session.commit()
+        except Exception as e:
+            logger.error(f"Could not write {len(pending)} call timeline events: {e}")
+            with self._lock:
+                self._pending[:0] = pending
+            return 0
+        return len(pending)
+
+    def prune(self) -> int:
+        cutoff = time.time() - settings.CALL_TIMELINE_RETENTION_HOURS * 3600
+        with get_sync_session() as session:
+            deleted = session.execute(delete(CallEventRecord).where(CallEventRecord.at < cutoff)).rowcount
+            session.commit()
+        return deleted
+
+    async def run(self) -> None:
+        """Background writer; runs until cancelled."""
+        while True:
+            await asyncio.sleep(settings.CALL_TIMELINE_FLUSH_SECONDS)
+            try:
+                await asyncio.to_thread(self.flush)
+                if time.monotonic() - self._last_prune > 3600:
+                    self._last_prune = time.monotonic()
+                    await asyncio.to_thread(self.prune)
+            except Exception as e:
+                logger.error(f"Call timeline writer error: {e}")
+
+    def get_timeline(self, call_sid: str) -> Optional[Dict]:
+        self.flush()
+        with get_sync_session() as session:
+            rows = session.execute(
+                select(CallEventRecord.at, CallEventRecord.event, CallEventRecord.value)
+                .where(CallEventRecord.call_sid == call_sid)
+            ).all()
+        if not rows:
+            return None
+        return {"call_sid": call_sid, **build_timeline([tuple(row) for row in rows])}
+
+    def get_stats(self, hours: float = 24) -> Dict:
+        """Span percentiles (seconds) over calls that started in the last `hours`, also split by AnsweredBy."""
+        self.flush()
+        cutoff = time.time() - hours * 3600
+        with get_sync_session() as session:
+            recent = (
+                select(CallEventRecord.call_sid).where(CallEventRecord.at >= cutoff)
+                .group_by(CallEventRecord.call_sid).order_by(func.max(CallEventRecord.at).desc()).limit(MAX_STATS_CALLS)
+            )
+            rows = session.execute(
+                select(CallEventRecord.call_sid, CallEventRecord.at, CallEventRecord.event, CallEventRecord.value)
+                .where(CallEventRecord.call_sid.in_(recent))
+            ).all()
+        by_call: Dict[str, List] = defaultdict(list)
+        for call_sid, at, event, value in rows:
+            by_call[call_sid].append((at, event, value))
+
+        spans: Dict[str, List[float]] = defaultdict(list)
+        by_answered_by: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
+        outcomes: Dict[str, int] = defaultdict(int)
+        for events in by_call.values():
+            timeline = build_timeline(events)
+            if timeline["started_at"] is None or timeline["started_at"] < cutoff:
+                continue
+            final = next((e["event"] for e in reversed(timeline["events"]) if e["event"] in TERMINAL_STATUSES), None)
+            outcomes[final or "in_progress"] += 1
+            for name, seconds in timeline["spans"].items():
+                spans[name].append(seconds)
+                by_answered_by[timeline["answered_by"] or "none"][name].append(seconds)
+        return {
+            "hours": hours,
+            "calls": sum(outcomes.values()),
+            "outcomes": dict(outcomes),
+            "spans": {name: _percentiles(values) for name, values in spans.items()},
+            "by_answered_by": {
+                answered_by: {name: _percentiles(values) for name, values in named.items()}
+                for answered_by, named in by_answered_by.items()
+            },
+        }
+
+    def get_status(self) -> Dict:
+        with self._lock:
+            return {"pending": len(self._pending), "dropped": self.dropped}
+
+
+call_timeline = CallTimeline()
@@ -0,0 +1,328 @@
+import json
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update, func
+
+from database import CallJobRecord, CampaignRecord, get_sync_session
+from models import Appointment
+from settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process as a lease holder; a restarted process gets a new one
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _in_flight_lease(now: datetime) -> datetime:
+    # Renewed every CALL_JOB_LEASE_SECONDS by the owner's lease sweep; twice that so a renewal never lands late
+    return now + timedelta(seconds=2 * settings.CALL_JOB_LEASE_SECONDS)
+
+
+class JobState(str, Enum):
+    QUEUED = "queued"
+    CLAIMED = "claimed"      # leased by a worker, call not yet confirmed by Twilio
+    IN_FLIGHT = "in_flight"  # Twilio accepted the call, waiting for the terminal status webhook
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    SCHEDULED = "scheduled"  # a pending retry, not yet handed to a campaign; due at not_before
+
+
+# Batch id shared by scheduled retry rows; they join the "Retries" campaign only when due
+RETRY_SCHEDULE_BATCH = "retry-schedule"
+
+
+class CallJobStore:
+    """Persistent call jobs in SQLite with claim/lease semantics.
+
+    A job is claimed with a conditional UPDATE so two workers can never dial the
+    same row, and the Twilio CallSid is recorded as soon as the call is created so
+    a restarted process can pick up in-flight calls instead of redialing them.
+    """
+
+    def enqueue(self, batch_id: str, appointments: List[Appointment], override_window: bool = False) -> List[CallJobRecord]:
+        with get_sync_session() as session:
+            # Append after anything already in the batch
+            start = session.execute(
+                select(func.max(CallJobRecord.position)).where(CallJobRecord.batch_id == batch_id)
+            ).scalar()
+            start = 0 if start is None else start + 1
+            jobs = [
+                CallJobRecord(
+                    batch_id=batch_id,
+                    appointment_id=apt.id,
+                    position=start + offset,
+                    state=JobState.QUEUED.value,
+                    override_window=override_window,
+                    payload=apt.to_json().decode()
+                )
+                for offset, apt in enumerate(appointments)
+            ]
+            session.add_all(jobs)
+            session.commit()
+        return jobs
+
+    def claim(self, job_id: int) -> Optional[CallJobRecord]:
+        """Lease one specific queued job. Returns None if it is no longer queued."""
+        now = datetime.utcnow()
+        with get_sync_session() as session:
+            result = session.execute(
+                update(CallJobRecord)
+                .where(CallJobRecord.id == job_id, CallJobRecord.state == JobState.QUEUED.value)
+                .values(
+                    state=JobState.CLAIMED.value,
+                    lease_owner=WORKER_ID,
+                    lease_expires=now + timedelta(seconds=settings.CALL_JOB_LEASE_SECONDS),
+                    claimed_at=now,
+                    updated_at=now
+                )
+            )
+            session.commit()
+            if result.rowcount != 1:
+                return None
+            return session.get(CallJobRecord, job_id)
+
+    def mark_dialed(self, job_id: int, call_sid: str) -> None:
+        self._set(job_id, state=JobState.IN_FLIGHT.value, call_sid=call_sid, lease_owner=WORKER_ID,
+                  lease_expires=_in_flight_lease(datetime.utcnow()))
+
+    def mark_failed(self, job_id: int, error: str) -> None:
+        self._set(job_id, state=JobState.FAILED.value, error=error, lease_owner=None, lease_expires=None)
+
+    def mark_skipped(self, job_id: int, reason: str) -> None:
+        # Settled without a call; the reason is kept for reference but is not reported as an error
+        self._set(job_id, state=JobState.DONE.value, error=reason, lease_owner=None, lease_expires=None)
+
+    def requeue(self, job_id: int) -> None:
+        self._set(job_id, state=JobState.QUEUED.value, lease_owner=None, lease_expires=None, claimed_at=None)
+
+    def finish(self, call_sid: str) -> List[CallJobRecord]:
+        """Mark the in-flight jobs for a call as done (several for a household call).
+
+        Returns an empty list if no job was waiting on it.
+        """
+        with get_sync_session() as session:
+            jobs = list(session.execute(
+                select(CallJobRecord).where(
+                    CallJobRecord.call_sid == call_sid,
+                    CallJobRecord.state == JobState.IN_FLIGHT.value
+                )
+            ).scalars().all())
+            for job in jobs:
+                job.state = JobState.DONE.value
+                job.lease_owner = None
+            session.commit()
+            return jobs
+
+    def cancel_queued(self, batch_id: Optional[str] = None) -> int:
+        stmt = update(CallJobRecord).where(CallJobRecord.state == JobState.QUEUED.value)
+        if batch_id:
+            stmt = stmt.where(CallJobRecord.batch_id == batch_id)
+        with get_sync_session() as session:
+            result = session.execute(stmt.values(state=JobState.CANCELLED.value, updated_at=datetime.utcnow()))
+            session.commit()
+            return result.rowcount
+
+    def counts(self, batch_id: str) -> Dict[str, int]:
+        with get_sync_session() as session:
+            rows = session.execute(
+                select(CallJobRecord.state, func.count())
+                .where(CallJobRecord.batch_id == batch_id)
+                .group_by(CallJobRecord.state)
+            ).all()
+        return {state: count for state, count in rows}
+
+    def errors(self, batch_ids: Optional[List[str]] = None, offset: int = 0,
+               limit: int = 50) -> Tuple[int, List[Dict[str, str]]]:
+        """One page of failed jobs, newest first, and how many there are in total.
+
+        Limited to the given batches, or across every batch when `batch_ids` is None.
+        """
+        failed = CallJobRecord.state == JobState.FAILED.value
+        where = [failed] if batch_ids is None else [failed, CallJobRecord.batch_id.in_(batch_ids)]
+        with get_sync_session() as session:
+            total = session.execute(select(func.count()).select_from(CallJobRecord).where(*where)).scalar()
+            rows = session.execute(
+                select(CallJobRecord.appointment_id, CallJobRecord.batch_id, CallJobRecord.error)
+                .where(*where)
+                .order_by(CallJobRecord.id.desc())
+                .offset(max(offset, 0))
+                .limit(max(limit, 0))
+            ).all()
+        return total, [
+            {"appointment_id": apt_id, "campaign_id": batch_id, "error": error}
+            for apt_id, batch_id, error in rows
+        ]
+
+    def states(self, job_ids: List[int]) -> Dict[int, str]:
+        if not job_ids:
+            return {}
+        with get_sync_session() as session:
+            return dict(session.execute(
+                select(CallJobRecord.id, CallJobRecord.state).where(CallJobRecord.id.in_(job_ids))
+            ).all())
+
+    def unfinished(self) -> List[CallJobRecord]:
+        """Jobs a restarted process must resume: queued, or claimed or in flight under an expired lease.
+
+        Jobs another live worker holds are left to it; if that worker dies its
+        lease runs out and take_expired_leases() hands them over.
+        """
+        now = datetime.utcnow()
+        with get_sync_session() as session:
+            jobs = session.execute(
+                select(CallJobRecord)
+                .where(CallJobRecord.state.in_([
+                    JobState.QUEUED.value, JobState.CLAIMED.value, JobState.IN_FLIGHT.value
+                ]))
+                .order_by(CallJobRecord.batch_id, CallJobRecord.position, CallJobRecord.id)
+            ).scalars().all()
+        return [
+            job for job in jobs
+            if job.state == JobState.QUEUED.value
+            or job.lease_owner == WORKER_ID
+            or job.lease_expires is None
+            or job.lease_expires <= now
+        ]
+
+    def renew_leases(self) -> int:
+        """Extend the leases on this worker's in-flight calls so other workers don't take them over."""
+        now = datetime.utcnow()
+        with get_sync_session() as session:
+            result = session.execute(
+                update(CallJobRecord)
+                .where(CallJobRecord.state == JobState.IN_FLIGHT.value, CallJobRecord.lease_owner == WORKER_ID)
+                .values(lease_expires=_in_flight_lease(now), updated_at=now)
+            )
+            session.commit()
+            return result.rowcount
+
+    def take_expired_leases(self) -> List[CallJobRecord]:
+        """Claimed or in-flight jobs whose lease ran out, re-leased to this worker so only one worker settles each."""
+        now = datetime.utcnow()
+        expired = [
+            CallJobRecord.state.in_([JobState.CLAIMED.value, JobState.IN_FLIGHT.value]),
+            CallJobRecord.lease_expires <= now,
+        ]
+        with get_sync_session() as session:
+            taken = []
+            for job_id in session.execute(select(CallJobRecord.id).where(*expired)).scalars().all():
+                result = session.execute(
+                    update(CallJobRecord)
+                    .where(CallJobRecord.id == job_id, *expired)
+                    .values(
+                        lease_owner=WORKER_ID,
+                        lease_expires=_in_flight_lease(now),
+                        updated_at=now
+                    )
+                )
+                if result.rowcount == 1:
+                    taken.append(job_id)
+            session.commit()
+            if not taken:
+                return []
+            return list(session.execute(
+                select(CallJobRecord)
+                .where(CallJobRecord.id.in_(taken))
+                .order_by(CallJobRecord.batch_id, CallJobRecord.position, CallJobRecord.id)
+            ).scalars().all())
+
+    def schedule_retry(self, appointment: Appointment, not_before: datetime) -> None:
+        """Record a pending retry, replacing any earlier one for the appointment, so it survives a restart."""
+        now = datetime.utcnow()
+        with get_sync_session() as session:
+            session.execute(
+                update(CallJobRecord)
+                .where(CallJobRecord.state == JobState.SCHEDULED.value, CallJobRecord.appointment_id == appointment.id)
+                .values(state=JobState.CANCELLED.value, updated_at=now)
+            )
+            session.add(CallJobRecord(
+                batch_id=RETRY_SCHEDULE_BATCH,
+                appointment_id=appointment.id,
+                state=JobState.SCHEDULED.value,
+                not_before=not_before,
+                payload=appointment.to_json().decode()
+            ))
+            session.commit()
+
+    def cancel_retries(self, appointment_id: Optional[str] = None) -> int:
+        stmt = update(CallJobRecord).where(CallJobRecord.state == JobState.SCHEDULED.value)
+        if appointment_id:
+            stmt = stmt.where(CallJobRecord.appointment_id == appointment_id)
+        with get_sync_session() as session:
+            result = session.execute(stmt.values(state=JobState.CANCELLED.value, updated_at=datetime.utcnow()))
+            session.commit()
+            return result.rowcount
+
+    def take_retry(self, appointment_id: str) -> bool:
+        """Settle an appointment's scheduled retry. False if another worker took it or it was cancelled."""
+        with get_sync_session() as session:
+            result = session.execute(
+                update(CallJobRecord)
+                .where(CallJobRecord.state == JobState.SCHEDULED.value, CallJobRecord.appointment_id == appointment_id)
+                .values(state=JobState.DONE.value, updated_at=datetime.utcnow())
+            )
+            session.commit()
+            return result.rowcount > 0
+
+    def scheduled_retries(self) -> List[CallJobRecord]:
+        with get_sync_session() as session:
+            return list(session.execute(
+                select(CallJobRecord)
+                .where(CallJobRecord.state == JobState.SCHEDULED.value)
+                .order_by(CallJobRecord.not_before)
+            ).scalars().all())
+
+    def create_campaign(self, campaign_id: str, name: str, weight: int = 1, override_window: bool = False) -> None:
+        with get_sync_session() as session:
+            session.add(CampaignRecord(
+                id=campaign_id, name=name, weight=weight, override_window=override_window, state="running"
+            ))
+            session.commit()
+
+    def set_campaign_state(self, campaign_id: str, state: str) -> None:
+        with get_sync_session() as session:
+            session.execute(
+                update(CampaignRecord)
+                .where(CampaignRecord.id == campaign_id)
+                .values(state=state, updated_at=datetime.utcnow())
+            )
+            session.commit()
+
+    def get_campaign(self, campaign_id: str) -> Optional[CampaignRecord]:
+        with get_sync_session() as session:
+            return session.get(CampaignRecord, campaign_id)
+
+    def open_campaigns(self) -> List[CampaignRecord]:
+        with get_sync_session() as session:
+            return list(session.execute(
+                select(CampaignRecord)
+                .where(CampaignRecord.state.in_(["running", "paused"]))
+                .order_by(CampaignRecord.created_at)
+            ).scalars().all())
+
+    def _set(self, job_id: int, **values) -> None:
+        values["updated_at"] = datetime.utcnow()
+        with get_sync_session() as session:
+            session.execute(update(CallJobRecord).where(CallJobRecord.id == job_id).values(**values))
+            session.commit()
+
+    @staticmethod
+    def appointment_from_job(job: CallJobRecord) -> Optional[Appointment]:
+        if not job.payload:
+            return None
+        try:
+            return Appointment.from_dict(json.loads(job.payload))
+        except Exception as e:
+            logger.warning(f"Could not restore appointment {job.appointment_id} from job {job.id}: {e}")
+            return None
+
+
+job_store = CallJobStore()
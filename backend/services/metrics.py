@@ -0,0 +1,179 @@
+import bisect
+import logging
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans a cached TwiML render (well under 1 ms) to a slow Twilio API call
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+GaugeValue = Union[float, Dict[LabelValues, float]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.label_names, key)} {_number(value)}" for key, value in values]
+        return lines
+
+
+class Histogram:
+    """Fixed buckets; an observation is a bisect and three additions under a lock."""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[LabelValues, List] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, list(counts), total) for key, (counts, total) in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Read when scraped: `read()` returns a number, or a dict of label values -> number."""
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], GaugeValue],
+                 label_names: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.read = read
+        self.label_names = tuple(label_names)
+
+    def render(self) -> List[str]:
+        value = self.read()
+        values = sorted(value.items()) if isinstance(value, dict) else [((), value)]
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        lines += [f"{self.name}{_labels(self.label_names, key)} {_number(v)}" for key, v in values]
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide metrics in the Prometheus text exposition format, served at /metrics.
+
+    Counters and histograms are updated inline where things happen; gauges
+    are callbacks read only when scraped, so idle state costs nothing. Each
+    uvicorn worker keeps its own numbers; the shared-store gauges agree
+    across workers, the counters and histograms add up.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Union[Counter, Histogram, Gauge]] = {}
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, label_names))
+
+    def histogram(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, label_names, buckets))
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], GaugeValue],
+              label_names: Sequence[str] = ()) -> Gauge:
+        gauge = Gauge(name, help_text, read, label_names)
+        self._metrics[name] = gauge  # re-registering replaces the callback
+        return gauge
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            try:
+                lines += metric.render()
+            except Exception as e:
+                logger.error(f"Could not collect metric {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+PDF_PARSE_SECONDS = metrics.histogram(
+    "pow_pdf_parse_page_seconds", "Time to extract and parse one PDF page",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+WEBHOOK_SECONDS = metrics.histogram(
+    "pow_webhook_handler_seconds", "Twilio webhook handler latency, after the form is parsed", ("route",)
+)
+TWILIO_API_SECONDS = metrics.histogram(
+    "pow_twilio_api_seconds", "Twilio REST API call latency", ("operation", "outcome")
+)
+CALL_OUTCOMES = metrics.counter("pow_call_outcomes_total", "Calls ended, by final CallStatus", ("status",))
+ANSWERED_BY = metrics.counter("pow_call_answered_by_total", "Calls ended, by AnsweredBy", ("answered_by",))
+LOG_RECORDS_DROPPED = metrics.counter(
+    "pow_log_records_dropped_total", "Log records not written: queue_full, or rate_limited per call site", ("reason",)
+)
+
+# Values Twilio documents; anything else is counted as "other" so labels stay bounded
+CALL_STATUSES = {"completed", "no-answer", "busy", "failed", "canceled", "cancelled"}
+ANSWERED_BY_VALUES = {
+    "human", "machine_start", "machine_end_beep", "machine_end_silence", "machine_end_other", "fax", "unknown",
+}
+
+
+def bounded(value: Optional[str], allowed, missing: str = "none") -> str:
+    if not value:
+        return missing
+    return value if value in allowed else "other"
@@ -0,0 +1,149 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Patient phones remembered for their caller ID; past this the least recently called are forgotten
+MAX_STICKY_PATIENTS = 50000
+
+
+class NumberStats:
+    def __init__(self, number: str) -> None:
+        self.number = number
+        self.in_flight = 0
+        self.total_calls = 0
+        self.failed_calls = 0
+        self.next_slot = 0.0  # earliest monotonic time the next call may start (CPS pacing)
+        self.last_used: Optional[float] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "number": self.number,
+            "in_flight": self.in_flight,
+            "max_concurrent": settings.NUMBER_MAX_CONCURRENT_CALLS,
+            "cps": settings.NUMBER_CALLS_PER_SECOND,
+            "total_calls": self.total_calls,
+            "failed_calls": self.failed_calls,
+            "last_used": self.last_used,
+        }
+
+
+class NumberPool:
+    """Outbound caller-ID numbers with per-number concurrency and calls-per-second limits.
+
+    A patient phone keeps the caller ID it was first given so retries show the
+    same number, unless that number is busy; new patients get the least-loaded
+    number. Nothing here waits: a number at its limit, or not yet due under
+    its CPS pacing, is simply not handed out, and the call queue dials again
+    once `next_slot_in()` has passed or a call ends.
+    """
+
+    def __init__(self, numbers: Optional[List[str]] = None) -> None:
+        self._lock = threading.Lock()
+        self._stats: Dict[str, NumberStats] = {}
+        self._sticky: "OrderedDict[str, str]" = OrderedDict()  # patient phone -> from number
+        self._calls: Dict[str, str] = {}       # call_sid -> from number
+        self.configure(numbers if numbers is not None else settings.from_numbers())
+
+    def configure(self, numbers: List[str]) -> None:
+        with self._lock:
+            for number in numbers:
+                self._stats.setdefault(number, NumberStats(number))
+            for number in list(self._stats):
+                if number not in numbers and self._stats[number].in_flight == 0:
+                    del self._stats[number]
+
+    def settings_changed(self, changed) -> None:
+        """Settings listener: pick up an edited caller-ID pool."""
+        if changed & {"TWILIO_FROM_NUMBER", "TWILIO_FROM_NUMBERS"}:
+            self.configure(settings.from_numbers())
+
+    @property
+    def numbers(self) -> List[str]:
+        return list(self._stats)
+
+    def ready(self) -> int:
+        """Numbers that could start a call right now: under their concurrency limit and due under pacing."""
+        now = time.monotonic()
+        with self._lock:
+            return sum(1 for s in self._stats.values() if self._usable(s, now))
+
+    def next_slot_in(self) -> Optional[float]:
+        """Seconds until a number with free capacity is due under pacing; None if every number is full."""
+        now = time.monotonic()
+        with self._lock:
+            open_slots = [
+                s.next_slot for s in self._stats.values() if s.in_flight < settings.NUMBER_MAX_CONCURRENT_CALLS
+            ]
+        return max(min(open_slots) - now, 0.0) if open_slots else None
+
+    def acquire(self, patient_phone: str, preferred: Optional[str] = None) -> Optional[str]:
+        """Reserve a from-number for a call to `patient_phone`, or None if no number can start a call now."""
+        now = time.monotonic()
+        with self._lock:
+            number = self._sticky.get(patient_phone) or preferred
+            stats = self._stats.get(number)
+            if stats is None or not self._usable(stats, now):
+                usable = [s for s in self._stats.values() if self._usable(s, now)]
+                if not usable:
+                    return None
+                stats = min(usable, key=lambda s: (s.in_flight, s.next_slot, s.total_calls))
+            # A busy sticky number is only passed over for this call; the patient keeps it
+            if self._sticky.get(patient_phone) not in self._stats:
+                self._sticky[patient_phone] = stats.number
+                if len(self._sticky) > MAX_STICKY_PATIENTS:
+                    self._sticky.popitem(last=False)
+            self._sticky.move_to_end(patient_phone)
+            stats.next_slot = now + 1.0 / max(settings.NUMBER_CALLS_PER_SECOND, 0.01)
+            stats.in_flight += 1
+            stats.total_calls += 1
+            stats.last_used = time.time()
+            return stats.number
+
+    @staticmethod
+    def _usable(stats: NumberStats, now: float) -> bool:
+        return stats.in_flight < settings.NUMBER_MAX_CONCURRENT_CALLS and stats.next_slot <= now
+
+    def bind(self, call_sid: str, number: str) -> None:
+        with self._lock:
+            self._calls[call_sid] = number
+
+    def adopt(self, call_sid: str, number: str) -> None:
+        """Count a call that is already up, found after a restart, against its caller ID."""
+        with self._lock:
+            stats = self._stats.get(number)
+            if stats is not None:
+                stats.in_flight += 1
+            self._calls[call_sid] = number
+
+    def number_for_call(self, call_sid: str) -> Optional[str]:
+        return self._calls.get(call_sid)
+
+    def release(self, number: Optional[str] = None, call_sid: Optional[str] = None, failed: bool = False) -> None:
+        with self._lock:
+            if call_sid is not None:
+                number = self._calls.pop(call_sid, number)
+            stats = self._stats.get(number) if number else None
+            if stats is None:
+                return
+            stats.in_flight = max(stats.in_flight - 1, 0)
+            if failed:
+                stats.failed_calls += 1
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            return {
+                "numbers": [s.to_dict() for s in self._stats.values()],
+                "sticky_patients": len(self._sticky),
+                "in_flight": sum(s.in_flight for s in self._stats.values()),
+            }
+
+
+number_pool = NumberPool()
+settings.add_listener(number_pool.settings_changed)
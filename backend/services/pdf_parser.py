@@ -1,7 +1,9 @@
 import re
+import time
 from typing import List, Dict, Optional
-import pdfplumber
 from models import Appointment
+from services.metrics import PDF_PARSE_SECONDS
+from services.profiler import PARSER_TARGET, profiler
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,14 +13,25 @@ class PracticeFusionParser:
         self.required_columns = ["PATIENT", "TIME", "PROVIDER", "TYPE", "CONFIRMATION"]
     
     def parse_pdf(self, pdf_path: str) -> List[Appointment]:
+        # Profiled on its own when an admin targets the parser
+        with profiler.section(PARSER_TARGET):
+            return self._parse_pdf(pdf_path)
+
+    def _parse_pdf(self, pdf_path: str) -> List[Appointment]:
         appointments = []
         appointment_date = None
+        page_count = 0
         
+        # pdfplumber (and pdfminer under it) loads slowly; only uploads need it
+        import pdfplumber
+
         try:
             with pdfplumber.open(pdf_path) as pdf:
                 for page_num, page in enumerate(pdf.pages, 1):
+                    started = time.perf_counter()
                     text = page.extract_text()
                     if not text:
+                        PDF_PARSE_SECONDS.observe(time.perf_counter() - started)
                         continue
                     
                     lines = text.split('\n')
@@ -38,12 +51,15 @@ class PracticeFusionParser:
                     # Add the date to each appointment
                     for apt in page_appointments:
                         apt.appointment_date = appointment_date
-                        logger.info(f"Set appointment date for {apt.patient_name}: {appointment_date}")
                     appointments.extend(page_appointments)
+                    PDF_PARSE_SECONDS.observe(time.perf_counter() - started)
+                    page_count = page_num
         except Exception as e:
             logger.error(f"Error parsing PDF: {e}")
             raise ValueError(f"Failed to parse PDF: {str(e)}")
         
+        # One line per upload; per-row lines are DEBUG and carry no patient details
+        logger.info(f"Parsed {len(appointments)} unconfirmed appointments from {page_count} pages for {appointment_date}")
         return appointments
     
     def _parse_page_lines(self, lines: List[str], page_num: int) -> List[Appointment]:
@@ -98,7 +114,7 @@ class PracticeFusionParser:
                 appointment = self._parse_appointment_block(appointment_lines)
                 if appointment and appointment.original_confirmation.lower() == "not confirmed":
                     appointments.append(appointment)
-                    logger.info(f"Found unconfirmed appointment: {appointment.patient_name} at {appointment.appointment_time}")
+                    logger.debug(f"Found unconfirmed appointment {appointment.id} at {appointment.appointment_time} on page {page_num}")
                 
                 i = j
             else:
@@ -192,7 +208,7 @@ class PracticeFusionParser:
             
             # Validate we have minimum required fields
             if patient_name and phone and appointment_time:
-                logger.debug(f"Successfully parsed: {patient_name} - {appointment_time} - {confirmation_status}")
+                logger.debug(f"Parsed appointment block: {appointment_time} - {confirmation_status}")
                 return Appointment(
                     patient_name=patient_name,
                     phone=phone,
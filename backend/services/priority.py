@@ -0,0 +1,133 @@
+import re
+from datetime import datetime
+from typing import Callable, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+from models import Appointment
+
+
+K = TypeVar("K", bound=Hashable)
+
+# Lower scores dial first; compared as tuples
+Score = Tuple
+ScoreFunction = Callable[[Appointment], Score]
+
+
+def appointment_datetime(appointment: Appointment) -> Optional[datetime]:
+    """Combine the parser's header date ("Monday, August, 11, 2025") with the row time ("9:15 AM")."""
+    if not appointment.appointment_date or not appointment.appointment_time:
+        return None
+    # Drop the weekday and the stray commas Practice Fusion puts between the parts
+    date_text = re.sub(r'^[A-Za-z]+day,?\s*', '', appointment.appointment_date.strip())
+    date_text = re.sub(r'[,\s]+', ' ', date_text).strip()
+    time_text = re.sub(r'\s+', '', appointment.appointment_time.strip()).upper()
+    for fmt in ("%B %d %Y %I:%M%p", "%b %d %Y %I:%M%p", "%m/%d/%Y %I:%M%p"):
+        try:
+            return datetime.strptime(f"{date_text} {time_text}", fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def default_priority(appointment: Appointment) -> Score:
+    """Callbacks first, then soonest appointment, then fewest attempts so far.
+
+    Appointments whose date can't be parsed sort after every dated one.
+    """
+    when = appointment_datetime(appointment)
+    return (
+        0 if appointment.needs_callback else 1,
+        when.timestamp() if when else float("inf"),
+        appointment.call_attempts,
+    )
+
+
+class IndexedHeap(Generic[K]):
+    """Binary min-heap that tracks each key's slot, so a key's priority can be
+    changed or removed in O(log n) instead of rebuilding the heap."""
+
+    def __init__(self) -> None:
+        self._items: List[Tuple[Score, K]] = []
+        self._index: Dict[K, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._index
+
+    def push(self, key: K, priority: Score) -> None:
+        if key in self._index:
+            self.update(key, priority)
+            return
+        self._items.append((priority, key))
+        self._index[key] = len(self._items) - 1
+        self._sift_up(len(self._items) - 1)
+
+    def pop(self) -> Tuple[K, Score]:
+        priority, key = self._items[0]
+        self._remove_at(0)
+        return key, priority
+
+    def peek(self) -> Optional[Tuple[K, Score]]:
+        if not self._items:
+            return None
+        priority, key = self._items[0]
+        return key, priority
+
+    def update(self, key: K, priority: Score) -> None:
+        i = self._index[key]
+        old = self._items[i][0]
+        self._items[i] = (priority, key)
+        if priority < old:
+            self._sift_up(i)
+        else:
+            self._sift_down(i)
+
+    def remove(self, key: K) -> bool:
+        i = self._index.get(key)
+        if i is None:
+            return False
+        self._remove_at(i)
+        return True
+
+    def clear(self) -> None:
+        self._items.clear()
+        self._index.clear()
+
+    def _remove_at(self, i: int) -> None:
+        last = len(self._items) - 1
+        del self._index[self._items[i][1]]
+        if i == last:
+            self._items.pop()
+            return
+        moved = self._items.pop()
+        self._items[i] = moved
+        self._index[moved[1]] = i
+        self._sift_up(i)
+        self._sift_down(self._index[moved[1]])
+
+    def _swap(self, i: int, j: int) -> None:
+        self._items[i], self._items[j] = self._items[j], self._items[i]
+        self._index[self._items[i][1]] = i
+        self._index[self._items[j][1]] = j
+
+    def _sift_up(self, i: int) -> None:
+        while i > 0:
+            parent = (i - 1) // 2
+            if self._items[i][0] < self._items[parent][0]:
+                self._swap(i, parent)
+                i = parent
+            else:
+                break
+
+    def _sift_down(self, i: int) -> None:
+        n = len(self._items)
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < n and self._items[child][0] < self._items[smallest][0]:
+                    smallest = child
+            if smallest == i:
+                return
+            self._swap(i, smallest)
+            i = smallest
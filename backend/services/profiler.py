@@ -0,0 +1,194 @@
+import asyncio
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+from typing import Dict, Iterable, List, Optional
+
+
+# Target name for PracticeFusionParser.parse_pdf; any other target is a route path
+PARSER_TARGET = "parser"
+# Longest profile an admin may ask for (seconds)
+MAX_PROFILE_SECONDS = 120
+# How long a finished window waits for requests still inside the target (seconds)
+DRAIN_SECONDS = 10
+
+_BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_NOT_PROFILING = nullcontext()
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+class CProfileSession:
+    """One cProfile window on a target: code inside `with session:` is profiled.
+
+    cProfile only sees the thread that enabled it, so each thread gets its own
+    Profile (async handlers run on the event loop thread, sync ones in the
+    threadpool) and they are merged at the end. On the event loop thread the
+    profile stays on while a handler awaits, so coroutines that run in those
+    gaps are in the profile too.
+    """
+
+    def __init__(self, target: str) -> None:
+        self.target = target
+        self.requests = 0
+        self._lock = threading.Lock()
+        # thread id -> [Profile, nesting depth]
+        self._profiles: Dict[int, List] = {}
+
+    def __enter__(self):
+        with self._lock:
+            entry = self._profiles.setdefault(threading.get_ident(), [cProfile.Profile(), 0])
+            entry[1] += 1
+            if entry[1] == 1:
+                self.requests += 1
+                try:
+                    entry[0].enable()
+                except ValueError:
+                    pass  # another profiler owns this thread (or, on 3.12+, the interpreter)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        with self._lock:
+            entry = self._profiles[threading.get_ident()]
+            entry[1] -= 1
+            if entry[1] == 0:
+                entry[0].disable()
+
+    def busy(self) -> bool:
+        with self._lock:
+            return any(depth for _, depth in self._profiles.values())
+
+    def stats(self) -> Optional[pstats.Stats]:
+        with self._lock:
+            profiles = [profile for profile, _ in self._profiles.values()]
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+
+def pstats_dump(stats: pstats.Stats) -> bytes:
+    """The bytes Profile.dump_stats writes: load with pstats.Stats(path), snakeviz or gprof2dot."""
+    return marshal.dumps(stats.stats)
+
+
+def pstats_text(stats: pstats.Stats, limit: int = 60) -> str:
+    out = io.StringIO()
+    stats.stream = out
+    stats.strip_dirs().sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
+
+
+def _label(code, labels: Dict) -> str:
+    label = labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        if filename.startswith(_BACKEND):
+            filename = os.path.relpath(filename, _BACKEND)
+        else:
+            filename = os.path.basename(filename)
+        name = getattr(code, "co_qualname", code.co_name)
+        label = labels[code] = f"{name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+    return label
+
+
+def sample_stacks(seconds: float, interval: float = 0.005, codes: Optional[Iterable] = None) -> Dict[str, int]:
+    """Sample every thread's stack for `seconds`; collapsed stacks ("thread;outer;...;inner") -> samples.
+
+    With `codes`, only stacks running one of those code objects count, so a
+    route's samples are the moments its handler (or something it called)
+    was actually on the CPU, not the moments it sat awaiting. Blocks the
+    calling thread; the sampled ones only pay for the GIL hand-offs.
+    """
+    codes = frozenset(codes) if codes is not None else None
+    me = threading.get_ident()
+    labels: Dict = {}
+    counts: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            hit = codes is None
+            while frame is not None:
+                code = frame.f_code
+                if not hit and code in codes:
+                    hit = True
+                stack.append(_label(code, labels))
+                frame = frame.f_back
+            if hit:
+                stack.append(names.get(ident, f"thread-{ident}").replace(";", ":"))
+                counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return dict(counts)
+
+
+def collapsed(counts: Dict[str, int]) -> str:
+    """Brendan Gregg's folded format, for flamegraph.pl, speedscope or inferno."""
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
+
+
+class Profiler:
+    """On-demand profiling of a live process, driven from /api/admin/profile.
+
+    One run at a time. A cProfile run arms a session for a target; TimedRoute
+    (for a route path) and the PDF parser enter it while it is armed and
+    skip it with a single dict lookup otherwise. A sampling run needs no
+    hooks at all: a thread reads the other threads' stacks.
+    """
+
+    def __init__(self) -> None:
+        self._sessions: Dict[str, CProfileSession] = {}
+        self._running: Optional[Dict] = None
+
+    def section(self, target: str):
+        """Context manager around code that belongs to `target`; free unless that target is being profiled."""
+        return self._sessions.get(target) or _NOT_PROFILING
+
+    def _start(self, kind: str, target: Optional[str], seconds: float) -> None:
+        if self._running is not None:
+            raise ProfilerBusy(f"A {self._running['kind']} profile is already running")
+        self._running = {"kind": kind, "target": target, "seconds": seconds, "started_at": time.time()}
+
+    async def cprofile(self, target: str, seconds: float) -> CProfileSession:
+        """Profile `target` for `seconds`; the session holds the merged stats."""
+        self._start("cprofile", target, seconds)
+        session = CProfileSession(target)
+        self._sessions[target] = session
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self._sessions.pop(target, None)
+            self._running = None
+        waited = 0.0
+        while session.busy() and waited < DRAIN_SECONDS:
+            await asyncio.sleep(0.05)
+            waited += 0.05
+        return session
+
+    async def sample(self, seconds: float, interval: float, target: Optional[str] = None,
+                     codes: Optional[Iterable] = None) -> Dict[str, int]:
+        self._start("sample", target, seconds)
+        try:
+            return await asyncio.to_thread(sample_stacks, seconds, interval, codes)
+        finally:
+            self._running = None
+
+    def get_status(self) -> Dict:
+        return {"running": self._running, "armed": sorted(self._sessions)}
+
+
+profiler = Profiler()
@@ -0,0 +1,175 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from models import appointment_store, Appointment, AppointmentStatus
+from services.job_store import job_store
+from settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Call outcomes that earn another attempt
+OUTCOME_BUSY = "busy"
+OUTCOME_NO_ANSWER = "no-answer"
+OUTCOME_VOICEMAIL = "voicemail"
+OUTCOME_NO_SELECTION = "no-selection"
+
+# Appointment statuses a retry may still dial; anything else means the patient has answered us
+RETRYABLE_STATUSES = [AppointmentStatus.NOT_CONFIRMED, AppointmentStatus.VOICEMAIL]
+
+# Upper bound on how long the loop sleeps, so newly scheduled retries and call window changes are noticed
+TICK_SECONDS = 30
+
+
+def backoff_minutes(outcome: str, attempts: int) -> Optional[float]:
+    base = {
+        OUTCOME_BUSY: settings.RETRY_BUSY_MINUTES,
+        OUTCOME_NO_ANSWER: settings.RETRY_NO_ANSWER_MINUTES,
+        OUTCOME_VOICEMAIL: settings.RETRY_VOICEMAIL_MINUTES,
+        OUTCOME_NO_SELECTION: settings.RETRY_NO_SELECTION_MINUTES,
+    }.get(outcome)
+    if base is None:
+        return None
+    return base * (settings.RETRY_BACKOFF_FACTOR ** max(attempts - 1, 0))
+
+
+class RetryScheduler:
+    """Min-heap of pending retries keyed by due time.
+
+    Cancelling or rescheduling an appointment only drops it from `_pending`; the
+    stale heap entry is skipped when it surfaces, so both are O(1) plus the
+    O(log n) push.
+
+    Each pending retry is also a SCHEDULED row in the job table, so restore()
+    can rebuild the heap after a restart, and settling that row when the retry
+    comes due ensures only one worker dials it.
+    """
+
+    def __init__(self) -> None:
+        self._heap: List[Tuple[float, int, str]] = []
+        self._pending: Dict[str, Tuple[float, int, str]] = {}
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def schedule(self, appointment: Appointment, outcome: str) -> Optional[float]:
+        """Queue another attempt after a call ended with `outcome`. Returns the delay in seconds."""
+        if appointment.call_attempts >= settings.MAX_CALL_ATTEMPTS:
+            logger.info(f"RetryScheduler: {appointment.id} reached {appointment.call_attempts} attempts, not retrying")
+            self.cancel(appointment.id)
+            return None
+        minutes = backoff_minutes(outcome, appointment.call_attempts)
+        if minutes is None:
+            return None
+        delay = minutes * 60
+        due = time.time() + delay
+        job_store.schedule_retry(appointment, datetime.fromtimestamp(due, timezone.utc).replace(tzinfo=None))
+        self._push(appointment.id, due)
+        logger.info(f"RetryScheduler: retry for {appointment.id} ({outcome}) in {minutes:.0f} min")
+        if self._wakeup:
+            self._wakeup.set()
+        return delay
+
+    def cancel(self, appointment_id: str) -> bool:
+        # The row may be pending in another worker's heap, so cancel it even if ours has no entry
+        cancelled = job_store.cancel_retries(appointment_id) > 0
+        return self._pending.pop(appointment_id, None) is not None or cancelled
+
+    def clear(self) -> None:
+        job_store.cancel_retries()
+        self._heap.clear()
+        self._pending.clear()
+
+    def restore(self) -> int:
+        """Rebuild the heap from the scheduled retry rows after a restart. Returns how many were restored."""
+        restored = 0
+        for job in job_store.scheduled_retries():
+            if job.appointment_id in self._pending:
+                continue
+            if appointment_store.get_appointment(job.appointment_id) is None:
+                apt = job_store.appointment_from_job(job)
+                if apt is None:
+                    job_store.cancel_retries(job.appointment_id)
+                    continue
+                appointment_store.add_appointment(apt)
+            self._push(job.appointment_id, job.not_before.replace(tzinfo=timezone.utc).timestamp())
+            restored += 1
+        if restored:
+            logger.info(f"RetryScheduler: restored {restored} pending retries")
+        return restored
+
+    def _push(self, appointment_id: str, due: float) -> None:
+        entry = (due, next(self._counter), appointment_id)
+        self._pending[appointment_id] = entry
+        heapq.heappush(self._heap, entry)
+
+    def pop_due(self, now: Optional[float] = None) -> List[str]:
+        """Remove and return appointment IDs whose retry is due and still wanted."""
+        now = time.time() if now is None else now
+        due: List[str] = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            apt_id = entry[2]
+            if self._pending.get(apt_id) is not entry:
+                continue  # cancelled or superseded by a later schedule()
+            del self._pending[apt_id]
+            apt = appointment_store.get_appointment(apt_id)
+            if (not apt or apt.status not in RETRYABLE_STATUSES
+                    or apt.call_attempts >= settings.MAX_CALL_ATTEMPTS):
+                job_store.cancel_retries(apt_id)
+                continue
+            if job_store.take_retry(apt_id):
+                due.append(apt_id)
+        return due
+
+    def next_due_in(self) -> Optional[float]:
+        while self._heap and self._pending.get(self._heap[0][2]) is not self._heap[0]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return max(self._heap[0][0] - time.time(), 0.0)
+
+    def get_status(self) -> Dict:
+        now = time.time()
+        return {
+            "pending_count": len(self._pending),
+            "retries": [
+                {"appointment_id": apt_id, "due_in_seconds": int(max(due - now, 0))}
+                for due, _, apt_id in sorted(self._pending.values())
+            ],
+        }
+
+    async def run(self) -> None:
+        self._wakeup = asyncio.Event()
+        logger.info("RetryScheduler: started")
+        while True:
+            wait = self.next_due_in()
+            wait = TICK_SECONDS if wait is None else min(wait, TICK_SECONDS)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"RetryScheduler: tick failed: {e}")
+
+    def tick(self) -> List[str]:
+        # Outside the call window due retries simply stay in the heap until it opens
+        if not settings.is_within_call_window():
+            return []
+        due = self.pop_due()
+        if due:
+            # Lazy import to avoid circular import at module import time
+            from services.call_queue import call_queue
+            logger.info(f"RetryScheduler: dialing {len(due)} retries")
+            call_queue.add_to_batch(due)
+        return due
+
+
+retry_scheduler = RetryScheduler()
@@ -1,35 +1,93 @@
-from twilio.rest import Client
-from twilio.twiml.voice_response import VoiceResponse, Gather, Dial
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 import logging
+import time
 from settings import settings
 from models import Appointment, AppointmentStatus, appointment_store
+from services.call_context import CallContext, can_sign, webhook_url
+from services.number_pool import number_pool
+from services.twiml_templates import twiml_templates
+from services.webhook_journal import webhook_journal
+from services.call_timeline import call_timeline
+from services.metrics import ANSWERED_BY, ANSWERED_BY_VALUES, CALL_OUTCOMES, CALL_STATUSES, TWILIO_API_SECONDS, bounded
 
 logger = logging.getLogger(__name__)
 
+# Settings the REST client is built from
+CLIENT_SETTINGS = {"TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_API_BASE_URL"}
+
+MACHINE_ANSWERS = ["machine_end_beep", "machine_end_silence", "machine_end_other", "machine_start", "fax"]
+
+# Keypresses that settle an appointment
+DIGIT_STATUS = {
+    "1": AppointmentStatus.CONFIRMED,
+    "2": AppointmentStatus.RESCHEDULING,
+    "3": AppointmentStatus.CANCELLED,
+    "9": AppointmentStatus.DO_NOT_CALL,
+}
+
 class TwilioService:
-    def __init__(self):
-        if settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN:
-            self.client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-        else:
-            self.client = None
+    def __init__(self, base_url: Optional[str] = None):
+        # A stand-in API (fake_twilio.py) runs next to the app, so it can reach a local BASE_URL
+        self._base_url_override = base_url
+        self._reset_client()
+
+    def _reset_client(self) -> None:
+        self.base_url = (self._base_url_override or settings.TWILIO_API_BASE_URL).rstrip("/")
+        self._client = None
+        self._client_ready = False
+        if not (settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN):
+            self._client_ready = True
             logger.warning("Twilio credentials not configured")
+
+    def settings_changed(self, changed) -> None:
+        """Settings listener: rebuild the REST client on its next use after credentials change."""
+        if changed & CLIENT_SETTINGS:
+            self._reset_client()
+
+    @property
+    def client(self):
+        """REST client, built on first use: importing twilio.rest costs more than the rest of startup's imports."""
+        if not self._client_ready:
+            from twilio.rest import Client
+            client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+            if self.base_url:
+                client.api.base_url = self.base_url
+            self._client, self._client_ready = client, True
+        return self._client
+
+    @client.setter
+    def client(self, client) -> None:
+        self._client, self._client_ready = client, True
     
-    def make_call(self, appointment: Appointment, override_window: bool = False) -> Optional[str]:
+    def make_call(self, appointment: Appointment, override_window: bool = False,
+                  household: Optional[List[Appointment]] = None) -> Optional[str]:
+        """Place one outbound call. `household` lists other appointments on the same phone
+        number; they are covered by the same call with one menu per appointment."""
         if not self.client:
             logger.error("Twilio client not initialized")
             return None
         
         # Call window restriction removed per practice workflow
         
+        # Same caller ID as this patient's earlier attempts when possible
+        from_number = number_pool.acquire(appointment.phone, preferred=appointment.caller_id)
+        if not from_number:
+            if number_pool.numbers:
+                logger.warning(f"No caller ID free to call {appointment.id}")
+            else:
+                logger.error("No outbound caller ID configured")
+            return None
+        
         try:
+            # New calls use BASE_URL as it is now, even from inside a webhook for an older call
+            base_url = settings.BASE_URL
             # Check if we have a valid PUBLIC webhook URL
-            has_valid_webhook = settings.BASE_URL and not any(
-                bad in settings.BASE_URL for bad in ["localhost", "127.0.0.1", "192.168."]
-            )
+            has_valid_webhook = base_url and (self.base_url or not any(
+                bad in base_url for bad in ["localhost", "127.0.0.1", "192.168."]
+            ))
             
             if has_valid_webhook:
-                logger.info(f"Using webhook mode with BASE_URL: {settings.BASE_URL}")
+                logger.info(f"Using webhook mode with BASE_URL: {base_url}")
                 # Use webhooks if we have a valid URL
                 extra = {}
                 if getattr(settings, 'AMD_MODE', 'none') != 'none':
@@ -40,11 +98,17 @@ class TwilioService:
                     # Only use async AMD for simple detection; for DetectMessageEnd we want synchronous
                     if settings.AMD_MODE == "enable":
                         extra["async_amd"] = True
-                call = self.client.calls.create(
+                # Sign who the call is for onto the webhook URLs so any worker can answer them
+                context = None
+                if can_sign():
+                    context = CallContext(
+                        [appointment.id] + [apt.id for apt in household or []], caller_id=from_number
+                    )
+                call = self._create_call(
                     to=appointment.phone,
-                    from_=settings.TWILIO_FROM_NUMBER,
-                    url=f"{settings.BASE_URL}/twilio/voice",
-                    status_callback=f"{settings.BASE_URL}/twilio/status",
+                    from_=from_number,
+                    url=webhook_url("/twilio/voice", context, base=base_url),
+                    status_callback=webhook_url("/twilio/status", context, base=base_url),
                     status_callback_event=['initiated', 'ringing', 'answered', 'completed'],
                     status_callback_method='POST',
                     **extra
@@ -52,226 +116,225 @@ class TwilioService:
             else:
                 logger.info(f"Using inline TwiML mode (no webhooks) - BASE_URL: {settings.BASE_URL}")
                 # Use inline TwiML (no webhooks needed!)
-                response = VoiceResponse()
-                if getattr(settings, 'TTS_INITIAL_PAUSE', 0):
-                    response.pause(length=int(settings.TTS_INITIAL_PAUSE))
-                
-                # Include appointment details in inline TwiML
-                patient_first_name = appointment.patient_name.split()[0] if appointment.patient_name else "patient"
-                date_str = appointment.appointment_date if appointment.appointment_date else "your appointment"
-                time_str = appointment.appointment_time
-                
-                greeting = (
-                    f"This is Prisk Orthopaedics calling {patient_first_name} "
-                    f"to confirm an appointment that you have on {date_str} at {time_str}. "
-                )
-                response.say(greeting, voice=settings.TTS_VOICE)
-                
-                gather = response.gather(num_digits=1, timeout=10)
-                gather.say(
-                    "Press 1 to confirm. "
-                    "Press 2 to speak to our office to reschedule. "
-                    "Press 3 to cancel. "
-                    "Press 5 to repeat this message. "
-                    "Press 9 to stop reminders.",
-                    voice=settings.TTS_VOICE
-                )
-                response.say("We didn't receive your selection. Goodbye.", voice=settings.TTS_VOICE)
+                if household:
+                    twiml = twiml_templates.household_inline([appointment] + household)
+                else:
+                    twiml = twiml_templates.inline(appointment)
                 
-                call = self.client.calls.create(
+                call = self._create_call(
                     to=appointment.phone,
-                    from_=settings.TWILIO_FROM_NUMBER,
-                    twiml=str(response)
+                    from_=from_number,
+                    twiml=twiml
                 )
-            
-            appointment_store.map_call_to_appointment(call.sid, appointment.id)
-            appointment.call_attempts += 1
-            appointment.status = AppointmentStatus.CALLING
-            
-            logger.info(f"Call initiated: {call.sid} for appointment {appointment.id}")
-            return call.sid
         except Exception as e:
             logger.error(f"Error making call: {e}")
+            number_pool.release(from_number, failed=True)
             return None
-    
-    def generate_initial_twiml(self, appointment=None, attempt_num: int = 1) -> str:
-        response = VoiceResponse()
-        
-        logger.info(f"Generating TwiML - BASE_URL: {settings.BASE_URL}, Attempt: {attempt_num}")
-        
-        # Optional short pause on first attempt
-        if attempt_num == 1 and getattr(settings, 'TTS_INITIAL_PAUSE', 0):
-            response.pause(length=int(settings.TTS_INITIAL_PAUSE))
-        
-        # Build the greeting message
-        if appointment:
-            patient_first_name = appointment.patient_name.split()[0] if appointment.patient_name else "patient"
-            date_str = appointment.appointment_date if appointment.appointment_date else "your upcoming appointment"
-            time_str = appointment.appointment_time
-            
-            if attempt_num == 1:
-                greeting = (
-                    f"This is Prisk Orthopaedics calling {patient_first_name} "
-                    f"to confirm an appointment that you have on {date_str} at {time_str}. "
-                )
-            else:
-                greeting = f"Let me repeat that for you {patient_first_name}. "
-        else:
-            greeting = "This is Prisk Orthopaedics calling to confirm your appointment. "
-        
-        response.say(greeting, voice=settings.TTS_VOICE, language="en-US")
-        
-        # Create gather for patient response
-        gather_url = f"{settings.BASE_URL}/twilio/gather"
-        logger.info(f"Setting gather action URL to: {gather_url}")
-        
-        gather = Gather(
-            num_digits=1,
-            action=gather_url,
-            method="POST",
-            timeout=10,
-            finish_on_key="#"
-        )
         
-        gather.say(
-            "Press 1 to confirm. "
-            "Press 2 to speak to our office to reschedule. "
-            "Press 3 to cancel. "
-            "Press 5 to repeat this message. "
-            "Press 9 to stop reminders.",
-            voice=settings.TTS_VOICE,
-            language="en-US"
-        )
-        
-        response.append(gather)
+        # The call is up from here on: a bookkeeping error must not report it failed or free its caller ID
+        try:
+            self.register_call(call.sid, [appointment] + (household or []), from_number)
+        except Exception as e:
+            logger.error(f"Call {call.sid} placed for appointment {appointment.id} but not fully recorded: {e}")
         
-        # Fallback behavior if gather doesn't work (only retry once to avoid loops)
-        if "localhost" not in settings.BASE_URL and "192.168" not in settings.BASE_URL:
-            if attempt_num < 2:
-                response.say("I didn't get your response. Let me try again.", voice=settings.TTS_VOICE)
-                response.redirect(f"{settings.BASE_URL}/twilio/voice?attempt={attempt_num + 1}", method="POST")
-            else:
-                response.say("Thank you. Goodbye.", voice=settings.TTS_VOICE)
-                response.hangup()
+        logger.info(f"Call initiated: {call.sid} for appointment {appointment.id}"
+                    + (f" and {len(household)} household appointments" if household else ""))
+        return call.sid
+    
+    def _create_call(self, **params):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            call = self.client.calls.create(**params)
+            outcome = "ok"
+            return call
+        finally:
+            TWILIO_API_SECONDS.observe(time.perf_counter() - started, "calls.create", outcome)
+
+    def register_call(self, call_sid: str, appointments: List[Appointment], from_number: str) -> None:
+        """Record a placed call: map its CallSid (first appointment leads) and move everyone on it to Calling."""
+        # What routes this call's webhooks and frees its caller ID goes first; the records after can fail alone
+        number_pool.bind(call_sid, from_number)
+        dialed = [apt.to_dict() for apt in appointments]
+        if len(appointments) > 1:
+            appointment_store.map_call_to_household(call_sid, [apt.id for apt in appointments])
         else:
-            response.say("If you need to confirm or cancel, please call us back at 4 1 2, 5 2 5, 7 6 9 2. Thank you.", voice=settings.TTS_VOICE)
-            response.hangup()
+            appointment_store.map_call_to_appointment(call_sid, appointments[0].id)
+        for apt in appointments:
+            applied = appointment_store.update(apt.id, lambda current: {
+                "call_attempts": current.call_attempts + 1,
+                "status": AppointmentStatus.CALLING,
+                "caller_id": from_number,
+                "call_sid": call_sid,
+            })
+            if applied is None:
+                logger.warning(f"Call {call_sid} placed but {apt.id} could not move to Calling from {apt.status}")
+        webhook_journal.record_call(call_sid, dialed, from_number)
+        call_timeline.record(call_sid, "dialed")
+    
+    def generate_initial_twiml(self, appointment=None, attempt_num: int = 1,
+                               context: Optional[CallContext] = None) -> str:
+        logger.debug(f"Generating TwiML - BASE_URL: {settings.BASE_URL}, Attempt: {attempt_num}")
+        return twiml_templates.initial(appointment, attempt_num, context)
+    
+    def resolve_appointments(self, call_sid: Optional[str], context: Optional[CallContext] = None) -> List[Appointment]:
+        """Appointments a webhook is about. The signed context names them, so this works on a
+        worker that did not place the call; without one, fall back to this process's call map."""
+        if context is not None:
+            appointments = [
+                apt for apt in (appointment_store.get_appointment(apt_id) for apt_id in context.appointment_ids) if apt
+            ]
+            if appointments:
+                if call_sid and appointment_store.appointment_id_for_call(call_sid) is None:
+                    if len(appointments) > 1:
+                        appointment_store.map_call_to_household(call_sid, [apt.id for apt in appointments])
+                    else:
+                        appointment_store.map_call_to_appointment(call_sid, appointments[0].id)
+                return appointments
+        return appointment_store.get_appointments_by_call_sid(call_sid) if call_sid else []
+    
+    @staticmethod
+    def _caller_id(call_sid: str, context: Optional[CallContext]) -> str:
+        return (context and context.caller_id) or number_pool.number_for_call(call_sid) or settings.TWILIO_FROM_NUMBER
+    
+    def generate_household_twiml(self, appointments: List[Appointment], item: int = 0, attempt_num: int = 1,
+                                 context: Optional[CallContext] = None) -> str:
+        """One call, several appointments: list them all, then walk through one menu per appointment.
         
-        return str(response)
+        Each menu's gather posts back with `item` so the digit lands on the right appointment.
+        """
+        item = min(max(item, 0), len(appointments) - 1)
+        return twiml_templates.household_menu(appointments, item, attempt_num, context)
     
-    def handle_gather(self, digits: str, call_sid: str) -> str:
-        response = VoiceResponse()
-        appointment = appointment_store.get_appointment_by_call_sid(call_sid)
+    def handle_gather(self, digits: str, call_sid: str, item: Optional[int] = None,
+                      context: Optional[CallContext] = None) -> str:
+        household = self.resolve_appointments(call_sid, context)
         
-        if not appointment:
-            response.say("Thank you for calling. Goodbye.", voice=settings.TTS_VOICE)
-            response.hangup()
-            return str(response)
+        if not household:
+            return twiml_templates.gather_reply(None)
         
-        if digits == "1":
-            appointment.status = AppointmentStatus.CONFIRMED
-            response.say("Your appointment is confirmed. Thank you!", voice=settings.TTS_VOICE)
-            response.hangup()
+        if len(household) > 1:
+            item = context.item if context else item
+            return self._handle_household_gather(digits, call_sid, household, item or 0, context)
+        appointment = household[0]
         
-        elif digits == "2":
-            appointment.status = AppointmentStatus.RESCHEDULING
-            response.say("Please hold while I connect you to our office.", voice=settings.TTS_VOICE)
-            dial = Dial(callerId=settings.TWILIO_FROM_NUMBER, answer_on_bridge=True)
-            dial.number(settings.JIVE_MAIN_NUMBER)
-            response.append(dial)
+        if digits in DIGIT_STATUS:
+            # The patient's answer wins over whatever state the call left it in
+            appointment_store.compare_and_set_status(appointment.id, None, DIGIT_STATUS[digits])
         
-        elif digits == "3":
-            appointment.status = AppointmentStatus.CANCELLED
-            response.say("Your appointment has been cancelled. Goodbye.", voice=settings.TTS_VOICE)
-            response.hangup()
+        if digits in ("1", "3", "9"):
+            # The patient has answered us; drop any pending retry
+            self._drop_retry(appointment.id)
         
-        elif digits == "5":
-            # Repeat the message by redirecting back to the voice menu as a repeat attempt
-            response.say("Let me repeat that.", voice=settings.TTS_VOICE)
-            response.redirect(f"{settings.BASE_URL}/twilio/voice?attempt=2", method="POST")
+        return twiml_templates.gather_reply(digits, self._caller_id(call_sid, context), context)
+    
+    def _handle_household_gather(self, digits: str, call_sid: str, household: List[Appointment], item: int,
+                                 context: Optional[CallContext] = None) -> str:
+        item = min(max(item, 0), len(household) - 1)
+        appointment = household[item]
+        repeat_menu = webhook_url("/twilio/voice", context, item=item, attempt=2)
+        next_menu = None
+        if item + 1 < len(household):
+            next_menu = webhook_url("/twilio/voice", context, item=item + 1, **({"attempt": 1} if context else {}))
         
-        elif digits == "9":
-            appointment.status = AppointmentStatus.DO_NOT_CALL
-            response.say("We will not call you again about this appointment. Thank you.", voice=settings.TTS_VOICE)
-            response.hangup()
+        # On 2, staff will sort out the rest of the household on the transfer
+        if digits in DIGIT_STATUS:
+            appointment_store.compare_and_set_status(appointment.id, None, DIGIT_STATUS[digits])
         
-        else:
-            response.say("Invalid selection.", voice=settings.TTS_VOICE)
-            response.redirect(f"{settings.BASE_URL}/twilio/voice", method="POST")
+        if digits in ("1", "3", "9"):
+            self._drop_retry(appointment.id)
         
-        return str(response)
+        return twiml_templates.household_gather_reply(digits, self._caller_id(call_sid, context), repeat_menu, next_menu)
+    
+    @staticmethod
+    def _drop_retry(appointment_id: str) -> None:
+        # Runs after the answer is recorded: a retry left behind is skipped anyway once the appointment is settled
+        from services.retry_scheduler import retry_scheduler  # type: ignore
+        try:
+            retry_scheduler.cancel(appointment_id)
+        except Exception as e:
+            logger.warning(f"Could not cancel the pending retry for {appointment_id}: {e}")
+    
+    def generate_household_voicemail_twiml(self, appointments: List[Appointment]) -> str:
+        return twiml_templates.household_voicemail(appointments)
     
     def generate_voicemail_twiml(self, appointment=None) -> str:
-        response = VoiceResponse()
-        
-        # Minimal pause then one-shot message and hangup
-        response.pause(length=1)
-        
-        if appointment:
-            patient_first_name = appointment.patient_name.split()[0] if appointment.patient_name else "patient"
-            date_str = appointment.appointment_date if appointment.appointment_date else "your upcoming appointment"
-            time_str = appointment.appointment_time
-            
-            message = (
-                f"This is Prisk Orthopaedics calling to remind you that you have an appointment on {date_str} at {time_str}. "
-                f"Please call us at 4 1 2, 5 2 5, 7 6 9 2 if you can make the appointment or need to cancel or reschedule. Goodbye."
-            )
-        else:
-            message = (
-                "This is Prisk Orthopaedics calling about your upcoming appointment. "
-                "Please call us at 4 1 2, 5 2 5, 7 6 9 2 if you can make the appointment or need to cancel or reschedule. Goodbye."
-            )
-        
-        response.say(message, voice=settings.TTS_VOICE, language="en-US")
-        response.hangup()
-        
-        return str(response)
+        return twiml_templates.voicemail(appointment)
     
-    def handle_status_callback(self, call_sid: str, call_status: str, answered_by: Optional[str] = None) -> None:
-        appointment = appointment_store.get_appointment_by_call_sid(call_sid)
+    def handle_status_callback(self, call_sid: str, call_status: str, answered_by: Optional[str] = None,
+                               context: Optional[CallContext] = None) -> None:
+        appointments = self.resolve_appointments(call_sid, context)
         
-        if not appointment:
+        if not appointments:
             logger.warning(f"No appointment found for call {call_sid}")
             return
         
-        logger.info(f"Call {call_sid} status: {call_status}, answered_by: {answered_by}, current apt status: {appointment.status}")
+        for appointment in appointments:
+            logger.info(f"Call {call_sid} status: {call_status}, answered_by: {answered_by}, current apt status: {appointment.status}")
+            # Recomputed on a fresh read if a keypress lands first, so it can't be overwritten
+            applied = appointment_store.update(
+                appointment.id, lambda current: self._status_changes(current, call_status, answered_by)
+            )
+            retry_outcome = self._retry_outcome(call_status, answered_by) if applied and "status" in applied else None
+
+            if retry_outcome:
+                try:
+                    from services.retry_scheduler import retry_scheduler  # type: ignore
+                    retry_scheduler.schedule(appointment, retry_outcome)
+                except Exception as e:
+                    logger.error(f"Could not schedule retry for {appointment.id}: {e}")
+
+        # Notify queue that this call completed so it can advance
+        if call_status in ["completed", "no-answer", "busy", "failed", "canceled", "cancelled"]:
+            CALL_OUTCOMES.inc(bounded(call_status, CALL_STATUSES))
+            ANSWERED_BY.inc(bounded(answered_by, ANSWERED_BY_VALUES))
+            number_pool.release(call_sid=call_sid, failed=call_status == "failed")
+            try:
+                # Lazy import to avoid circular import at module import time
+                from services.call_queue import call_queue  # type: ignore
+                call_queue.on_call_finished(call_sid)
+            except Exception as e:
+                logger.debug(f"CallQueue advance error ignored: {e}")
+            # Keep the mapping a while for late callbacks, then let it go
+            appointment_store.finish_call(call_sid)
+
+    @staticmethod
+    def _status_changes(appointment: Appointment, call_status: str, answered_by: Optional[str]) -> Optional[Dict]:
+        """Changes one status callback makes to an appointment, given its current state."""
         # Store raw AnsweredBy for UI insight
-        appointment.last_answered_by = answered_by
+        changes = {"last_answered_by": answered_by} if appointment.last_answered_by != answered_by else {}
         
         if call_status == "completed":
             # Only update if status is still "Calling" (not updated by gather)
             if appointment.status == AppointmentStatus.CALLING:
-                if answered_by in ["machine_end_beep", "machine_end_silence", "machine_end_other", "machine_start", "fax"]:
-                    appointment.status = AppointmentStatus.VOICEMAIL
-                    appointment.notes = "Left voicemail"
-                    appointment.needs_callback = False
+                if answered_by in MACHINE_ANSWERS:
+                    changes.update(status=AppointmentStatus.VOICEMAIL, notes="Left voicemail", needs_callback=False)
+                elif answered_by == "human":
+                    # Human answered but no button pressed
+                    changes.update(status=AppointmentStatus.NOT_CONFIRMED, notes="Answered by human - no selection",
+                                   needs_callback=True)
                 else:
-                    # Human/unknown answered but no button pressed
-                    appointment.status = AppointmentStatus.NOT_CONFIRMED
-                    if answered_by == "human":
-                        appointment.notes = "Answered by human - no selection"
-                        appointment.needs_callback = True
-                    else:
-                        appointment.notes = "Call completed - no response"
-                        appointment.needs_callback = False
+                    changes.update(status=AppointmentStatus.NOT_CONFIRMED, notes="Call completed - no response",
+                                   needs_callback=False)
         
         elif call_status in ["no-answer", "busy"]:
-            appointment.status = AppointmentStatus.NOT_CONFIRMED
-            appointment.notes = f"Call {call_status}"
-            appointment.needs_callback = False
+            changes.update(status=AppointmentStatus.NOT_CONFIRMED, notes=f"Call {call_status}", needs_callback=False)
         
         elif call_status in ["failed", "cancelled"]:
-            appointment.status = AppointmentStatus.NOT_CONFIRMED
-            appointment.notes = f"Call failed: {call_status}"
-            appointment.needs_callback = False
-
-        # Notify queue that this call completed so it can advance
-        if call_status in ["completed", "no-answer", "busy", "failed", "canceled", "cancelled"]:
-            try:
-                # Lazy import to avoid circular import at module import time
-                from services.call_queue import call_queue  # type: ignore
-                call_queue.on_call_finished(call_sid)
-            except Exception as e:
-                logger.debug(f"CallQueue advance error ignored: {e}")
+            changes.update(status=AppointmentStatus.NOT_CONFIRMED, notes=f"Call failed: {call_status}",
+                           needs_callback=False)
+        
+        return changes or None
+    
+    @staticmethod
+    def _retry_outcome(call_status: str, answered_by: Optional[str]) -> Optional[str]:
+        if call_status == "completed":
+            if answered_by in MACHINE_ANSWERS:
+                return "voicemail"
+            return "no-selection" if answered_by == "human" else "no-answer"
+        if call_status in ["no-answer", "busy"]:
+            return call_status
+        return None
 
-twilio_service = TwilioService()
\ No newline at end of file
+twilio_service = TwilioService()
+settings.add_listener(twilio_service.settings_changed)
@@ -0,0 +1,507 @@
+import logging
+import threading
+from collections import OrderedDict
+from string import Template
+from typing import Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from twilio.twiml.voice_response import VoiceResponse, Gather, Dial
+
+from models import Appointment, appointment_store
+from services.call_context import CallContext, current_base_url, webhook_url
+from settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+MENU = (
+    "Press 1 to confirm. "
+    "Press 2 to speak to our office to reschedule. "
+    "Press 3 to cancel. "
+    "Press 5 to repeat this message. "
+    "Press 9 to stop reminders."
+)
+
+# Placeholders the builders are run with once; their XML becomes a string.Template
+_FIRST, _DATE, _TIME, _CALLER_ID = "@@first@@", "@@date@@", "@@time@@", "@@caller_id@@"
+_GATHER_URL, _RETRY_URL, _NEXT_URL = "@@gather_url@@", "@@retry_url@@", "@@next_url@@"
+_DIAL_URL = "@@dial_url@@"
+_GREETING, _ITEM, _COUNT, _LISTING = "@@greeting@@", "@@item@@", "@@count@@", "@@listing@@"
+_PLACEHOLDERS = {
+    _FIRST: "${first}", _DATE: "${date}", _TIME: "${time}", _CALLER_ID: "${caller_id}",
+    _GATHER_URL: "${gather_url}", _RETRY_URL: "${retry_url}", _NEXT_URL: "${next_url}", _DIAL_URL: "${dial_url}",
+    _GREETING: "${greeting}", _ITEM: "${item}", _COUNT: "${count}", _LISTING: "${listing}",
+}
+
+# What a household call says after a keypress settles one of its appointments
+HOUSEHOLD_ACKS = {
+    "1": "Confirmed.",
+    "3": "Cancelled.",
+    "9": "We will not call you again about this appointment.",
+}
+
+# Appointments whose rendered scripts are kept; each holds a handful of branches
+RENDER_CACHE_SIZE = 5000
+
+
+def _is_local() -> bool:
+    return "localhost" in settings.BASE_URL or "192.168" in settings.BASE_URL
+
+
+# -- builders: the single source of truth for each script -------------------
+
+def build_initial(first: Optional[str], date: str, time: str, attempt_num: int,
+                  gather_url: Optional[str] = None, retry_url: Optional[str] = None) -> str:
+    response = VoiceResponse()
+
+    # Optional short pause on first attempt
+    if attempt_num == 1 and getattr(settings, 'TTS_INITIAL_PAUSE', 0):
+        response.pause(length=int(settings.TTS_INITIAL_PAUSE))
+
+    # Build the greeting message
+    if first is not None:
+        if attempt_num == 1:
+            greeting = (
+                f"This is Prisk Orthopaedics calling {first} "
+                f"to confirm an appointment that you have on {date} at {time}. "
+            )
+        else:
+            greeting = f"Let me repeat that for you {first}. "
+    else:
+        greeting = "This is Prisk Orthopaedics calling to confirm your appointment. "
+
+    response.say(greeting, voice=settings.TTS_VOICE, language="en-US")
+
+    gather = Gather(
+        num_digits=1,
+        action=gather_url or webhook_url("/twilio/gather"),
+        method="POST",
+        timeout=10,
+        finish_on_key="#"
+    )
+    gather.say(MENU, voice=settings.TTS_VOICE, language="en-US")
+    response.append(gather)
+
+    # Fallback behavior if gather doesn't work (only retry once to avoid loops)
+    if not _is_local():
+        if attempt_num < 2:
+            response.say("I didn't get your response. Let me try again.", voice=settings.TTS_VOICE)
+            response.redirect(retry_url or webhook_url("/twilio/voice", attempt=attempt_num + 1), method="POST")
+        else:
+            response.say("Thank you. Goodbye.", voice=settings.TTS_VOICE)
+            response.hangup()
+    else:
+        response.say("If you need to confirm or cancel, please call us back at 4 1 2, 5 2 5, 7 6 9 2. Thank you.", voice=settings.TTS_VOICE)
+        response.hangup()
+
+    return str(response)
+
+
+def build_inline(first: str, date: str, time: str) -> str:
+    """Whole call as inline TwiML, used when there is no public webhook URL."""
+    return _build_inline(
+        f"This is Prisk Orthopaedics calling {first} "
+        f"to confirm an appointment that you have on {date} at {time}. "
+    )
+
+
+def _build_inline(greeting: str) -> str:
+    response = VoiceResponse()
+    if getattr(settings, 'TTS_INITIAL_PAUSE', 0):
+        response.pause(length=int(settings.TTS_INITIAL_PAUSE))
+    response.say(greeting, voice=settings.TTS_VOICE)
+    gather = response.gather(num_digits=1, timeout=10)
+    gather.say(MENU, voice=settings.TTS_VOICE)
+    response.say("We didn't receive your selection. Goodbye.", voice=settings.TTS_VOICE)
+    return str(response)
+
+
+def build_voicemail(date: Optional[str], time: str) -> str:
+    response = VoiceResponse()
+
+    # Minimal pause then one-shot message and hangup
+    response.pause(length=1)
+
+    if date is not None:
+        message = (
+            f"This is Prisk Orthopaedics calling to remind you that you have an appointment on {date} at {time}. "
+            f"Please call us at 4 1 2, 5 2 5, 7 6 9 2 if you can make the appointment or need to cancel or reschedule. Goodbye."
+        )
+    else:
+        message = (
+            "This is Prisk Orthopaedics calling about your upcoming appointment. "
+            "Please call us at 4 1 2, 5 2 5, 7 6 9 2 if you can make the appointment or need to cancel or reschedule. Goodbye."
+        )
+
+    response.say(message, voice=settings.TTS_VOICE, language="en-US")
+    response.hangup()
+    return str(response)
+
+
+def build_gather_reply(digits: Optional[str], caller_id: str = "", retry_url: Optional[str] = None,
+                       dial_url: Optional[str] = None) -> str:
+    """Reply to a keypress; `None` means the call has no appointment attached.
+
+    `retry_url` is where the repeat (5) and invalid-key branches send the caller;
+    `dial_url` hears how the transfer (2) ended.
+    """
+    response = VoiceResponse()
+
+    if digits is None:
+        response.say("Thank you for calling. Goodbye.", voice=settings.TTS_VOICE)
+        response.hangup()
+
+    elif digits == "1":
+        response.say("Your appointment is confirmed. Thank you!", voice=settings.TTS_VOICE)
+        response.hangup()
+
+    elif digits == "2":
+        response.say("Please hold while I connect you to our office.", voice=settings.TTS_VOICE)
+        dial = Dial(
+            callerId=caller_id,
+            answer_on_bridge=True,
+            action=dial_url or webhook_url("/twilio/dial-status"),
+            method="POST"
+        )
+        dial.number(settings.JIVE_MAIN_NUMBER)
+        response.append(dial)
+
+    elif digits == "3":
+        response.say("Your appointment has been cancelled. Goodbye.", voice=settings.TTS_VOICE)
+        response.hangup()
+
+    elif digits == "5":
+        # Repeat the message by redirecting back to the voice menu as a repeat attempt
+        response.say("Let me repeat that.", voice=settings.TTS_VOICE)
+        response.redirect(retry_url or webhook_url("/twilio/voice", attempt=2), method="POST")
+
+    elif digits == "9":
+        response.say("We will not call you again about this appointment. Thank you.", voice=settings.TTS_VOICE)
+        response.hangup()
+
+    else:
+        response.say("Invalid selection.", voice=settings.TTS_VOICE)
+        response.redirect(retry_url or webhook_url("/twilio/voice"), method="POST")
+
+    return str(response)
+
+
+def build_give_up() -> str:
+    """Voice webhook reply once the menu has been offered too many times."""
+    response = VoiceResponse()
+    response.say("We'll try again later. Goodbye.", voice=settings.TTS_VOICE)
+    response.hangup()
+    return str(response)
+
+
+def build_no_digits(retry_url: str) -> str:
+    """Gather reply when the caller pressed nothing: back to the menu."""
+    response = VoiceResponse()
+    response.redirect(retry_url, method="POST")
+    return str(response)
+
+
+def build_dial_status(connected: bool) -> str:
+    """Reply once the transfer to the office has ended."""
+    response = VoiceResponse()
+    if not connected:
+        response.say(
+            "We were unable to connect you at this time. "
+            "Please call our office directly. Goodbye.",
+            voice=settings.TTS_VOICE
+        )
+    response.hangup()
+    return str(response)
+
+
+def build_household_menu(greeting: Optional[str], item: str, attempt_num: int,
+                         gather_url: str, retry_url: str) -> str:
+    """One appointment's menu on a household call; `greeting` lists them all before the first menu."""
+    response = VoiceResponse()
+
+    if greeting is not None:
+        if getattr(settings, 'TTS_INITIAL_PAUSE', 0):
+            response.pause(length=int(settings.TTS_INITIAL_PAUSE))
+        response.say(greeting, voice=settings.TTS_VOICE, language="en-US")
+
+    gather = Gather(
+        num_digits=1,
+        action=gather_url,
+        method="POST",
+        timeout=10,
+        finish_on_key="#"
+    )
+    gather.say(f"For {item}: " + MENU, voice=settings.TTS_VOICE, language="en-US")
+    response.append(gather)
+
+    if attempt_num < 2:
+        response.say("I didn't get your response. Let me try again.", voice=settings.TTS_VOICE)
+        response.redirect(retry_url, method="POST")
+    else:
+        response.say("Thank you. Goodbye.", voice=settings.TTS_VOICE)
+        response.hangup()
+
+    return str(response)
+
+
+def build_household_inline(greeting: str) -> str:
+    return _build_inline(greeting)
+
+
+def build_household_voicemail(count: str, listing: str) -> str:
+    response = VoiceResponse()
+    response.pause(length=1)
+    message = (
+        f"This is Prisk Orthopaedics calling to remind your household of {count} appointments: {listing}. "
+        f"Please call us at 4 1 2, 5 2 5, 7 6 9 2 if you can make the appointments or need to cancel or reschedule. Goodbye."
+    )
+    response.say(message, voice=settings.TTS_VOICE, language="en-US")
+    response.hangup()
+    return str(response)
+
+
+def build_household_ack(digits: str, next_url: Optional[str]) -> str:
+    """Acknowledge a settled appointment, then go on to the next menu or, after the last, hang up."""
+    response = VoiceResponse()
+    response.say(HOUSEHOLD_ACKS[digits], voice=settings.TTS_VOICE)
+    if next_url:
+        response.redirect(next_url, method="POST")
+    else:
+        response.say("Thank you. Goodbye.", voice=settings.TTS_VOICE)
+        response.hangup()
+    return str(response)
+
+
+def describe(appointment: Appointment) -> str:
+    patient_first_name = appointment.patient_name.split()[0] if appointment.patient_name else "patient"
+    date_str = appointment.appointment_date if appointment.appointment_date else "an upcoming date"
+    return f"{patient_first_name} on {date_str} at {appointment.appointment_time}"
+
+
+def household_greeting(appointments: List[Appointment]) -> str:
+    listing = ", and ".join(describe(apt) for apt in appointments)
+    return (
+        f"This is Prisk Orthopaedics calling to confirm {len(appointments)} appointments for your household: "
+        f"{listing}. "
+    )
+
+
+def _compile(xml: str) -> Template:
+    xml = xml.replace("$", "$$")
+    for placeholder, field in _PLACEHOLDERS.items():
+        xml = xml.replace(placeholder, field)
+    return Template(xml)
+
+
+def _greeting_fields(appointment: Appointment, missing_date: str) -> Dict[str, str]:
+    return {
+        "first": escape(appointment.patient_name.split()[0] if appointment.patient_name else "patient"),
+        "date": escape(appointment.appointment_date if appointment.appointment_date else missing_date),
+        "time": escape(appointment.appointment_time or ""),
+    }
+
+
+def _urls(context: Optional[CallContext], attempt_num: int) -> Dict[str, str]:
+    return {
+        "gather_url": escape(webhook_url("/twilio/gather", context)),
+        "retry_url": escape(webhook_url("/twilio/voice", context, attempt=attempt_num + 1)),
+    }
+
+
+class TwimlTemplates:
+    """IVR scripts compiled once into string templates, plus a per-appointment render cache.
+
+    Templates are rebuilt whenever the settings they bake in (voice, BASE_URL,
+    pause) change. Rendered XML is cached per (appointment, branch) and dropped
+    when the appointment changes, so a webhook hit is normally one dict lookup.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._signature: Optional[Tuple] = None
+        self._templates: Dict[str, Template] = {}
+        self._static: Dict[str, str] = {}
+        self._cache: "OrderedDict[str, Tuple[Tuple, Dict[str, str]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _ensure_compiled(self) -> None:
+        signature = (
+            settings.TTS_VOICE, settings.BASE_URL, getattr(settings, 'TTS_INITIAL_PAUSE', 0),
+            settings.JIVE_MAIN_NUMBER, _is_local(), settings.CALL_CONTEXT_SECRET, settings.TWILIO_AUTH_TOKEN
+        )
+        if signature == self._signature:
+            return
+        with self._lock:
+            if signature == self._signature:
+                return
+            self._templates = {
+                "initial": _compile(build_initial(_FIRST, _DATE, _TIME, 1, _GATHER_URL, _RETRY_URL)),
+                "repeat": _compile(build_initial(_FIRST, _DATE, _TIME, 2, _GATHER_URL, _RETRY_URL)),
+                "initial-none": _compile(build_initial(None, "", "", 1, _GATHER_URL, _RETRY_URL)),
+                "repeat-none": _compile(build_initial(None, "", "", 2, _GATHER_URL, _RETRY_URL)),
+                "inline": _compile(build_inline(_FIRST, _DATE, _TIME)),
+                "voicemail": _compile(build_voicemail(_DATE, _TIME)),
+                "gather-2": _compile(build_gather_reply("2", _CALLER_ID, dial_url=_DIAL_URL)),
+                "gather-5": _compile(build_gather_reply("5", retry_url=_RETRY_URL)),
+                "gather-invalid": _compile(build_gather_reply("invalid", retry_url=_RETRY_URL)),
+                "no-digits": _compile(build_no_digits(_RETRY_URL)),
+                "household-first": _compile(build_household_menu(_GREETING, _ITEM, 1, _GATHER_URL, _RETRY_URL)),
+                "household-next": _compile(build_household_menu(None, _ITEM, 1, _GATHER_URL, _RETRY_URL)),
+                "household-repeat": _compile(build_household_menu(None, _ITEM, 2, _GATHER_URL, _RETRY_URL)),
+                "household-inline": _compile(build_household_inline(_GREETING)),
+                "household-voicemail": _compile(build_household_voicemail(_COUNT, _LISTING)),
+            }
+            for digits in HOUSEHOLD_ACKS:
+                self._templates[f"household-ack-{digits}"] = _compile(build_household_ack(digits, _NEXT_URL))
+            self._static = {
+                "voicemail": build_voicemail(None, ""),
+                "gather-none": build_gather_reply(None),
+                "give-up": build_give_up(),
+                "dial-completed": build_dial_status(True),
+                "dial-failed": build_dial_status(False),
+            }
+            for digits in ("1", "3", "9"):
+                self._static[f"gather-{digits}"] = build_gather_reply(digits)
+                self._static[f"household-ack-{digits}"] = build_household_ack(digits, None)
+            self._cache.clear()
+            self._signature = signature
+            logger.info("TwiML templates compiled")
+
+    def _render(self, appointment: Appointment, branch: str, missing_date: str,
+                context: Optional[CallContext] = None, attempt_num: int = 1) -> str:
+        self._ensure_compiled()
+        # The fields a script depends on; a mismatch means the appointment was edited without invalidate()
+        fingerprint = (appointment.patient_name, appointment.appointment_date, appointment.appointment_time)
+        # Signed webhook URLs are deterministic, so their base and the context that produced them are enough of a key
+        slot = (branch, current_base_url()) if context is None else (
+            branch, current_base_url(), tuple(context.appointment_ids), context.attempt, context.item, context.caller_id
+        )
+        with self._lock:
+            entry = self._cache.get(appointment.id)
+            if entry is not None and entry[0] == fingerprint and slot in entry[1]:
+                self._cache.move_to_end(appointment.id)
+                self.hits += 1
+                return entry[1][slot]
+        self.misses += 1
+        fields = _greeting_fields(appointment, missing_date)
+        fields.update(_urls(context, attempt_num))
+        xml = self._templates[branch].substitute(fields)
+        with self._lock:
+            entry = self._cache.get(appointment.id)
+            if entry is None or entry[0] != fingerprint:
+                entry = (fingerprint, {})
+                self._cache[appointment.id] = entry
+            entry[1][slot] = xml
+            self._cache.move_to_end(appointment.id)
+            while len(self._cache) > RENDER_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return xml
+
+    def initial(self, appointment: Optional[Appointment], attempt_num: int = 1,
+                context: Optional[CallContext] = None) -> str:
+        branch = "initial" if attempt_num == 1 else "repeat"
+        if appointment is None:
+            self._ensure_compiled()
+            return self._templates[f"{branch}-none"].substitute(_urls(context, attempt_num))
+        return self._render(appointment, branch, "your upcoming appointment", context, attempt_num)
+
+    def inline(self, appointment: Appointment) -> str:
+        return self._render(appointment, "inline", "your appointment")
+
+    def voicemail(self, appointment: Optional[Appointment]) -> str:
+        if appointment is None:
+            self._ensure_compiled()
+            return self._static["voicemail"]
+        return self._render(appointment, "voicemail", "your upcoming appointment")
+
+    def gather_reply(self, digits: Optional[str], caller_id: str = "",
+                     context: Optional[CallContext] = None) -> str:
+        self._ensure_compiled()
+        if digits == "2":
+            return self._transfer(caller_id)
+        if digits == "5":
+            retry_url = webhook_url("/twilio/voice", context, attempt=2)
+        elif digits is None or digits in ("1", "3", "9"):
+            return self._static["gather-none" if digits is None else f"gather-{digits}"]
+        else:
+            digits = "invalid"
+            # Back to the top of the menu; unsigned calls have always done this without an attempt number
+            retry_url = webhook_url("/twilio/voice", context, attempt=1) if context else webhook_url("/twilio/voice")
+        return self._templates[f"gather-{digits}"].substitute(retry_url=escape(retry_url))
+
+    def give_up(self) -> str:
+        self._ensure_compiled()
+        return self._static["give-up"]
+
+    def no_digits(self, context: Optional[CallContext] = None, item: Optional[int] = None) -> str:
+        self._ensure_compiled()
+        # Unsigned household calls carry the menu item as a plain parameter; signed ones have it in the context
+        item_param = {"item": item} if item is not None and context is None else {}
+        return self._templates["no-digits"].substitute(
+            retry_url=escape(webhook_url("/twilio/voice", context, **item_param, attempt=2))
+        )
+
+    def dial_status(self, dial_call_status: str) -> str:
+        self._ensure_compiled()
+        return self._static["dial-completed" if dial_call_status == "completed" else "dial-failed"]
+
+    # Household scripts vary with every member, so they are rendered from the templates but not cached
+
+    def household_menu(self, appointments: List[Appointment], item: int = 0, attempt_num: int = 1,
+                       context: Optional[CallContext] = None) -> str:
+        self._ensure_compiled()
+        if attempt_num >= 2:
+            branch = "household-repeat"
+        else:
+            branch = "household-first" if item == 0 else "household-next"
+        return self._templates[branch].substitute(
+            greeting=escape(household_greeting(appointments)),
+            item=escape(describe(appointments[item])),
+            gather_url=escape(webhook_url("/twilio/gather", context, item=item)),
+            retry_url=escape(webhook_url("/twilio/voice", context, item=item, attempt=attempt_num + 1)),
+        )
+
+    def household_inline(self, appointments: List[Appointment]) -> str:
+        self._ensure_compiled()
+        return self._templates["household-inline"].substitute(greeting=escape(household_greeting(appointments)))
+
+    def household_voicemail(self, appointments: List[Appointment]) -> str:
+        self._ensure_compiled()
+        return self._templates["household-voicemail"].substitute(
+            count=len(appointments), listing=escape(", and ".join(describe(apt) for apt in appointments))
+        )
+
+    def household_gather_reply(self, digits: str, caller_id: str, repeat_url: str,
+                               next_url: Optional[str] = None) -> str:
+        """Reply to a keypress on one household menu; `next_url` is the next member's menu, if any."""
+        self._ensure_compiled()
+        if digits == "2":
+            return self._transfer(caller_id)
+        if digits in HOUSEHOLD_ACKS:
+            if next_url is None:
+                return self._static[f"household-ack-{digits}"]
+            return self._templates[f"household-ack-{digits}"].substitute(next_url=escape(next_url))
+        branch = "gather-5" if digits == "5" else "gather-invalid"
+        return self._templates[branch].substitute(retry_url=escape(repeat_url))
+
+    def _transfer(self, caller_id: str) -> str:
+        return self._templates["gather-2"].substitute(
+            caller_id=escape(caller_id, {'"': "&quot;"}),
+            dial_url=escape(webhook_url("/twilio/dial-status"), {'"': "&quot;"}),
+        )
+
+    def invalidate(self, appointment_id: str) -> None:
+        with self._lock:
+            self._cache.pop(appointment_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self) -> Dict:
+        return {"cached_appointments": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+twiml_templates = TwimlTemplates()
+appointment_store.add_listener(twiml_templates.invalidate)
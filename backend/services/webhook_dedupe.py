@@ -0,0 +1,77 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+from settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class DedupeCache:
+    """Remembers recently processed webhook keys so Twilio's retries are dropped.
+
+    Entries sit in insertion order, and with one TTL for all of them that is
+    also expiry order. Both the expiry sweep and the size cap pop from the
+    front, so `seen()` is O(1) amortized and memory is bounded by
+    `max_entries`.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None) -> None:
+        self.max_entries = max_entries or settings.WEBHOOK_DEDUPE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds or settings.WEBHOOK_DEDUPE_TTL_SECONDS
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, float]" = OrderedDict()  # key -> expiry (monotonic)
+        self.checked = 0
+        self.duplicates = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def seen(self, key: Hashable) -> bool:
+        """True if `key` was already recorded and has not expired; otherwise records it."""
+        now = time.monotonic()
+        with self._lock:
+            self.checked += 1
+            self._expire(now)
+            if key in self._entries:
+                self.duplicates += 1
+                return True
+            self._entries[key] = now + self.ttl_seconds
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+            return False
+
+    def forget(self, key: Hashable) -> None:
+        """Drop a key whose processing failed, so Twilio's retry is handled."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _expire(self, now: float) -> None:
+        while self._entries:
+            key, expires = next(iter(self._entries.items()))
+            if expires > now:
+                return
+            del self._entries[key]
+            self.expired += 1
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "checked": self.checked,
+                "duplicates": self.duplicates,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
+
+
+status_dedupe = DedupeCache()
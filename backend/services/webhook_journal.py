@@ -0,0 +1,207 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl
+
+from settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_VERSION = 1
+
+# Webhook fields holding a phone number; tokenized consistently so households and retries still line up
+PHONE_FIELDS = {"To", "From", "Called", "Caller", "ForwardedFrom", "cid"}
+# Webhook fields that identify or locate the patient and play no part in handling the call
+DROPPED_FIELDS = {
+    "CallerName", "SpeechResult", "UnstableSpeechResult", "RecordingUrl", "TranscriptionText",
+    "ToCity", "ToState", "ToZip", "ToCountry", "FromCity", "FromState", "FromZip", "FromCountry",
+    "CalledCity", "CalledState", "CalledZip", "CalledCountry",
+    "CallerCity", "CallerState", "CallerZip", "CallerCountry",
+    "sig",  # the call context signature cannot match tokenized values; replay re-signs
+}
+# Headers worth keeping; the signature is dropped since it cannot match the redacted form
+KEPT_HEADERS = ("user-agent", "content-type", "i-twilio-idempotency-token")
+# Any date tied to a patient is an identifier, so every appointment gets the same one
+REDACTED_DATE = "Monday, January, 1, 2024"
+
+
+class Tokenizer:
+    """Replaces PHI with stable tokens: the same phone number or name always maps to the same token.
+
+    Tokens are keyed HMACs and the key is never written to the journal, so they
+    cannot be reversed by hashing every possible phone number.
+    """
+
+    def __init__(self, key: Optional[bytes] = None) -> None:
+        self._key = key or secrets.token_bytes(32)
+
+    def _digest(self, kind: str, value: str) -> str:
+        return hmac.new(self._key, f"{kind}:{value}".encode(), hashlib.sha256).hexdigest()
+
+    def phone(self, value: Optional[str]) -> Optional[str]:
+        if not value:
+            return value
+        digits = "".join(ch for ch in value if ch.isdigit())
+        return f"+1555{int(self._digest('phone', digits[-10:])[:12], 16) % 10**7:07d}"
+
+    def name(self, value: Optional[str]) -> Optional[str]:
+        if not value:
+            return value
+        return f"Patient {self._digest('name', value.strip().lower())[:8]}"
+
+    def form(self, fields: Dict[str, str]) -> Dict[str, str]:
+        redacted = {}
+        for key, value in fields.items():
+            if key in DROPPED_FIELDS:
+                continue
+            redacted[key] = self.phone(value) if key in PHONE_FIELDS else value
+        return redacted
+
+    def appointment(self, data: Dict) -> Dict:
+        redacted = dict(data)
+        redacted["patient_name"] = self.name(data.get("patient_name"))
+        redacted["phone"] = self.phone(data.get("phone"))
+        redacted["caller_id"] = self.phone(data.get("caller_id"))
+        redacted["appointment_date"] = REDACTED_DATE if data.get("appointment_date") else None
+        redacted["last_called"] = None
+        redacted["notes"] = ""
+        return redacted
+
+
+class WebhookJournal:
+    """Opt-in, append-only JSON-lines log of inbound Twilio webhooks for replay_webhooks.py.
+
+    Besides each webhook (path, query, redacted form, a few headers, arrival
+    time, response status and latency) it records the calls this process
+    places, with a redacted snapshot of their appointments, and every
+    appointment status change, so a replay can rebuild the same calls and
+    check that it ends in the same states. Lines are written with one
+    O_APPEND write each, so several workers can share one file.
+    """
+
+    def __init__(self, path: str = "", key: Optional[bytes] = None) -> None:
+        self.path = path
+        self.tokenizer = Tokenizer(key)
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self.events = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def record_webhook(self, path: str, query: str, body: bytes, headers: Dict[str, str],
+                       arrived: float, status: int, latency: float) -> None:
+        form = dict(parse_qsl(body.decode("utf-8", "replace"), keep_blank_values=True))
+        self._write({
+            "type": "webhook",
+            "t": arrived,
+            "path": path,
+            "query": self.tokenizer.form(dict(parse_qsl(query, keep_blank_values=True))),
+            "form": self.tokenizer.form(form),
+            "headers": {name: headers[name] for name in KEPT_HEADERS if name in headers},
+            "status": status,
+            "ms": round(latency * 1000, 3),
+        })
+
+    def record_call(self, call_sid: str, appointments: List[Dict], from_number: Optional[str]) -> None:
+        if not self.enabled:
+            return
+        self._write({
+            "type": "call",
+            "t": time.time(),
+            "call_sid": call_sid,
+            "from": self.tokenizer.phone(from_number),
+            "appointments": [self.tokenizer.appointment(data) for data in appointments],
+        })
+
+    def record_state(self, appointment_id: str) -> None:
+        """Store listener: the appointment's status after each change."""
+        from models import appointment_store
+        appointment = appointment_store.appointments.get(appointment_id)
+        if appointment is None:
+            return
+        self._write({
+            "type": "state",
+            "t": time.time(),
+            "id": appointment_id,
+            "status": getattr(appointment.status, "value", appointment.status),
+            "call_attempts": appointment.call_attempts,
+        })
+
+    def _write(self, event: Dict) -> None:
+        line = (json.dumps(event, default=str, separators=(",", ":")) + "\n").encode()
+        with self._lock:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+                os.write(self._fd, (json.dumps({"type": "journal", "version": JOURNAL_VERSION, "t": time.time(),
+                                                "pid": os.getpid()}) + "\n").encode())
+                logger.info(f"Capturing Twilio webhooks to {self.path}")
+            os.write(self._fd, line)
+            self.events += 1
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+class WebhookCaptureMiddleware:
+    """ASGI middleware that copies each /twilio/ request into the journal as the app reads it.
+
+    It tees the body off `receive` rather than reading it up front, so the
+    route still parses the form itself and nothing is buffered twice.
+    """
+
+    def __init__(self, app, journal: WebhookJournal, prefix: str = "/twilio/") -> None:
+        self.app = app
+        self.journal = journal
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+        arrived, started = time.time(), time.perf_counter()
+        chunks: List[bytes] = []
+        status = [500]
+
+        async def tee_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                chunks.append(message.get("body", b""))
+            return message
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, tee_receive, capture_send)
+        finally:
+            try:
+                headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])}
+                self.journal.record_webhook(
+                    scope["path"], scope.get("query_string", b"").decode("latin-1"), b"".join(chunks),
+                    headers, arrived, status[0], time.perf_counter() - started
+                )
+            except Exception as e:
+                logger.error(f"Could not journal webhook {scope['path']}: {e}")
+
+
+def _journal_key() -> Optional[bytes]:
+    # Stable across restarts and workers when a secret is configured; random (per process) otherwise
+    secret = settings.CALL_CONTEXT_SECRET or settings.TWILIO_AUTH_TOKEN
+    return hashlib.sha256(b"webhook-journal:" + secret.encode()).digest() if secret else None
+
+
+webhook_journal = WebhookJournal(settings.WEBHOOK_CAPTURE_PATH, _journal_key())
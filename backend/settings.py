@@ -1,10 +1,19 @@
+import asyncio
+import logging
 import os
-from typing import Optional
-from dotenv import load_dotenv
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Optional, Set
+from dotenv import dotenv_values, load_dotenv
 from datetime import datetime, time
 import pytz
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
+# Variables set by the real environment; they win over .env, on reload as at startup
+_PROCESS_ENV = set(os.environ)
+
 # Load .env from the backend directory
 env_path = Path(__file__).parent / '.env'
 if env_path.exists():
@@ -14,25 +23,115 @@ else:
     print(f"WARNING: .env file not found at: {env_path}")
     print(f"Current working directory: {os.getcwd()}")
 
-class Settings:
-    TWILIO_ACCOUNT_SID: str = os.getenv("TWILIO_ACCOUNT_SID", "")
-    TWILIO_AUTH_TOKEN: str = os.getenv("TWILIO_AUTH_TOKEN", "")
-    TWILIO_FROM_NUMBER: str = os.getenv("TWILIO_FROM_NUMBER", "")
-    JIVE_MAIN_NUMBER: str = os.getenv("JIVE_MAIN_NUMBER", "")
-    BASE_URL: str = os.getenv("BASE_URL", "http://localhost:8000")
-    TIMEZONE: str = os.getenv("TIMEZONE", "America/New_York")
-    CALL_WINDOW_START: str = os.getenv("CALL_WINDOW_START", "10:00")
-    CALL_WINDOW_END: str = os.getenv("CALL_WINDOW_END", "15:00")
-    AUTO_TUNNEL: bool = os.getenv("AUTO_TUNNEL", "false").lower() == "true"
-    # Text-to-Speech voice (Twilio <Say> voice). Examples: "alice" (standard), "Polly.Joanna", "Polly.Matthew"
-    TTS_VOICE: str = os.getenv("TTS_VOICE", "alice")
-    # Optional initial pause before greeting (seconds)
-    TTS_INITIAL_PAUSE: int = int(os.getenv("TTS_INITIAL_PAUSE", "0"))
-    # Answering Machine Detection mode: "none" | "enable" | "detect_message_end"
-    AMD_MODE: str = os.getenv("AMD_MODE", "none").lower()
-    
+
+def _read():
+    """Every setting as the environment (with .env) has it now; Settings.reload() calls this again."""
+    class Values:
+        TWILIO_ACCOUNT_SID: str = os.getenv("TWILIO_ACCOUNT_SID", "")
+        TWILIO_AUTH_TOKEN: str = os.getenv("TWILIO_AUTH_TOKEN", "")
+        TWILIO_FROM_NUMBER: str = os.getenv("TWILIO_FROM_NUMBER", "")
+        # Optional comma-separated pool of caller-ID numbers; defaults to TWILIO_FROM_NUMBER alone
+        TWILIO_FROM_NUMBERS: str = os.getenv("TWILIO_FROM_NUMBERS", "")
+        # Per caller-ID limits: simultaneous calls and new calls per second
+        NUMBER_MAX_CONCURRENT_CALLS: int = int(os.getenv("NUMBER_MAX_CONCURRENT_CALLS", "1"))
+        NUMBER_CALLS_PER_SECOND: float = float(os.getenv("NUMBER_CALLS_PER_SECOND", "1"))
+        # Send REST calls somewhere other than api.twilio.com, e.g. the fake_twilio.py load-test stand-in
+        TWILIO_API_BASE_URL: str = os.getenv("TWILIO_API_BASE_URL", "")
+        JIVE_MAIN_NUMBER: str = os.getenv("JIVE_MAIN_NUMBER", "")
+        BASE_URL: str = os.getenv("BASE_URL", "http://localhost:8000")
+        TIMEZONE: str = os.getenv("TIMEZONE", "America/New_York")
+        CALL_WINDOW_START: str = os.getenv("CALL_WINDOW_START", "10:00")
+        CALL_WINDOW_END: str = os.getenv("CALL_WINDOW_END", "15:00")
+        AUTO_TUNNEL: bool = os.getenv("AUTO_TUNNEL", "false").lower() == "true"
+        # Text-to-Speech voice (Twilio <Say> voice). Examples: "alice" (standard), "Polly.Joanna", "Polly.Matthew"
+        TTS_VOICE: str = os.getenv("TTS_VOICE", "alice")
+        # Optional initial pause before greeting (seconds)
+        TTS_INITIAL_PAUSE: int = int(os.getenv("TTS_INITIAL_PAUSE", "0"))
+        # Answering Machine Detection mode: "none" | "enable" | "detect_message_end"
+        AMD_MODE: str = os.getenv("AMD_MODE", "none").lower()
+        # Check X-Twilio-Signature on /twilio/ webhooks: "auto" (when BASE_URL is public), "true" or "false"
+        TWILIO_VALIDATE_SIGNATURES: str = os.getenv("TWILIO_VALIDATE_SIGNATURES", "auto").lower()
+        # Key for signing call context onto webhook URLs; must match across workers (defaults to the auth token)
+        CALL_CONTEXT_SECRET: str = os.getenv("CALL_CONTEXT_SECRET", "")
+        # Status callbacks remembered to drop Twilio's retries: how many, and for how long (seconds)
+        WEBHOOK_DEDUPE_MAX_ENTRIES: int = int(os.getenv("WEBHOOK_DEDUPE_MAX_ENTRIES", "10000"))
+        WEBHOOK_DEDUPE_TTL_SECONDS: int = int(os.getenv("WEBHOOK_DEDUPE_TTL_SECONDS", "3600"))
+        # Opt-in: append every inbound Twilio webhook, PHI tokenized, to this JSON-lines file for replay_webhooks.py
+        WEBHOOK_CAPTURE_PATH: str = os.getenv("WEBHOOK_CAPTURE_PATH", "")
+        # How long a finished call's CallSid -> appointment mapping is kept for late callbacks (seconds)
+        CALL_MAPPING_TTL_SECONDS: int = int(os.getenv("CALL_MAPPING_TTL_SECONDS", "21600"))
+        # Finished campaigns kept for the dashboard: for how long (seconds), and at most how many
+        CAMPAIGN_RETENTION_SECONDS: int = int(os.getenv("CAMPAIGN_RETENTION_SECONDS", "86400"))
+        MAX_CLOSED_CAMPAIGNS: int = int(os.getenv("MAX_CLOSED_CAMPAIGNS", "50"))
+        # Appointment state backend: "memory" (this process only) or "sqlite" (shared with other processes on
+        # this host, such as scripts or a webhook-only app). The server itself runs one worker: see main.py
+        APPOINTMENT_STORE: str = os.getenv("APPOINTMENT_STORE", "memory").lower()
+        # How often a shared store checks for other processes' changes (seconds)
+        STORE_POLL_SECONDS: float = float(os.getenv("STORE_POLL_SECONDS", "0.5"))
+        # How long the shared store's change feed is kept; a worker that falls further behind reloads everything
+        STORE_CHANGE_RETENTION_SECONDS: int = int(os.getenv("STORE_CHANGE_RETENTION_SECONDS", "600"))
+        # Seconds a queue worker may hold a claimed call job before it is considered abandoned
+        CALL_JOB_LEASE_SECONDS: int = int(os.getenv("CALL_JOB_LEASE_SECONDS", "60"))
+        # Calls allowed in flight at once across all campaigns
+        MAX_CONCURRENT_CALLS: int = int(os.getenv("MAX_CONCURRENT_CALLS", "1"))
+        # serve.py on shutdown: how long to keep answering webhooks for calls still in flight
+        DRAIN_TIMEOUT_SECONDS: int = int(os.getenv("DRAIN_TIMEOUT_SECONDS", "120"))
+        # Cover queued appointments that share a phone number with one call (up to this many per call)
+        COALESCE_HOUSEHOLD_CALLS: bool = os.getenv("COALESCE_HOUSEHOLD_CALLS", "true").lower() == "true"
+        MAX_HOUSEHOLD_APPOINTMENTS: int = int(os.getenv("MAX_HOUSEHOLD_APPOINTMENTS", "4"))
+        # Automatic retries: total attempts per appointment, and base delay (minutes) per call outcome
+        MAX_CALL_ATTEMPTS: int = int(os.getenv("MAX_CALL_ATTEMPTS", "3"))
+        RETRY_NO_ANSWER_MINUTES: int = int(os.getenv("RETRY_NO_ANSWER_MINUTES", "120"))
+        RETRY_BUSY_MINUTES: int = int(os.getenv("RETRY_BUSY_MINUTES", "30"))
+        RETRY_VOICEMAIL_MINUTES: int = int(os.getenv("RETRY_VOICEMAIL_MINUTES", "240"))
+        RETRY_NO_SELECTION_MINUTES: int = int(os.getenv("RETRY_NO_SELECTION_MINUTES", "60"))
+        # Each further attempt waits this many times longer than the previous one (1.0 = fixed delay)
+        RETRY_BACKOFF_FACTOR: float = float(os.getenv("RETRY_BACKOFF_FACTOR", "1.0"))
+        # Call timelines: how often buffered events are written, and how long they are kept (hours)
+        CALL_TIMELINE_FLUSH_SECONDS: float = float(os.getenv("CALL_TIMELINE_FLUSH_SECONDS", "1"))
+        CALL_TIMELINE_RETENTION_HOURS: int = int(os.getenv("CALL_TIMELINE_RETENTION_HOURS", "168"))
+        # Logging: level, "text" or "json" lines, and INFO records allowed per call site per 10 seconds (0 = all)
+        LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
+        LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text").lower()
+        LOG_RATE_LIMIT: int = int(os.getenv("LOG_RATE_LIMIT", "50"))
+        # Responses at least this large are gzipped for clients that accept it (bytes; 0 = never)
+        GZIP_MIN_BYTES: int = int(os.getenv("GZIP_MIN_BYTES", "1024"))
+        # Bearer token for /api/admin (profiling); empty turns those endpoints off
+        ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")
+        # Requests slower than this are logged with a parse/handler/serialize/store breakdown (ms; 0 = never)
+        SLOW_REQUEST_MS: float = float(os.getenv("SLOW_REQUEST_MS", "500"))
+        # How often .env is checked for changes to apply without a restart (seconds; 0 = never)
+        SETTINGS_WATCH_SECONDS: float = float(os.getenv("SETTINGS_WATCH_SECONDS", "2"))
+
+    return Values
+
+
+# Settings that are only read while the app starts
+RESTART_REQUIRED = {"APPOINTMENT_STORE", "WEBHOOK_CAPTURE_PATH", "AUTO_TUNNEL", "LOG_FORMAT", "GZIP_MIN_BYTES"}
+# Previous BASE_URLs whose webhooks are still accepted, for calls placed before a change
+PREVIOUS_BASE_URLS = 5
+
+
+class Settings(_read()):
+    """Process-wide settings, read from the environment and .env.
+
+    `reload()` re-reads .env and `override()` takes values pushed at runtime
+    (a new tunnel URL). Either assigns the changed class attributes under
+    one lock, bumps `version` and then tells the listeners which names
+    changed, so a change is applied without a restart. BASE_URL keeps a
+    short history: calls placed before a change still finish on the URL
+    they were given.
+    """
     UPLOAD_DIR: str = "uploads"
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
+
+    version: int = 1
+    _lock = threading.RLock()
+    _listeners: List[Callable[[Set[str]], None]] = []
+    _overrides: Dict[str, object] = {}
+    _file_values: Dict[str, Optional[str]] = dict(dotenv_values(env_path)) if env_path.exists() else {}
+    _file_stamp: Optional[tuple] = None
+    _previous_base_urls: deque = deque(maxlen=PREVIOUS_BASE_URLS)
     
     @classmethod
     def is_within_call_window(cls) -> bool:
@@ -48,24 +147,127 @@ class Settings:
         else:
             return current_time >= start_time or current_time <= end_time
     
+    @classmethod
+    def from_numbers(cls) -> list:
+        pool = [n.strip() for n in cls.TWILIO_FROM_NUMBERS.split(",") if n.strip()]
+        return pool or ([cls.TWILIO_FROM_NUMBER] if cls.TWILIO_FROM_NUMBER else [])
+    
     @classmethod
     def validate(cls) -> bool:
         required = [
             cls.TWILIO_ACCOUNT_SID,
             cls.TWILIO_AUTH_TOKEN,
-            cls.TWILIO_FROM_NUMBER,
+            cls.TWILIO_FROM_NUMBER or cls.TWILIO_FROM_NUMBERS,
             cls.JIVE_MAIN_NUMBER,
             cls.BASE_URL
         ]
         
-        # Debug output
-        print(f"Validating Twilio config:")
-        print(f"  TWILIO_ACCOUNT_SID: {'SET' if cls.TWILIO_ACCOUNT_SID else 'MISSING'} (length: {len(cls.TWILIO_ACCOUNT_SID)})")
-        print(f"  TWILIO_AUTH_TOKEN: {'SET' if cls.TWILIO_AUTH_TOKEN else 'MISSING'} (length: {len(cls.TWILIO_AUTH_TOKEN)})")
-        print(f"  TWILIO_FROM_NUMBER: {cls.TWILIO_FROM_NUMBER if cls.TWILIO_FROM_NUMBER else 'MISSING'}")
-        print(f"  JIVE_MAIN_NUMBER: {cls.JIVE_MAIN_NUMBER if cls.JIVE_MAIN_NUMBER else 'MISSING'}")
-        print(f"  BASE_URL: {cls.BASE_URL if cls.BASE_URL else 'MISSING'}")
+        # Debug output; /healthz calls this on every probe, so it goes through logging, not print
+        logger.debug(
+            f"Validating Twilio config: "
+            f"TWILIO_ACCOUNT_SID {'SET' if cls.TWILIO_ACCOUNT_SID else 'MISSING'} (length: {len(cls.TWILIO_ACCOUNT_SID)}), "
+            f"TWILIO_AUTH_TOKEN {'SET' if cls.TWILIO_AUTH_TOKEN else 'MISSING'} (length: {len(cls.TWILIO_AUTH_TOKEN)}), "
+            f"TWILIO_FROM_NUMBER {cls.TWILIO_FROM_NUMBER or 'MISSING'}, "
+            f"JIVE_MAIN_NUMBER {cls.JIVE_MAIN_NUMBER or 'MISSING'}, "
+            f"BASE_URL {cls.BASE_URL or 'MISSING'}"
+        )
         
         return all(required)
 
+    @classmethod
+    def add_listener(cls, listener: Callable[[Set[str]], None]) -> None:
+        """Call `listener(changed_names)` after every change that is applied."""
+        cls._listeners.append(listener)
+
+    @classmethod
+    def base_urls(cls) -> List[str]:
+        """The current BASE_URL, then earlier ones whose calls may still be in progress."""
+        return [cls.BASE_URL] + [url for url in cls._previous_base_urls if url != cls.BASE_URL]
+
+    @classmethod
+    def reload(cls) -> Set[str]:
+        """Apply .env as it is now; returns the names that changed."""
+        with cls._lock:
+            file_values = dict(dotenv_values(env_path)) if env_path.exists() else {}
+            for name in set(cls._file_values) | set(file_values):
+                if name in _PROCESS_ENV:
+                    continue
+                if file_values.get(name) is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = file_values[name]
+            # An edit to .env replaces a value pushed at runtime; an untouched line, or one
+            # rewritten to the pushed value (auto_tunnel saves its URL there too), does not
+            for name, value in list(cls._overrides.items()):
+                if file_values.get(name) not in (cls._file_values.get(name), str(value)):
+                    del cls._overrides[name]
+            cls._file_values = file_values
+            fresh = _read()
+            values = {name: getattr(fresh, name) for name in vars(fresh) if name.isupper()}
+            values.update(cls._overrides)
+            changed = cls._apply(values)
+        cls._notify(changed, ".env")
+        return changed
+
+    @classmethod
+    def override(cls, source: str, **values) -> Set[str]:
+        """Set values at runtime, e.g. the URL of a tunnel that just came up; they survive reloads."""
+        with cls._lock:
+            cls._overrides.update(values)
+            changed = cls._apply(values)
+        cls._notify(changed, source)
+        return changed
+
+    @classmethod
+    def _apply(cls, values: Dict[str, object]) -> Set[str]:
+        changed = {name for name, value in values.items() if getattr(cls, name, None) != value}
+        if "BASE_URL" in changed:
+            cls._previous_base_urls.appendleft(cls.BASE_URL)
+        for name in changed:
+            setattr(cls, name, values[name])
+        if changed:
+            cls.version += 1
+        return changed
+
+    @classmethod
+    def _notify(cls, changed: Set[str], source: str) -> None:
+        if not changed:
+            return
+        # Values stay out of the log: several are secrets
+        logger.info(f"Settings v{cls.version} from {source}: {', '.join(sorted(changed))} changed"
+                    + (f" (BASE_URL is now {cls.BASE_URL})" if "BASE_URL" in changed else ""))
+        if changed & RESTART_REQUIRED:
+            logger.warning(f"{', '.join(sorted(changed & RESTART_REQUIRED))} only take effect after a restart")
+        for listener in cls._listeners:
+            try:
+                listener(changed)
+            except Exception as e:
+                logger.error(f"Settings listener failed: {e}")
+
+    @classmethod
+    def _env_stamp(cls) -> Optional[tuple]:
+        try:
+            stat = env_path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    @classmethod
+    async def watch(cls) -> None:
+        """Apply .env edits (update_tunnel.py, or by hand) as they happen. Runs until cancelled."""
+        if cls.SETTINGS_WATCH_SECONDS <= 0:
+            return
+        cls._file_stamp = cls._env_stamp()
+        while True:
+            await asyncio.sleep(cls.SETTINGS_WATCH_SECONDS)
+            stamp = cls._env_stamp()
+            if stamp == cls._file_stamp:
+                continue
+            cls._file_stamp = stamp
+            try:
+                cls.reload()
+            except Exception as e:
+                logger.error(f"Could not reload settings from {env_path}: {e}")
+
+
 settings = Settings()
\ No newline at end of file
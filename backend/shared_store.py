@@ -0,0 +1,269 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from database import AppointmentChangeRecord, CallMapRecord, SharedAppointmentRecord, get_sync_session
+from models import Appointment, AppointmentStatus, AppointmentStore, _check_transition
+from settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+ALL = "*"
+
+
+class SQLiteAppointmentStore(AppointmentStore):
+    """Appointment store shared by worker processes through one SQLite database in WAL mode.
+
+    Each process keeps its own Appointment objects as a cache. Every write goes
+    to the database in a single statement and appends to `appointment_changes`.
+    Before a read, a process replays the changes it has not seen yet: it
+    refreshes those objects in place and notifies its listeners, so the queue
+    and TwiML cache also react to changes made by other workers.
+    `compare_and_swap` is a conditional UPDATE on the version column, so a
+    worker holding a stale copy loses the race and recomputes instead of
+    overwriting another worker's write.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._sync_lock = threading.RLock()
+        self._own_changes: Set[int] = set()
+        self._seq: Optional[int] = None  # last change applied; None until the first sync
+        self._last_prune = 0.0
+
+    # -- reads ---------------------------------------------------------------
+
+    def get_appointment(self, appointment_id: str) -> Optional[Appointment]:
+        self.sync()
+        return self.appointments.get(appointment_id)
+
+    def get_all_appointments(self) -> List[Appointment]:
+        self.sync()
+        return list(self.appointments.values())
+
+    def appointment_id_for_call(self, call_sid: str) -> Optional[str]:
+        ids = self._call_ids(call_sid)
+        return ids[0] if ids else None
+
+    def get_appointment_by_call_sid(self, call_sid: str) -> Optional[Appointment]:
+        appointment_id = self.appointment_id_for_call(call_sid)
+        return self.appointments.get(appointment_id) if appointment_id else None
+
+    def get_appointments_by_call_sid(self, call_sid: str) -> List[Appointment]:
+        return [self.appointments[apt_id] for apt_id in self._call_ids(call_sid) if apt_id in self.appointments]
+
+    def _call_ids(self, call_sid: str) -> List[str]:
+        self.sync()
+        if call_sid in self.call_to_household:
+            return self.call_to_household[call_sid]
+        if call_sid in self.call_to_appointment:
+            return [self.call_to_appointment[call_sid]]
+        # Placed by another worker
+        with get_sync_session() as session:
+            record = session.get(CallMapRecord, call_sid)
+        if record is None:
+            return []
+        ids = json.loads(record.appointment_ids)
+        with self._sync_lock:
+            if len(ids) > 1:
+                self.call_to_household[call_sid] = ids
+            self.call_to_appointment[call_sid] = ids[0]
+        return ids
+
+    # -- writes --------------------------------------------------------------
+
+    def add_appointment(self, appointment: Appointment) -> None:
+        stmt = insert(SharedAppointmentRecord).values(
+            id=appointment.id, status=AppointmentStatus(appointment.status).value,
+            version=appointment.version, data=appointment.to_json().decode()
+        )
+        # Re-adding replaces the record but keeps its version moving forward
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[SharedAppointmentRecord.id],
+            set_={"status": stmt.excluded.status, "data": stmt.excluded.data,
+                  "version": SharedAppointmentRecord.version + 1, "updated_at": datetime.utcnow()}
+        )
+        with get_sync_session() as session:
+            session.execute(stmt)
+            self._record_change(session, appointment.id)
+            version = session.execute(
+                select(SharedAppointmentRecord.version).where(SharedAppointmentRecord.id == appointment.id)
+            ).scalar()
+            session.commit()
+        with self._sync_lock:
+            appointment.version = version
+            self.appointments[appointment.id] = appointment
+
+    def compare_and_swap(self, appointment_id: str, expected_version: int, changes: Dict[str, Any]) -> bool:
+        # A process's cache can lag the database; bring it up to date and let update() recompute
+        self.sync()
+        appointment = self.appointments.get(appointment_id)
+        if appointment is None or appointment.version != expected_version:
+            return False
+        _check_transition(appointment, changes)
+        data = appointment.to_dict()
+        data.update(changes)
+        status = AppointmentStatus(data["status"]).value
+        data["status"], data["version"] = status, expected_version + 1
+        with get_sync_session() as session:
+            result = session.execute(
+                update(SharedAppointmentRecord)
+                .where(SharedAppointmentRecord.id == appointment_id, SharedAppointmentRecord.version == expected_version)
+                .values(status=status, version=expected_version + 1, data=json.dumps(data, default=str),
+                        updated_at=datetime.utcnow())
+            )
+            if result.rowcount != 1:
+                session.rollback()
+                return False
+            self._record_change(session, appointment_id)
+            session.commit()
+        with self._sync_lock:
+            for field, value in changes.items():
+                setattr(appointment, field, value)
+            appointment.version = expected_version + 1
+        self.touch(appointment_id)
+        return True
+
+    def map_call_to_appointment(self, call_sid: str, appointment_id: str) -> None:
+        self._write_call_map(call_sid, [appointment_id])
+        super().map_call_to_appointment(call_sid, appointment_id)
+
+    def map_call_to_household(self, call_sid: str, appointment_ids: List[str]) -> None:
+        self._write_call_map(call_sid, appointment_ids)
+        super().map_call_to_household(call_sid, appointment_ids)
+
+    def clear_all(self) -> None:
+        with get_sync_session() as session:
+            session.execute(delete(SharedAppointmentRecord))
+            session.execute(delete(CallMapRecord))
+            self._record_change(session, ALL)
+            session.commit()
+        with self._sync_lock:
+            super().clear_all()
+
+    def _forget_calls(self, call_sids: List[str]) -> None:
+        with get_sync_session() as session:
+            session.execute(delete(CallMapRecord).where(CallMapRecord.call_sid.in_(call_sids)))
+            session.commit()
+        with self._sync_lock:
+            super()._forget_calls(call_sids)
+
+    def _write_call_map(self, call_sid: str, appointment_ids: List[str]) -> None:
+        stmt = insert(CallMapRecord).values(call_sid=call_sid, appointment_ids=json.dumps(list(appointment_ids)))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CallMapRecord.call_sid], set_={"appointment_ids": stmt.excluded.appointment_ids}
+        )
+        with get_sync_session() as session:
+            session.execute(stmt)
+            session.commit()
+
+    def _record_change(self, session, appointment_id: str) -> None:
+        change = AppointmentChangeRecord(appointment_id=appointment_id)
+        session.add(change)
+        session.flush()
+        self._own_changes.add(change.seq)
+
+    # -- change feed ---------------------------------------------------------
+
+    def sync(self) -> None:
+        """Apply other workers' changes since the last sync and notify listeners about them."""
+        with self._sync_lock:
+            with get_sync_session() as session:
+                if self._seq is None:
+                    self._seq = session.execute(
+                        select(AppointmentChangeRecord.seq).order_by(AppointmentChangeRecord.seq.desc()).limit(1)
+                    ).scalar() or 0
+                    self._load(session, None)
+                    return
+                rows = session.execute(
+                    select(AppointmentChangeRecord.seq, AppointmentChangeRecord.appointment_id)
+                    .where(AppointmentChangeRecord.seq > self._seq)
+                    .order_by(AppointmentChangeRecord.seq)
+                ).all()
+                if not rows:
+                    return
+                gap = rows[0].seq > self._seq + 1 and self._feed_pruned_past(session)
+                self._seq = rows[-1].seq
+                if gap:
+                    # Fell behind the retained feed, so anything may have changed
+                    logger.warning("Shared store missed pruned changes; reloading all appointments")
+                    self._own_changes.clear()
+                    changed = self._load(session, None)
+                else:
+                    changed = []
+                    for seq, appointment_id in rows:
+                        if seq in self._own_changes:
+                            self._own_changes.discard(seq)
+                        elif appointment_id not in changed:
+                            changed.append(appointment_id)
+                    if not changed:
+                        return
+                    if ALL in changed:
+                        super().clear_all()
+                        changed = self._load(session, None)
+                    else:
+                        self._load(session, changed)
+        for appointment_id in changed:
+            self.touch(appointment_id)
+
+    def _load(self, session, appointment_ids: Optional[Iterable[str]]) -> List[str]:
+        """Refresh cached appointments from their rows, in place so callers' references stay live."""
+        stmt = select(SharedAppointmentRecord)
+        if appointment_ids is not None:
+            appointment_ids = list(appointment_ids)
+            stmt = stmt.where(SharedAppointmentRecord.id.in_(appointment_ids))
+        found = []
+        for record in session.execute(stmt).scalars():
+            data = json.loads(record.data)
+            data["status"], data["version"] = record.status, record.version
+            fresh = Appointment.from_dict(data)
+            current = self.appointments.get(record.id)
+            if current is None:
+                self.appointments[record.id] = fresh
+            else:
+                current.copy_from(fresh)
+            found.append(record.id)
+        missing = set(self.appointments if appointment_ids is None else appointment_ids) - set(found)
+        for appointment_id in missing:
+            self.appointments.pop(appointment_id, None)
+        return found + sorted(missing)
+
+    def _feed_pruned_past(self, session) -> bool:
+        """True if changes after our last seq were pruned (rather than rolled back, which also leaves gaps)."""
+        oldest = session.execute(select(func.min(AppointmentChangeRecord.seq))).scalar()
+        return oldest is not None and oldest > self._seq + 1
+
+    def prune_changes(self) -> int:
+        """Drop change-feed rows older than STORE_CHANGE_RETENTION_SECONDS so the table stays small."""
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.STORE_CHANGE_RETENTION_SECONDS)
+        with get_sync_session() as session:
+            # Always keep the newest row: SQLite reuses rowids once the table is empty
+            newest = session.execute(select(func.max(AppointmentChangeRecord.seq))).scalar() or 0
+            result = session.execute(delete(AppointmentChangeRecord).where(
+                AppointmentChangeRecord.changed_at < cutoff, AppointmentChangeRecord.seq < newest
+            ))
+            session.commit()
+        if result.rowcount:
+            logger.info(f"Pruned {result.rowcount} shared store changes older than {cutoff}")
+        return result.rowcount
+
+    async def watch(self) -> None:
+        """Poll the change feed so listeners hear about other workers' writes even when idle."""
+        logger.info(f"Shared appointment store watching for changes every {settings.STORE_POLL_SECONDS}s")
+        while True:
+            try:
+                self.sync()
+                if time.monotonic() - self._last_prune > settings.STORE_CHANGE_RETENTION_SECONDS / 10:
+                    self._last_prune = time.monotonic()
+                    self.prune_changes()
+            except Exception as e:
+                logger.error(f"Shared store sync failed: {e}")
+            await asyncio.sleep(settings.STORE_POLL_SECONDS)
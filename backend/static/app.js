@@ -1,4 +1,16 @@
-let appointments = [];
+// The table renders only the rows in view (plus OVERSCAN either side) and fetches
+// them a page at a time; rows are kept by appointment ID and only redrawn when
+// that appointment changed, so scroll position and selection survive refreshes.
+const PAGE_SIZE = 100;
+const OVERSCAN = 10;
+const COLUMNS = 10;
+
+let total = 0;
+let pages = new Map();      // page number -> { items, stale }
+let pending = new Map();    // page number -> in-flight fetch
+let rows = new Map();       // appointment id -> { tr, key }
+let rowHeight = 57;         // measured from the first rendered row
+let renderQueued = false;
 let callInProgress = {};
 let selectedIds = new Set();
 let batchStatusTimer = null;
@@ -6,120 +18,246 @@ let batchStatusTimer = null;
 // Call window display removed
 
 async function loadAppointments() {
-    try {
-        const response = await fetch('/api/appointments');
-        appointments = await response.json();
-        
-        // Debug: Log first appointment to see if date is present
-        if (appointments.length > 0) {
-            console.log('First appointment data:', appointments[0]);
+    // Everything cached may be out of date; what is in view is fetched again now, the rest when scrolled to
+    for (const page of pages.values()) page.stale = true;
+    const [first, last] = visibleRange();
+    await Promise.all(pagesFor(first, Math.max(last, first + 1)).map(fetchPage));
+}
+
+async function fetchPage(page) {
+    if (pending.has(page)) return pending.get(page);
+    const request = (async () => {
+        try {
+            const response = await fetch(`/api/appointments/page?offset=${page * PAGE_SIZE}&limit=${PAGE_SIZE}`);
+            const data = await response.json();
+            if (data.total !== total) {
+                // Rows were added or removed (a new upload): other cached pages no longer line up
+                pages.clear();
+                total = data.total;
+                updateCount();
+            }
+            pages.set(page, { items: data.items, stale: false });
+        } catch (error) {
+            console.error('Error loading appointments:', error);
+        } finally {
+            pending.delete(page);
         }
-        
-        renderAppointments();
-        updateCount();
-    } catch (error) {
-        console.error('Error loading appointments:', error);
-    }
+        scheduleRender();
+    })();
+    pending.set(page, request);
+    return request;
+}
+
+function resetAppointments() {
+    pages.clear();
+    const viewport = document.getElementById('appointmentsViewport');
+    if (viewport) viewport.scrollTop = 0;
+    return loadAppointments();
+}
+
+function pagesFor(first, last) {
+    const wanted = [];
+    for (let page = Math.floor(first / PAGE_SIZE); page * PAGE_SIZE < last; page++) wanted.push(page);
+    return wanted;
+}
+
+function appointmentAt(index) {
+    const page = pages.get(Math.floor(index / PAGE_SIZE));
+    return page ? page.items[index % PAGE_SIZE] : undefined;
+}
+
+function visibleRange() {
+    const viewport = document.getElementById('appointmentsViewport');
+    if (!viewport) return [0, Math.min(total, PAGE_SIZE)];
+    const first = Math.max(0, Math.floor(viewport.scrollTop / rowHeight) - OVERSCAN);
+    const count = Math.ceil(viewport.clientHeight / rowHeight) + 2 * OVERSCAN;
+    return [first, Math.min(total, first + count)];
 }
 
 function updateCount() {
-    const count = appointments.length;
     document.getElementById('appointmentCount').textContent = 
-        `${count} appointment${count !== 1 ? 's' : ''}`;
+        `${total} appointment${total !== 1 ? 's' : ''}`;
 }
 
-function renderAppointments() {
+function scheduleRender() {
+    if (renderQueued) return;
+    renderQueued = true;
+    requestAnimationFrame(renderAppointments);
+}
+
+function ensureTable() {
     const container = document.getElementById('appointmentsTable');
-    
-    if (appointments.length === 0) {
-        container.innerHTML = `
-            <div class="empty-state">
-                <svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke="currentColor">
-                    <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M9 5H7a2 2 0 00-2 2v12a2 2 0 002 2h10a2 2 0 002-2V7a2 2 0 00-2-2h-2M9 5a2 2 0 002 2h2a2 2 0 002-2M9 5a2 2 0 012-2h2a2 2 0 012 2" />
-                </svg>
-                <h3>No Unconfirmed Appointments</h3>
-                <p>Upload a Practice Fusion PDF to get started</p>
+    if (document.getElementById('appointmentsViewport')) return;
+    container.innerHTML = `
+        <div class="empty-state" id="appointmentsEmpty">
+            <svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke="currentColor">
+                <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M9 5H7a2 2 0 00-2 2v12a2 2 0 002 2h10a2 2 0 002-2V7a2 2 0 00-2-2h-2M9 5a2 2 0 002 2h2a2 2 0 002-2M9 5a2 2 0 012-2h2a2 2 0 012 2" />
+            </svg>
+            <h3>No Unconfirmed Appointments</h3>
+            <p>Upload a Practice Fusion PDF to get started</p>
+        </div>
+        <div id="appointmentsList" style="display:none;">
+            <div class="table-viewport" id="appointmentsViewport">
+                <table>
+                    <thead>
+                        <tr>
+                            <th><input type="checkbox" id="selectAll" /></th>
+                            <th>Patient</th>
+                            <th>Phone</th>
+                            <th>Date</th>
+                            <th>Time</th>
+                            <th>Provider</th>
+                            <th>Type</th>
+                            <th>Status</th>
+                            <th>Outcome</th>
+                            <th>Actions</th>
+                        </tr>
+                    </thead>
+                    <tbody id="appointmentsBody">
+                        <tr class="spacer"><td colspan="${COLUMNS}"></td></tr>
+                        <tr class="spacer"><td colspan="${COLUMNS}"></td></tr>
+                    </tbody>
+                </table>
+            </div>
+            <div style="margin-top:12px; display:flex; gap:10px; align-items:center;">
+                <button id="callSelectedBtn" disabled>Call Selected</button>
+                <button id="cancelBatchBtn">Cancel Batch</button>
+                <span id="batchStatus" style="font-size:12px;color:#555;"></span>
             </div>
-        `;
-        return;
-    }
-    
-    const table = `
-        <table>
-            <thead>
-                <tr>
-                    <th><input type="checkbox" id="selectAll" /></th>
-                    <th>Patient</th>
-                    <th>Phone</th>
-                    <th>Date</th>
-                    <th>Time</th>
-                    <th>Provider</th>
-                    <th>Type</th>
-                    <th>Status</th>
-                    <th>Outcome</th>
-                    <th>Actions</th>
-                </tr>
-            </thead>
-            <tbody>
-                ${appointments.map(apt => `
-                    <tr>
-                        <td><input type="checkbox" class="rowSelect" data-id="${apt.id}" ${selectedIds.has(apt.id) ? 'checked' : ''} /></td>
-                        <td>${escapeHtml(apt.patient_name)}</td>
-                        <td>${apt.phone}</td>
-                        <td>${apt.appointment_date || 'Not set'}</td>
-                        <td>${apt.appointment_time}</td>
-                        <td>${apt.provider}</td>
-                        <td>${apt.appointment_type}</td>
-                        <td>
-                            <span class="status-badge status-${apt.status.toLowerCase().replace(/\s+/g, '-')}">
-                                ${apt.status}
-                            </span>
-                        </td>
-                        <td>
-                            ${renderOutcome(apt)}
-                        </td>
-                        <td>
-                            ${renderActions(apt)}
-                        </td>
-                    </tr>
-                `).join('')}
-            </tbody>
-        </table>
-        <div style="margin-top:12px; display:flex; gap:10px; align-items:center;">
-            <button id="callSelectedBtn" ${selectedIds.size === 0 ? 'disabled' : ''}>Call Selected</button>
-            <button id="cancelBatchBtn">Cancel Batch</button>
-            <span id="batchStatus" style="font-size:12px;color:#555;"></span>
         </div>
     `;
-    
-    container.innerHTML = table;
-
-    // Wire selection events
-    const selectAll = document.getElementById('selectAll');
-    if (selectAll) {
-        selectAll.addEventListener('change', (e) => {
-            if (e.target.checked) {
-                appointments.forEach(a => selectedIds.add(a.id));
-            } else {
-                selectedIds.clear();
-            }
-            renderAppointments();
-        });
-    }
-    document.querySelectorAll('.rowSelect').forEach(cb => {
-        cb.addEventListener('change', (e) => {
-            const id = e.target.getAttribute('data-id');
-            if (e.target.checked) selectedIds.add(id); else selectedIds.delete(id);
-            // Update button state without full re-render
-            const btn = document.getElementById('callSelectedBtn');
-            if (btn) btn.disabled = selectedIds.size === 0;
-        });
+
+    // Wired once: rows come and go, the handlers stay on the table
+    document.getElementById('appointmentsViewport').addEventListener('scroll', scheduleRender, { passive: true });
+    document.getElementById('selectAll').addEventListener('change', async (e) => {
+        if (e.target.checked) {
+            const response = await fetch('/api/appointments/ids');
+            selectedIds = new Set(await response.json());
+        } else {
+            selectedIds.clear();
+        }
+        updateSelection();
     });
+    const tbody = document.getElementById('appointmentsBody');
+    tbody.addEventListener('change', (e) => {
+        if (!e.target.classList.contains('rowSelect')) return;
+        const id = e.target.closest('tr').dataset.id;
+        if (e.target.checked) selectedIds.add(id); else selectedIds.delete(id);
+        updateSelection();
+    });
+    tbody.addEventListener('click', (e) => {
+        const button = e.target.closest('.call-button');
+        if (button && !button.disabled) initiateCall(button.closest('tr').dataset.id);
+    });
+    document.getElementById('callSelectedBtn').addEventListener('click', startBatchCall);
+    document.getElementById('cancelBatchBtn').addEventListener('click', cancelBatchCall);
+    window.addEventListener('resize', scheduleRender);
+}
+
+function updateSelection() {
+    for (const [id, row] of rows) {
+        const checkbox = row.tr.querySelector('.rowSelect');
+        if (checkbox) checkbox.checked = selectedIds.has(id);
+    }
+    document.getElementById('selectAll').checked = total > 0 && selectedIds.size >= total;
+    document.getElementById('callSelectedBtn').disabled = selectedIds.size === 0;
+}
+
+function renderAppointments() {
+    renderQueued = false;
+    ensureTable();
+    document.getElementById('appointmentsEmpty').style.display = total === 0 ? '' : 'none';
+    document.getElementById('appointmentsList').style.display = total === 0 ? 'none' : '';
+    if (total === 0) return;
 
-    const callBtn = document.getElementById('callSelectedBtn');
-    if (callBtn) callBtn.addEventListener('click', startBatchCall);
-    const cancelBtn = document.getElementById('cancelBatchBtn');
-    if (cancelBtn) cancelBtn.addEventListener('click', cancelBatchCall);
+    const [first, last] = visibleRange();
+    for (const page of pagesFor(first, last)) {
+        const cached = pages.get(page);
+        if (!cached || cached.stale) fetchPage(page);
+    }
+
+    const tbody = document.getElementById('appointmentsBody');
+    const topSpacer = tbody.firstElementChild;
+    const bottomSpacer = tbody.lastElementChild;
+    topSpacer.firstElementChild.style.height = `${first * rowHeight}px`;
+    bottomSpacer.firstElementChild.style.height = `${(total - last) * rowHeight}px`;
+
+    // Walk the rows in view in order, reusing each appointment's <tr> and moving it only if needed
+    const placed = new Set();
+    let cursor = topSpacer.nextElementSibling;
+    for (let index = first; index < last; index++) {
+        const apt = appointmentAt(index);
+        let tr = apt ? patchRow(apt) : null;
+        if (!tr || placed.has(tr)) tr = placeholderRow();
+        placed.add(tr);
+        if (tr === cursor) {
+            cursor = cursor.nextElementSibling;
+        } else {
+            tbody.insertBefore(tr, cursor);
+        }
+    }
+    // Whatever is left scrolled out of view
+    while (cursor !== bottomSpacer) {
+        const next = cursor.nextElementSibling;
+        if (cursor.dataset.id) rows.delete(cursor.dataset.id);
+        cursor.remove();
+        cursor = next;
+    }
+
+    const sample = topSpacer.nextElementSibling;
+    if (sample && sample !== bottomSpacer) {
+        const measured = sample.getBoundingClientRect().height;
+        if (measured > 0 && Math.abs(measured - rowHeight) > 0.5) {
+            rowHeight = measured;
+            scheduleRender();
+        }
+    }
+}
+
+function patchRow(apt) {
+    const key = JSON.stringify(apt) + (callInProgress[apt.id] ? '|calling' : '');
+    let row = rows.get(apt.id);
+    if (row && row.key === key) return row.tr;
+    if (!row) {
+        const tr = document.createElement('tr');
+        tr.className = 'apt-row';
+        tr.dataset.id = apt.id;
+        row = { tr, key: null };
+        rows.set(apt.id, row);
+    }
+    row.tr.innerHTML = renderRow(apt);
+    row.key = key;
+    return row.tr;
+}
+
+function placeholderRow() {
+    const tr = document.createElement('tr');
+    tr.className = 'apt-row placeholder';
+    tr.innerHTML = `<td colspan="${COLUMNS}">Loading…</td>`;
+    return tr;
+}
+
+function renderRow(apt) {
+    return `
+        <td><input type="checkbox" class="rowSelect" ${selectedIds.has(apt.id) ? 'checked' : ''} /></td>
+        <td>${escapeHtml(apt.patient_name)}</td>
+        <td>${escapeHtml(apt.phone)}</td>
+        <td>${escapeHtml(apt.appointment_date || 'Not set')}</td>
+        <td>${escapeHtml(apt.appointment_time)}</td>
+        <td>${escapeHtml(apt.provider)}</td>
+        <td>${escapeHtml(apt.appointment_type)}</td>
+        <td>
+            <span class="status-badge status-${apt.status.toLowerCase().replace(/\s+/g, '-')}">
+                ${apt.status}
+            </span>
+        </td>
+        <td>
+            ${renderOutcome(apt)}
+        </td>
+        <td>
+            ${renderActions(apt)}
+        </td>
+    `;
 }
 
 function renderActions(apt) {
@@ -135,8 +273,7 @@ function renderActions(apt) {
     }
     
     return `
-        <button class="call-button" onclick="initiateCall('${apt.id}')" 
-                ${apt.status === 'Calling' ? 'disabled' : ''}>
+        <button class="call-button" ${apt.status === 'Calling' ? 'disabled' : ''}>
             ${apt.status === 'Calling' ? 'Calling...' : 'Call Now'}
         </button>
     `;
@@ -218,7 +355,7 @@ function renderOutcome(apt) {
 
 async function initiateCall(appointmentId) {
     callInProgress[appointmentId] = true;
-    renderAppointments();
+    scheduleRender();
     
     const override = false;
     
@@ -296,7 +433,7 @@ document.getElementById('uploadForm').addEventListener('submit', async (e) => {
         if (response.ok) {
             showMessage('uploadMessage', 'success', data.message);
             fileInput.value = '';
-            await loadAppointments();
+            await resetAppointments();
         } else {
             showMessage('uploadMessage', 'error', data.detail || 'Failed to upload PDF');
         }
@@ -0,0 +1,168 @@
+"""Hammer the Twilio webhooks from several worker processes sharing one SQLite store.
+
+Each worker builds its own app with APPOINTMENT_STORE=sqlite and plays one role
+for every appointment, in its own random order:
+
+    0  keypress 1 (confirm), signed call context
+    1  status "completed" answered by a human, half signed, half CallSid only
+    2  voice webhook by CallSid only (another worker placed the call), then "ringing"
+    3  keypress 5 (repeat) and "in-progress"
+
+Whatever the interleaving, every appointment must end up Confirmed: the
+completed callback may only move it out of Calling by compare-and-set. Each
+worker must also hear about the others' writes through the change feed.
+
+    python stress_shared_store.py [--workers 4] [--appointments 200]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.dirname(os.path.abspath(__file__))
+ENV = {
+    "APPOINTMENT_STORE": "sqlite",
+    "TWILIO_AUTH_TOKEN": "stress-test-token",
+    "BASE_URL": "https://stress.example.com",
+    "STORE_POLL_SECONDS": "0.1",
+}
+
+
+def _prepare(workdir):
+    os.chdir(workdir)
+    os.environ.update(ENV)
+    sys.path.insert(0, BACKEND)
+    logging_off()
+
+
+def logging_off():
+    import logging
+    logging.disable(logging.WARNING)
+
+
+def seed(count):
+    from models import Appointment, AppointmentStatus, appointment_store
+    ids = []
+    for i in range(count):
+        apt = Appointment(f"Patient{i} Test", f"412555{i:04d}", "9:15 AM", "Dr. Prisk", "Follow-up")
+        apt.appointment_date = "Monday, August, 11, 2025"
+        apt.status = AppointmentStatus.CALLING
+        appointment_store.add_appointment(apt)
+        appointment_store.map_call_to_appointment(f"CA{i:032d}", apt.id)
+        ids.append(apt.id)
+    return ids
+
+
+def worker(index, workdir, ids, results):
+    _prepare(workdir)
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from models import appointment_store
+    from routes import calls
+    from services.call_context import CallContext
+
+    app = FastAPI()
+    app.include_router(calls.router)
+    client = TestClient(app)
+    notified = []
+    appointment_store.add_listener(notified.append)
+
+    role = index % 4
+    order = list(enumerate(ids))
+    random.Random(index).shuffle(order)
+    latencies, errors, unresolved = [], 0, 0
+
+    def post(path, data, signed_for=None):
+        nonlocal errors
+        if signed_for is not None:
+            path = f"{path}?{CallContext([signed_for]).query()}"
+        start = time.perf_counter()
+        response = client.post(path, data=data)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            errors += 1
+        return response
+
+    for i, apt_id in order:
+        sid = f"CA{i:032d}"
+        if role == 0:
+            post("/twilio/gather", {"CallSid": sid, "Digits": "1"}, apt_id)
+        elif role == 1:
+            post("/twilio/status", {"CallSid": sid, "CallStatus": "completed", "AnsweredBy": "human"},
+                 apt_id if i % 2 == 0 else None)
+        elif role == 2:
+            response = post("/twilio/voice", {"CallSid": sid})
+            if f"Patient{i}" not in response.text:
+                unresolved += 1
+            post("/twilio/status", {"CallSid": sid, "CallStatus": "ringing"})
+        else:
+            post("/twilio/gather", {"CallSid": sid, "Digits": "5"}, apt_id)
+            post("/twilio/status", {"CallSid": sid, "CallStatus": "in-progress"})
+
+    # Let the change feed catch up with whoever finished last
+    time.sleep(0.5)
+    appointment_store.sync()
+    results.put({
+        "worker": index, "role": role, "requests": len(latencies), "errors": errors,
+        "unresolved": unresolved, "notifications": len(notified), "latencies": latencies,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--appointments", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="pow-stress-")
+    _prepare(workdir)
+    ids = seed(args.appointments)
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(i, workdir, ids, results)) for i in range(args.workers)]
+    started = time.perf_counter()
+    for proc in procs:
+        proc.start()
+    reports = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    elapsed = time.perf_counter() - started
+
+    from database import SharedAppointmentRecord, get_sync_session
+    with get_sync_session() as session:
+        statuses = {r.id: r.status for r in session.query(SharedAppointmentRecord).all()}
+    not_confirmed = [apt_id for apt_id in ids if statuses.get(apt_id) != "Confirmed"]
+
+    failures = []
+    total = 0
+    for report in sorted(reports, key=lambda r: r["worker"]):
+        lat = sorted(report["latencies"])
+        total += report["requests"]
+        p99 = lat[min(len(lat) - 1, int(len(lat) * 0.99))] * 1000
+        print(f"worker {report['worker']} role {report['role']}: {report['requests']} requests, "
+              f"p50 {statistics.median(lat) * 1000:.1f} ms, p99 {p99:.1f} ms, "
+              f"{report['errors']} errors, {report['notifications']} change notifications")
+        if report["errors"]:
+            failures.append(f"worker {report['worker']} got {report['errors']} non-200 responses")
+        if report["unresolved"]:
+            failures.append(f"worker {report['worker']} could not resolve {report['unresolved']} calls by CallSid")
+        if args.workers > 1 and not report["notifications"]:
+            failures.append(f"worker {report['worker']} never heard about another worker's change")
+    if not_confirmed:
+        failures.append(f"{len(not_confirmed)} appointments not Confirmed (lost update)")
+
+    print(f"{total} webhook requests from {args.workers} workers in {elapsed:.1f}s ({workdir})")
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+    print("OK: all appointments Confirmed, no lost updates")
+
+
+if __name__ == "__main__":
+    main()
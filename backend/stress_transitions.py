@@ -0,0 +1,134 @@
+"""Concurrency stress harness for appointment state transitions.
+
+Places a call for every appointment, then fires the webhook handlers at them
+from several threads at once, each thread in its own random order:
+
+    gather      the patient's keypress (1, 2, 3 or 9)
+    completed   the final status callback (human, machine or unknown answer)
+    progress    "ringing" / "in-progress" callbacks
+    counter     extra call_attempts increments through AppointmentStore.update
+
+and then checks that no update was lost:
+
+    - the keypress always wins, whichever order it raced the completed callback in
+    - call_attempts counts every increment
+    - each appointment's version equals the number of changes that were applied
+
+    python stress_transitions.py [--appointments 500] [--rounds 4] [--counters 2] [--store memory|sqlite]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--appointments", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=4)
+    parser.add_argument("--counters", type=int, default=2, help="threads incrementing call_attempts")
+    parser.add_argument("--store", choices=["memory", "sqlite"], default="memory")
+    args = parser.parse_args()
+
+    # The queue and store write pow_reminder.db to the working directory
+    os.chdir(tempfile.mkdtemp(prefix="pow-transitions-"))
+    os.environ["APPOINTMENT_STORE"] = args.store
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import logging
+    logging.disable(logging.WARNING)
+    # Switch threads as often as possible so the handlers really interleave
+    sys.setswitchinterval(1e-6)
+
+    from models import Appointment, AppointmentStatus, appointment_store
+    from services.twilio_client import DIGIT_STATUS, twilio_service
+
+    changes = Counter()
+    changes_lock = threading.Lock()
+
+    def count_change(apt_id):
+        with changes_lock:
+            changes[apt_id] += 1
+
+    appointment_store.add_listener(count_change)
+
+    failures = []
+    operations = 0
+    started = time.perf_counter()
+    for round_num in range(args.rounds):
+        rng = random.Random(round_num)
+        appointment_store.clear_all()
+        plan = {}
+        for i in range(args.appointments):
+            apt = Appointment(f"Patient{i} Test", f"412555{i:04d}", "9:15 AM", "Dr. Prisk", "Follow-up")
+            appointment_store.add_appointment(apt)
+            sid = f"CA{round_num:04d}{i:028d}"
+            appointment_store.map_call_to_appointment(sid, apt.id)
+            appointment_store.update(apt.id, lambda current, sid=sid: {
+                "status": AppointmentStatus.CALLING, "call_attempts": current.call_attempts + 1, "call_sid": sid
+            })
+            plan[apt.id] = (sid, rng.choice(list(DIGIT_STATUS)), rng.choice(["human", "machine_end_beep", None]))
+        baseline = {apt_id: (appointment_store.get_appointment(apt_id).version, changes[apt_id]) for apt_id in plan}
+
+        errors = []
+
+        def run(name, action, seed):
+            order = list(plan.items())
+            random.Random(seed).shuffle(order)
+            barrier.wait()
+            for apt_id, (sid, digit, answered_by) in order:
+                try:
+                    action(apt_id, sid, digit, answered_by)
+                except Exception as e:
+                    errors.append(f"{name}: {e!r}")
+
+        actions = [
+            ("gather", lambda apt_id, sid, digit, answered_by: twilio_service.handle_gather(digit, sid)),
+            ("completed", lambda apt_id, sid, digit, answered_by:
+                twilio_service.handle_status_callback(sid, "completed", answered_by)),
+            ("progress", lambda apt_id, sid, digit, answered_by: (
+                twilio_service.handle_status_callback(sid, "ringing"),
+                twilio_service.handle_status_callback(sid, "in-progress", answered_by))),
+        ]
+        for n in range(args.counters):
+            actions.append((f"counter{n}", lambda apt_id, sid, digit, answered_by: appointment_store.update(
+                apt_id, lambda current: {"call_attempts": current.call_attempts + 1})))
+
+        barrier = threading.Barrier(len(actions))
+        threads = [
+            threading.Thread(target=run, args=(name, action, round_num * 100 + n))
+            for n, (name, action) in enumerate(actions)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        operations += args.appointments * (len(actions) + 1)
+
+        failures.extend(errors[:5])
+        for apt_id, (sid, digit, answered_by) in plan.items():
+            apt = appointment_store.get_appointment(apt_id)
+            version0, changes0 = baseline[apt_id]
+            if apt.status != DIGIT_STATUS[digit]:
+                failures.append(f"{apt_id}: keypress {digit} lost, status is {apt.status.value}")
+            if apt.call_attempts != 1 + args.counters:
+                failures.append(f"{apt_id}: call_attempts {apt.call_attempts}, expected {1 + args.counters}")
+            if apt.version - version0 != changes[apt_id] - changes0:
+                failures.append(f"{apt_id}: version moved {apt.version - version0} for {changes[apt_id] - changes0} changes")
+        print(f"round {round_num + 1}/{args.rounds}: {args.appointments} appointments, "
+              f"{len(errors)} handler errors, {len(failures)} failures so far")
+
+    elapsed = time.perf_counter() - started
+    print(f"{operations} operations against the {args.store} store in {elapsed:.1f}s")
+    if failures:
+        for failure in failures[:20]:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+    print("OK: no lost updates")
+
+
+if __name__ == "__main__":
+    main()
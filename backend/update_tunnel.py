@@ -93,8 +93,8 @@ def main():
         print("\n" + "=" * 40)
         print("SUCCESS! Tunnel is running.")
         print(f"URL: {url}")
-        print("\nNOTE: You need to restart the main app for the new URL to take effect.")
-        print("Press Ctrl+C in the main app window and run start_app.bat again.")
+        print("\nThe running app picks up the new URL within a few seconds; no restart needed.")
+        print("Calls already in progress finish on the old URL.")
         print("\nKEEP THIS WINDOW OPEN while using the app!")
         print("=" * 40)
         
@@ -0,0 +1,15 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # optional: the standard library encoder gives the same JSON, only slower
+    orjson = None
+
+
+def dumps(value: Any) -> bytes:
+    """Compact JSON as bytes; enums, datetimes and str subclasses come out as their values."""
+    if orjson is not None:
+        return orjson.dumps(value, default=str)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str).encode()
+
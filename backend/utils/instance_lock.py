@@ -0,0 +1,32 @@
+import logging
+import os
+from typing import IO, Optional
+
+logger = logging.getLogger(__name__)
+
+# Held open for the life of the process; the OS drops the lock when the process exits, even on a crash
+_handle: Optional[IO] = None
+
+
+def acquire(path: str) -> bool:
+    """Take an exclusive, non-blocking lock on `path`. False if another process holds it.
+
+    Calling it again from the process that holds the lock returns True.
+    """
+    global _handle
+    if _handle is not None:
+        return True
+    handle = open(path, "a+")
+    try:
+        if os.name == "nt":
+            import msvcrt
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    _handle = handle
+    return True
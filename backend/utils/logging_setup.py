@@ -0,0 +1,216 @@
+import atexit
+import json
+import logging
+import queue
+import re
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional
+
+from services.metrics import LOG_RECORDS_DROPPED
+from settings import settings
+
+# Records waiting for the writer thread; past this they are dropped rather than block the caller
+QUEUE_SIZE = 10000
+# LOG_RATE_LIMIT counts records per call site over this many seconds
+RATE_WINDOW_SECONDS = 10.0
+# Never rate limited: one call site logs every request
+RATE_EXEMPT_LOGGERS = ("uvicorn.access",)
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# US numbers as they show up in messages and URLs: +14125550100, %2B14125550100, (412) 555-0100, 412.555.0100.
+# NANP area codes and exchanges never start with 0 or 1, which keeps epoch seconds and SIDs out.
+PHONE_PATTERN = re.compile(
+    r"(?<![\w.])(?:(?:\+|%2B)?1[\s.-]?)?\(?[2-9]\d{2}\)?[\s.-]?[2-9]\d{2}[\s.-]?\d{4}(?!\w)"
+)
+# `extra=` fields that name or reach a patient
+PHI_PHONE_FIELDS = {"phone", "caller_id", "to", "from_number"}
+PHI_NAME_FIELDS = {"patient_name"}
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "color_message"}
+
+
+def _tokenizer():
+    # The webhook journal's tokens, so a number in the logs matches the same number in a capture
+    from services.webhook_journal import webhook_journal
+    return webhook_journal.tokenizer
+
+
+def redact(text: str) -> str:
+    if not text:
+        return text
+    tokenizer = _tokenizer()
+    return PHONE_PATTERN.sub(lambda match: tokenizer.phone(match.group(0).replace("%2B", "+")), text)
+
+
+class PhiRedactionFilter(logging.Filter):
+    """Tokenizes phone numbers in messages, their arguments and tracebacks, and PHI `extra=` fields.
+
+    Runs on the writer thread, as a filter on the handlers that do the
+    writing. Names in free text cannot be recognised, so log sites refer to
+    appointments by id, not by patient.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._formatter = logging.Formatter()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # A token looks like a number itself, so a record is only redacted once
+        if getattr(record, "_redacted", False):
+            return True
+        record._redacted = True
+        if isinstance(record.msg, str):
+            record.msg = redact(record.msg)
+        if isinstance(record.args, tuple):
+            record.args = tuple(redact(arg) if isinstance(arg, str) else arg for arg in record.args)
+        elif isinstance(record.args, dict):
+            record.args = {key: redact(arg) if isinstance(arg, str) else arg for key, arg in record.args.items()}
+        if record.exc_info and not record.exc_text:
+            record.exc_text = redact(self._formatter.formatException(record.exc_info))
+        tokenizer = _tokenizer()
+        for name in PHI_PHONE_FIELDS & vars(record).keys():
+            setattr(record, name, tokenizer.phone(str(getattr(record, name))))
+        for name in PHI_NAME_FIELDS & vars(record).keys():
+            setattr(record, name, tokenizer.name(str(getattr(record, name))))
+        return True
+
+
+class CallSiteRateLimit(logging.Filter):
+    """At most LOG_RATE_LIMIT INFO-or-lower records per call site per RATE_WINDOW_SECONDS.
+
+    Runs in the logging thread, before a record is queued, so a dropped
+    record costs a dict lookup. The first record after a quiet spell says
+    how many were dropped. Warnings and errors always pass.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._lock = threading.Lock()
+        # (file, line) -> [window start, records passed, records dropped]
+        self._sites: Dict[tuple, List] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        limit = settings.LOG_RATE_LIMIT
+        if not limit or record.levelno > logging.INFO or record.name in RATE_EXEMPT_LOGGERS:
+            return True
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or record.created - site[0] >= RATE_WINDOW_SECONDS:
+                suppressed = site[2] if site else 0
+                self._sites[key] = [record.created, 1, 0]
+            elif site[1] < limit:
+                site[1] += 1
+                return True
+            else:
+                site[2] += 1
+                LOG_RECORDS_DROPPED.inc("rate_limited")
+                return False
+        if suppressed and isinstance(record.msg, str):
+            record.msg = f"{record.msg} ({suppressed} more like this suppressed)"
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the writer thread; never formats, never waits.
+
+    The record goes over as it is (same process, nothing to pickle), so
+    formatters that read `record.args`, like uvicorn's access log, still work.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc("queue_full")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, exception, and any `extra=` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info or record.exc_text:
+            entry["exc"] = record.exc_text or self.formatException(record.exc_info)
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+
+_listeners: List[QueueListener] = []
+_handlers: List[NonBlockingQueueHandler] = []
+
+
+def _via_queue(logger: logging.Logger, outputs: List[logging.Handler], rate_limit: Optional[CallSiteRateLimit]):
+    """Replace `logger`'s handlers with a queue drained by a writer thread that feeds `outputs`."""
+    redaction = PhiRedactionFilter()
+    for output in outputs:
+        output.addFilter(redaction)
+    log_queue: queue.Queue = queue.Queue(QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(log_queue)
+    if rate_limit is not None:
+        handler.addFilter(rate_limit)
+    listener = QueueListener(log_queue, *outputs, respect_handler_level=True)
+    listener.start()
+    logger.handlers = [handler]
+    _listeners.append(listener)
+    _handlers.append(handler)
+
+
+def configure_logging() -> None:
+    """Route all logging through queues to writer threads; once per process.
+
+    Request handlers and the event loop only append to a queue; the console
+    (or wherever stderr goes) is written from a background thread. LOG_FORMAT
+    is "text" (the old console format) or "json". uvicorn's own loggers are
+    moved onto queues too, keeping their format in text mode.
+    """
+    if _listeners:
+        return
+    json_output = settings.LOG_FORMAT == "json"
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if json_output else logging.Formatter(TEXT_FORMAT))
+
+    root = logging.getLogger()
+    root.setLevel(settings.LOG_LEVEL)
+    _via_queue(root, [output], CallSiteRateLimit())
+
+    for name in ("uvicorn", "uvicorn.access"):
+        server_logger = logging.getLogger(name)
+        if not server_logger.handlers:
+            continue
+        if json_output:
+            server_logger.handlers = []
+            server_logger.propagate = True
+        else:
+            _via_queue(server_logger, list(server_logger.handlers), None)
+
+    settings.add_listener(_settings_changed)
+    atexit.register(stop_logging)
+
+
+def _settings_changed(changed) -> None:
+    if "LOG_LEVEL" in changed:
+        logging.getLogger().setLevel(settings.LOG_LEVEL)
+
+
+def stop_logging() -> None:
+    """Write out whatever is still queued; runs at exit."""
+    while _listeners:
+        _listeners.pop().stop()
+
+
+def queue_depth() -> int:
+    return sum(handler.queue.qsize() for handler in _handlers)
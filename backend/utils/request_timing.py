@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from fastapi import Request
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from services.profiler import profiler
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# conn.info key for when the statement now running on a connection started
+_QUERY_STARTED = "pow.query_started"
+
+
+class RequestTiming:
+    """Where one request's time went, in seconds.
+
+    parse      FastAPI reading the body and resolving parameters
+    handler    the endpoint function (a JSONResponse it builds is rendered here too)
+    serialize  turning a returned value into the response (jsonable_encoder, render)
+    store      SQL statements run for the request, wherever they ran
+    """
+
+    __slots__ = ("started", "route_started", "route_ended", "handler_started", "handler_ended",
+                 "handler", "store", "queries", "status")
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.route_started = self.route_ended = None
+        self.handler_started = self.handler_ended = None
+        self.handler = 0.0
+        self.store = 0.0
+        self.queries = 0
+        self.status = None
+
+    def breakdown(self, total: float) -> str:
+        parts = []
+        if self.route_started is not None and self.handler_started is not None:
+            parts.append(f"parse {(self.handler_started - self.route_started) * 1000:.1f}")
+        parts.append(f"handler {self.handler * 1000:.1f} (store {self.store * 1000:.1f} in {self.queries} queries)")
+        if self.route_ended is not None and self.handler_ended is not None:
+            parts.append(f"serialize {max(0.0, self.route_ended - self.handler_ended) * 1000:.1f}")
+        if self.route_started is not None and self.route_ended is not None:
+            parts.append(f"other {max(0.0, total - (self.route_ended - self.route_started)) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+current_timing: ContextVar[Optional[RequestTiming]] = ContextVar("current_timing", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    if current_timing.get() is not None:
+        conn.info[_QUERY_STARTED] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _query_ended(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop(_QUERY_STARTED, None)
+    timing = current_timing.get()
+    if started is not None and timing is not None:
+        timing.store += time.perf_counter() - started
+        timing.queries += 1
+
+
+def _timed_call(call: Callable, target: str) -> Callable:
+    """Wrap an endpoint so its own time is kept apart from FastAPI's parsing and serialization."""
+    if asyncio.iscoroutinefunction(call):
+        async def timed(**values):
+            timing = current_timing.get()
+            if timing is not None:
+                timing.handler_started = time.perf_counter()
+            try:
+                with profiler.section(target):
+                    return await call(**values)
+            finally:
+                if timing is not None:
+                    timing.handler_ended = time.perf_counter()
+                    timing.handler += timing.handler_ended - timing.handler_started
+    else:
+        def timed(**values):
+            timing = current_timing.get()
+            if timing is not None:
+                timing.handler_started = time.perf_counter()
+            try:
+                with profiler.section(target):
+                    return call(**values)
+            finally:
+                if timing is not None:
+                    timing.handler_ended = time.perf_counter()
+                    timing.handler += timing.handler_ended - timing.handler_started
+    return timed
+
+
+class TimedRoute(APIRoute):
+    """Route that records its parse/handler/serialize split for RequestTimingMiddleware,
+    and can be cProfiled by path from /api/admin/profile."""
+
+    def get_route_handler(self) -> Callable:
+        # FastAPI checks whether dependant.call is a coroutine here, so wrap it first
+        if not getattr(self.dependant.call, "_timed", False):
+            self.dependant.call = _timed_call(self.dependant.call, self.path)
+            self.dependant.call._timed = True
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request):
+            timing = current_timing.get()
+            if timing is not None:
+                timing.route_started = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                if timing is not None:
+                    timing.route_ended = time.perf_counter()
+
+        return route_handler
+
+
+class RequestTimingMiddleware:
+    """Logs requests slower than SLOW_REQUEST_MS with where their time went.
+
+    The timing rides in a context variable, so the route, the endpoint and
+    SQLAlchemy's cursor events (in this task or a thread it hands work to)
+    all add to the same request's numbers. Costs a few clock reads per request.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+        self.slow = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        token = current_timing.set(timing)
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                timing.status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            current_timing.reset(token)
+            total = time.perf_counter() - timing.started
+            threshold = settings.SLOW_REQUEST_MS
+            if threshold and total * 1000 >= threshold:
+                self.slow += 1
+                logger.warning(
+                    f"Slow request: {scope['method']} {scope['path']} {timing.status or 'no response'} "
+                    f"in {total * 1000:.1f} ms: {timing.breakdown(total)}"
+                )
@@ -1,33 +1,213 @@
-from twilio.request_validator import RequestValidator
-from fastapi import Request, HTTPException, Depends
-from settings import settings
+import base64
+import hashlib
+import hmac
 import logging
+import time
+from typing import Callable, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from fastapi import Request
+from starlette.datastructures import FormData
+from starlette.responses import JSONResponse
+
+from services.call_context import request_base_url
+from services.metrics import WEBHOOK_SECONDS
+from settings import settings
+from utils.request_timing import TimedRoute
 
 logger = logging.getLogger(__name__)
 
-validator = RequestValidator(settings.TWILIO_AUTH_TOKEN)
+# Where the middleware leaves the parsed form for TwilioRoute handlers
+FORM_SCOPE_KEY = "twilio.form"
+
+
+class SignatureValidator:
+    """X-Twilio-Signature check with the HMAC key schedule computed once per auth token.
+
+    Twilio signs the URL it requested followed by every POST parameter name
+    and value, sorted, with HMAC-SHA1. Copying a keyed HMAC skips rehashing
+    the key pads on every request, and the comparison is constant time.
+    """
+
+    def __init__(self, token: str) -> None:
+        self.token = token
+        self._mac = hmac.new(token.encode(), digestmod=hashlib.sha1)
+
+    def compute(self, url: str, params: Iterable[Tuple[str, str]]) -> bytes:
+        mac = self._mac.copy()
+        mac.update(url.encode())
+        for name, value in sorted(set(params)):
+            mac.update(name.encode())
+            mac.update(value.encode())
+        return base64.b64encode(mac.digest())
+
+    def match(self, urls: Iterable[str], params: List[Tuple[str, str]], signature: str) -> Optional[str]:
+        """The URL the signature was made for, or None."""
+        try:
+            expected = signature.encode("ascii")
+        except UnicodeEncodeError:
+            return None
+        return next((url for url in urls if hmac.compare_digest(self.compute(url, params), expected)), None)
+
+    def valid(self, urls: Iterable[str], params: List[Tuple[str, str]], signature: str) -> bool:
+        return self.match(urls, params, signature) is not None
 
-async def validate_twilio_request(request: Request):
-    """Validate that the request is actually from Twilio"""
-    
-    # For local testing without validation
-    if "localhost" in settings.BASE_URL or "192.168" in settings.BASE_URL:
+
+_validator: Optional[SignatureValidator] = None
+
+
+def get_validator() -> SignatureValidator:
+    """Validator for the current auth token, rebuilt only when the token changes."""
+    global _validator
+    if _validator is None or _validator.token != settings.TWILIO_AUTH_TOKEN:
+        _validator = SignatureValidator(settings.TWILIO_AUTH_TOKEN)
+    return _validator
+
+
+def signatures_required() -> bool:
+    mode = settings.TWILIO_VALIDATE_SIGNATURES
+    if mode == "false" or not settings.TWILIO_AUTH_TOKEN:
+        return False
+    if mode == "true":
         return True
-    
-    signature = request.headers.get("X-Twilio-Signature", "")
-    url = str(request.url)
-    
-    # Get the raw form data
-    body = await request.body()
-    form_data = {}
-    if body:
-        for item in body.decode().split('&'):
-            if '=' in item:
-                key, value = item.split('=', 1)
-                form_data[key] = value
-    
-    if not validator.validate(url, form_data, signature):
-        logger.warning(f"Invalid Twilio signature from {request.client.host}")
-        raise HTTPException(status_code=403, detail="Invalid request signature")
-    
-    return True
\ No newline at end of file
+    # auto: Twilio cannot reach a local BASE_URL, so requests there are local testing
+    return not any(local in settings.BASE_URL for local in ("localhost", "127.0.0.1", "192.168."))
+
+
+def candidate_urls(scope) -> List[str]:
+    """URLs Twilio may have signed: BASE_URL first (what we hand Twilio), then earlier
+    BASE_URLs still in use by older calls, then the URL as received.
+
+    Twilio signs some URLs with an explicit port and some without, so both forms are tried.
+    """
+    query = scope.get("query_string", b"").decode("latin-1")
+    # Some servers leave the query on raw_path
+    path = (scope.get("raw_path") or scope["path"].encode()).split(b"?", 1)[0].decode("latin-1")
+    suffix = path + (f"?{query}" if query else "")
+    headers = dict(scope.get("headers", []))
+    scheme = headers.get(b"x-forwarded-proto", scope.get("scheme", "http").encode()).decode("latin-1").split(",")[0]
+    host = headers.get(b"x-forwarded-host", headers.get(b"host", b"")).decode("latin-1").split(",")[0]
+    urls = []
+    for base in [url.rstrip("/") for url in settings.base_urls()] + [f"{scheme}://{host}" if host else ""]:
+        if not base:
+            continue
+        scheme_part, _, netloc = base.partition("://")
+        hostname, _, port = netloc.partition(":")
+        default_port = "443" if scheme_part == "https" else "80"
+        for variant in (base, f"{scheme_part}://{hostname}", f"{scheme_part}://{hostname}:{port or default_port}"):
+            url = variant + suffix
+            if url not in urls:
+                urls.append(url)
+    return urls
+
+
+def _base_for(url: Optional[str]) -> Optional[str]:
+    """Which of our BASE_URLs `url` (or a bare host) points at."""
+    if not url:
+        return None
+    hostname = urlsplit(url if "://" in url else f"//{url}").hostname
+    return next((base for base in settings.base_urls() if urlsplit(base).hostname == hostname), None)
+
+
+# Paths Twilio posts to; everything else on the calls router is the dashboard's /api
+WEBHOOK_PREFIX = "/twilio/"
+
+
+class TwilioSignatureMiddleware:
+    """Rejects /twilio/ POSTs without a valid X-Twilio-Signature.
+
+    The form body is read and parsed here once; the parsed FormData rides
+    along in the ASGI scope, where TwilioRoute hands it to FastAPI's Form
+    parameters instead of parsing the body again. The raw body is still
+    passed on, for any other reader. The BASE_URL the webhook was sent to
+    is kept for the request, so the URLs in its reply stay on that base.
+    """
+
+    def __init__(self, app, prefix: str = WEBHOOK_PREFIX) -> None:
+        self.app = app
+        self.prefix = prefix
+        self.rejected = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        chunks = []
+        more = True
+        while more:
+            message = await receive()
+            if message["type"] != "http.request":
+                await self.app(scope, receive, send)  # client went away; let the app see it
+                return
+            chunks.append(message.get("body", b""))
+            more = message.get("more_body", False)
+        body = b"".join(chunks)
+
+        headers = dict(scope.get("headers", []))
+        urlencoded = headers.get(b"content-type", b"").split(b";")[0].strip() == b"application/x-www-form-urlencoded"
+        pairs = parse_qsl(body.decode("utf-8", "replace"), keep_blank_values=True) if urlencoded else []
+
+        if signatures_required():
+            signature = headers.get(b"x-twilio-signature", b"").decode("latin-1")
+            signed_url = get_validator().match(candidate_urls(scope), pairs, signature) if signature else None
+            if signed_url is None:
+                self.rejected += 1
+                client = scope.get("client") or ("unknown",)
+                logger.warning(f"Rejected {scope['path']} from {client[0]}: invalid Twilio signature")
+                await JSONResponse({"detail": "Invalid request signature"}, status_code=403)(scope, receive, send)
+                return
+            base = _base_for(signed_url)
+        else:
+            host = headers.get(b"x-forwarded-host", headers.get(b"host", b"")).decode("latin-1").split(",")[0]
+            base = _base_for(host)
+
+        if urlencoded:
+            scope[FORM_SCOPE_KEY] = FormData(pairs)
+        sent = False
+
+        async def replay_receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        # A call placed before BASE_URL changed keeps getting URLs on the base it was given
+        token = request_base_url.set(base)
+        try:
+            await self.app(scope, replay_receive, send)
+        finally:
+            request_base_url.reset(token)
+
+
+class TwilioRequest(Request):
+    """Request whose form() returns the one TwilioSignatureMiddleware already parsed."""
+
+    async def _get_form(self, **kwargs) -> FormData:
+        if self._form is None and FORM_SCOPE_KEY in self.scope:
+            self._form = self.scope[FORM_SCOPE_KEY]
+        return await super()._get_form(**kwargs)
+
+
+class TwilioRoute(TimedRoute):
+    """Route that reuses the middleware's parsed form and times the handler per route.
+
+    Only /twilio/ webhooks go into WEBHOOK_SECONDS; the router's /api routes
+    behave as a plain TimedRoute.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        path = self.path
+        if not path.startswith(WEBHOOK_PREFIX):
+            return handler
+
+        async def route_handler(request: Request):
+            started = time.perf_counter()
+            try:
+                return await handler(TwilioRequest(request.scope, request.receive))
+            finally:
+                WEBHOOK_SECONDS.observe(time.perf_counter() - started, path)
+
+        return route_handler
@@ -21,10 +21,10 @@ echo ========================================
 echo Application will be available at:
 echo http://localhost:800
 echo.
-echo Press Ctrl+C to stop the server
+echo Press Ctrl+C to stop the server ^(it first waits for calls in progress; press again to stop at once^)
 echo ========================================
 echo.
 
-uvicorn main:app --host 0.0.0.0 --port 800 --reload
+python serve.py --host 0.0.0.0 --port 800
 
 pause
\ No newline at end of file